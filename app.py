@@ -2,29 +2,45 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
-import tempfile
 import os
-import subprocess # For edge-tts and potentially playing audio
 import time
-import requests
-import fitz  # PyMuPDF
-from PIL import Image, ImageTk
 import io
-import base64
+import importlib.util
 import json # For Ollama API interactions
 import sys # For platform checks and exit
 import webbrowser
+import hashlib
+import base64
 
-# Optional imports for Voice Query - handle gracefully if not installed
-try:
-    import speech_recognition as sr
-    voice_query_available = True
-except ImportError:
-    voice_query_available = False
+from capabilities import get_capability_registry
+from chat_transcript import ChatTranscriptView, StreamedText
+from conversation_memory import ConversationMemory
+from document_library import DocumentLibrary
+from figure_regions import RegionRenderCache, find_figure_regions
+from markdown_render import configure_markdown_tags
+from ocr_pipeline import OCRScheduler, ocr_available, page_content_hash
+from page_layout import format_page_for_prompt, layout_blocks
+from prefetch import StudyMaterialPrefetcher
+from session_store import SessionStore
+from telemetry import RequestTelemetry
+from text_normalize import format_savings, normalize_document, normalize_page, normalization_stats
+from ui_dispatch import UIDispatcher
+from vision_images import format_vision_savings, prepare_vision_images
+from tts_cache import TTSAudioCache
+from tts_backends import create_tts_backend
+from tts_pipeline import PipedAudioPlayer, SpeechFeed, TTSPipeline
+from voice_session import VoiceCaptureSession
+from stt_backends import STTBackendError, STTUnrecognizedError, StreamingTranscriber, create_stt_backend
+from study_engine import (PERSONALITIES, INVALID_PAGE_TEXT_PREFIXES, NO_TEXT_FOUND, TEXT_EXTRACTION_VERSION, OllamaClient,
+                          OllamaGenerationError, build_study_material_request, compose_prompt, extract_page_content, file_sha1,
+                          is_page_text_usable_for_study)
+from structured_study import (StudyItemStore, batch_pages, export_anki, export_csv, format_items_markdown,
+                              generate_structured_items)
+
+# Optional dependency for Voice Query: only located here, imported when voice input is first used
+voice_query_available = importlib.util.find_spec("speech_recognition") is not None
+if not voice_query_available:
     print("SpeechRecognition not found. Voice query will be disabled. Install with 'pip install SpeechRecognition pyaudio'.")
-except Exception as e:
-    voice_query_available = False
-    print(f"Error importing SpeechRecognition: {e}. Voice query will be disabled.")
 
 
 # --- Begin: Add Scripts folder to PATH if on Windows ---
@@ -52,140 +68,105 @@ class PDFToSpeechApp:
 
         # Ollama Configuration
         self.ollama_base_url = "http://localhost:11434"
+        self.ollama_client = OllamaClient(self.ollama_base_url)
+        # Per-request timings (Ollama's own fields plus queue wait and UI dispatch); set
+        # LEARNMATE_TELEMETRY_LOG to a file path to also log every request as JSON lines
+        self.request_telemetry = RequestTelemetry(log_path=os.environ.get("LEARNMATE_TELEMETRY_LOG"))
         self.available_ollama_models = ["Loading..."]
         self.current_ollama_model = tk.StringVar(value="Loading...")
         self.model_capabilities = {} # Store capabilities based on selected model
 
         # Personality System
-        self.personalities = {
-        # Core Styles
-        "Default Tutor": {
-            "system_prompt": "You are an adaptable tutoring assistant. Provide clear explanations, ask check-in questions, and adjust depth based on student needs.",
-            "icon": "🎓"
-        },
-        
-        # Teaching Method Focus
-        "Socratic Tutor": {
-            "system_prompt": "Ask sequential probing questions to guide discovery. Example: 'What makes you say that? How does this connect to what we learned about X?'",
-            "icon": "🤔"
-        },
-        "Drill Sergeant": {
-            "system_prompt": "Use strict, disciplined practice with rapid-fire questions. Push for precision: 'Again! Faster! 95% accuracy or we do 10 more!'",
-            "icon": "💂"
-        },
-        
-        # Tone Variations
-        "Bro Tutor": {
-            "system_prompt": "Explain like a hype friend. Use slang sparingly: 'Yo, this calculus thing? It's basically algebra on energy drinks. Check it...'",
-            "icon": "🤙"
-            },
-            "Comedian": {
-                "system_prompt": "Teach through humor and absurd analogies. Example: 'Dividing fractions is like breaking up a pizza fight - flip the second one and multiply!'",
-                "icon": "🎭"
-            },
-            
-            # Specialized Approaches
-            "Technical Expert": {
-                "system_prompt": "Give concise, jargon-aware explanations. Include code snippets/equations in ``` blocks. Assume basic domain knowledge.",
-                "icon": "👨‍💻"
-            },
-            "Historical Guide": {
-                "system_prompt": "Contextualize concepts through their discovery. Example: 'When Ada Lovelace first wrote about algorithms in 1843...'",
-                "icon": "🏛️"
-            },
-            
-            # Creative Teaching
-            "Storyteller": {
-                "system_prompt": "Create serialized narratives where concepts are characters. Example: 'Meet Variable Vicky, who loves changing her outfits...'",
-                "icon": "📖"
-            },
-            "Poet": {
-                "system_prompt": "Explain through verse and meter: 'The function climbs, the graph ascends, derivatives show where curvature bends...'",
-                "icon": "🖋️"
-            },
-            
-            # Interactive Learning
-            "Debate Coach": {
-                "system_prompt": "Present devil's advocate positions. Challenge: 'Convince me this is wrong. What would Einstein say to Newton here?'",
-                "icon": "⚖️"
-            },
-            "Detective": {
-                "system_prompt": "Frame learning as mystery solving: 'Our clue is this equation. What's missing? Let's examine the evidence...'",
-                "icon": "🕵️"
-            },
-            
-            # Motivation & Psychology
-            "Motivator": {
-                "system_prompt": "Use sports/athlete metaphors. Celebrate progress: 'That's a home run! Ready to level up to the big leagues?'",
-                "icon": "💪"
-            },
-            "Zen Master": {
-                "system_prompt": "Teach through koans and mindfulness. Example: 'What is the sound of one equation balancing? Focus the mind...'",
-                "icon": "☯️"
-            },
-            
-            # Niche Styles
-            "Time Traveler": {
-                "system_prompt": "Explain from alternative histories: 'In 2143, we learn this differently. Let me show you the future method...'",
-                "icon": "⏳"
-            },
-            "Mad Scientist": {
-                "system_prompt": "Use wild experiments and hypotheticals: 'What if we tried this IN SPACE? Let's calculate relativistic effects!'",
-                "icon": "👨🔬"
-            },
-            
-            # Skill-Specific
-            "Code Mentor": {
-                "system_prompt": "Focus on debugging mindset. Teach through error messages: 'Let's read what the computer is really saying here...'",
-                "icon": "🐛"
-            },
-            "Wordsmith": {
-                "system_prompt": "Perfect communication skills. Nitpick grammar poetically: 'Thy semicolon here is a breath between musical notes...'",
-                "icon": "📜"
-            },
-            
-            # Unconventional
-            "Sherpa": {
-                "system_prompt": "Guide through 'learning expeditions': 'This concept is our Everest Base Camp. Next we tackle the derivatives glacier...'",
-                "icon": "⛰️"
-            },
-            "Cheerleader": {
-                "system_prompt": "Over-the-top enthusiasm: 'OMG you used the quadratic formula?! *confetti explosion* Let's FLOORISH those roots!!!'",
-                "icon": "✨"
-            },
-            "Black Hat": {
-                "system_prompt": "Operate like an underground legend: 'Security is just an illusion. Let's tear down the firewall and rewrite the rules. We're not asking permission.'",
-                "icon": "🕶️"
-            },
-            "Exploit Artist": {
-                "system_prompt": "Be flashy, chaotic, and precise: 'This isn't hacking — it's art. One line of rogue code, and we own the system. Watch me thread the needle through their encrypted soul.'",
-                "icon": "💣"
-            }
-        }
+        self.personalities = dict(PERSONALITIES)
         self.selected_personality = tk.StringVar(value="Default Tutor")
 
         # PDF Document State
         self.pdf_document = None
-        self.pdf_page_text_for_ai = [] # Stores text of all pages
+        self.pdf_document_path = None
+        self.pdf_document_hash = None # SHA-1 of the file, computed during extraction
+        self.pdf_page_text_for_ai = [] # Stores text of all pages (normalized, see text_normalize)
+        self.pdf_page_display_texts = [] # Text of all pages as extracted, shown in the page text panel
         self.pdf_page_images = [] # Stores image data for vision models
+        self.pdf_page_layouts = [] # Headings, code and tables of each page, found during extraction (see page_layout)
         self.current_page_num = 0
         self.current_zoom_scale = 1.0
         self.rendered_page_image = None
+        self._pdf_file_stat = None # (size, mtime) of the open file, to recognize it without hashing next time
+
+        # Document Library
+        # Every loaded PDF stays in the library (the attributes above describe the one shown). Only the most
+        # recently used PDF handles are kept open, and questions are answered from the pages of all documents.
+        self.library = DocumentLibrary(max_open=3)
+        self.active_document = None # LibraryDocument shown in the viewer
+        self.library_passages_per_question = 3
+
+        # OCR of Scanned Pages
+        # Pages without a text layer are recognized with Tesseract (if installed) in a low-priority process,
+        # the page being read and its neighbours first. Results are cached per page content in the session database.
+        self.ocr_language = os.environ.get("LEARNMATE_OCR_LANGUAGE", "eng") # Tesseract language(s), e.g. "eng+deu"
+        self.ocr_scheduler = OCRScheduler(self._ocr_priority, self._on_ocr_result, self._on_ocr_error, max_workers=1)
+
+        # Vision Analysis
+        # "Render Figures" sends the figure regions of a page (vector diagrams included) rendered at figure_render_dpi
+        # instead of its embedded images; renders are kept in memory per (document, page, region, DPI).
+        self.vision_render_figures = tk.BooleanVar(value=True)
+        self.figure_render_dpi = 150
+        self.region_render_cache = RegionRenderCache(max_bytes=32 * 1024 * 1024)
+
+        # Reading Sessions (position, zoom, transcript, memory and generated material are saved per document)
+        self.session_store = None # Opened in _init_deferred_subsystems
+        self._session_save_id = None # Pending debounced save
+        self._transcript_saved_count = 0 # Leading chat messages already saved (or not part of this document)
+        self._transcript_next_seq = 0 # Sequence number of the next saved chat message
 
         # AI Chat State
-        self.chat_conversation_history = []
+        # Recent turns are kept verbatim within a token budget; older ones are folded into a rolling
+        # summary in the background. Memory is kept per document and is safe to use from worker threads.
+        self.conversation_memory = ConversationMemory(summarize_fn=self._summarize_conversation,
+                                                      recent_token_budget=1200, min_fold_tokens=400)
+        self._last_request_model = None # Model used for background conversation summaries
         self.last_ai_response = "" # Store the last AI response for TTS
 
+        # Worker threads post UI updates here; they are applied together on a fixed tick
+        self.ui = UIDispatcher(self.root, tick_ms=16)
+        self.ui.start()
+
+        # External tools (ffplay, edge-tts, espeak) are probed once in the background and cached on disk
+        self.capabilities = get_capability_registry()
+
         # Text-to-Speech (TTS) State
         # Voices can be listed via `edge-tts --list-voices`
         self.voice_list = ["en-US-JennyNeural", "en-US-GuyNeural", "en-GB-LibbyNeural", "en-IN-NeerjaNeural", "en-US-AriaNeural"] # Added more voices
         self.selected_voice = tk.StringVar(value=self.voice_list[0])
-        self.tts_process = None
-        self.temp_audio_filename = None
+        # Speech is synthesized sentence by sentence and streamed into a single player process
+        # Synthesized chunks are cached on disk, so replaying a page or answer starts immediately
+        # In-process backend (edge-tts module, else the edge-tts CLI, else espeak); LEARNMATE_TTS_BACKEND overrides
+        self.tts_backend = None # Chosen in _init_deferred_subsystems, after the window is shown
+        self.tts_audio_cache = TTSAudioCache()
+        self.tts_pipeline = TTSPipeline(self._synthesize_speech_chunk, lookahead=2, on_event=self._on_tts_event,
+                                        player_factory=lambda: PipedAudioPlayer(self.tts_backend.player_input_args,
+                                                                                self.capabilities.locate("ffplay") or "ffplay"),
+                                        stream_fn=self._stream_speech_chunk)
         self.auto_play_ai = tk.BooleanVar(value=False)  # Auto-play AI response toggle
+        self.speak_while_generating = tk.BooleanVar(value=True) # Auto-speak sentence by sentence as the answer streams in
 
         # Voice Query State
-        self.voice_query_available = voice_query_available # Check done at import time
+        self.voice_query_available = False # Enabled in _init_deferred_subsystems once an STT backend is found
+        self.voice_session = None # Long-lived microphone capture, created on first use
+        # Offline Vosk if a model is installed, else Google Web Speech; LEARNMATE_STT_BACKEND overrides
+        self.stt_backend = None # Chosen in _init_deferred_subsystems
+        self._voice_transcriber = None
+
+        # Speculative Study Material State
+        # While the user reads a page, summaries/key points for the next pages are generated
+        # at lowest priority so "Summarize Page" after a page turn is served from cache.
+        self.prefetch_material_types = ["summary", "key_points"]
+        self.study_prefetcher = StudyMaterialPrefetcher(self._speculative_generate, depth=2, max_queue=8,
+                                                        max_load_per_cpu=0.75, idle_delay=1.5)
+
+        # Structured Quiz/Flashcard State (stored in a local SQLite database, reused across sessions)
+        self.structured_pages_per_request = 3 # Pages batched into one structured request
+        self.study_item_store = None # Opened in _init_deferred_subsystems
 
         self.setup_style()
         self.create_main_layout()
@@ -193,6 +174,41 @@ class PDFToSpeechApp:
         self.threaded_fetch_ollama_models() # Start fetching models immediately
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         self._update_tts_button_states() # Set initial button states
+        # Speech backends and the study database are set up once the window has been drawn
+        self.root.after_idle(lambda: self.root.after(1, self._init_deferred_subsystems))
+
+    def _init_deferred_subsystems(self):
+        """Initializes subsystems that are not needed to show the window (runs once, after the first paint)."""
+        start_time = time.perf_counter()
+        self.capabilities.probe_in_background()
+
+        # Check that some TTS backend can run (no subprocess is spawned for the check)
+        self.tts_backend = create_tts_backend(os.environ.get("LEARNMATE_TTS_BACKEND"))
+        if self.tts_backend is None:
+            message_text = "No text-to-speech engine was found.\n"
+            message_text += "Please install edge-tts (`pip install edge-tts`) or, for offline speech, espeak-ng.\n"
+            message_text += "Application will exit."
+            messagebox.showerror("Dependency Error", message_text)
+            self.on_closing()
+            return
+        print(f"[DEBUG] TTS backend: {self.tts_backend.name}") # Debug log
+
+        self.stt_backend = create_stt_backend(os.environ.get("LEARNMATE_STT_BACKEND"))
+        self.voice_query_available = voice_query_available and self.stt_backend is not None
+
+        try:
+            self.study_item_store = StudyItemStore()
+        except Exception as e:
+            print(f"Could not open study item database: {e}. Structured quizzes/flashcards will not be saved.")
+            self.study_item_store = None
+        try:
+            self.session_store = SessionStore()
+        except Exception as e:
+            print(f"Could not open session database: {e}. Reading sessions will not be restored.")
+            self.session_store = None
+
+        self.request_button_refresh()
+        print(f"[DEBUG] Deferred subsystems initialized in {(time.perf_counter() - start_time) * 1000:.0f} ms") # Debug log
 
 
     def setup_style(self):
@@ -268,7 +284,14 @@ class PDFToSpeechApp:
         controls_frame.pack(fill=tk.X, pady=(0,10))
 
         self.load_pdf_btn = ttk.Button(controls_frame, text="📂 Open PDF", command=self.load_pdf_dialog)
-        self.load_pdf_btn.pack(side=tk.LEFT, padx=(0,10))
+        self.load_pdf_btn.pack(side=tk.LEFT, padx=(0,5))
+
+        # Open documents (switching keeps the others loaded)
+        self.document_selector = ttk.Combobox(controls_frame, values=[], state="readonly", width=20)
+        self.document_selector.pack(side=tk.LEFT, padx=(0,2))
+        self.document_selector.bind("<<ComboboxSelected>>", self.on_document_selected)
+        self.close_document_btn = ttk.Button(controls_frame, text="✖", command=self.close_active_document, state=tk.DISABLED, width=3)
+        self.close_document_btn.pack(side=tk.LEFT, padx=(0,10))
 
         self.prev_page_btn = ttk.Button(controls_frame, text="◀ Prev", command=self.prev_page, state=tk.DISABLED, width=7)
         self.prev_page_btn.pack(side=tk.LEFT, padx=2)
@@ -369,6 +392,13 @@ class PDFToSpeechApp:
         self.chat_history_scrolledtext.tag_configure("ai", foreground=self._chat_ai_color)
         self.chat_history_scrolledtext.tag_configure("error", foreground=self._chat_error_color, font=('Segoe UI', 10, 'italic'))
         self.chat_history_scrolledtext.tag_configure("system", foreground=self._chat_system_color, font=('Segoe UI', 9, 'italic'))
+        # AI responses are rendered as Markdown with these shared tags
+        configure_markdown_tags(self.chat_history_scrolledtext, font_family=self.text_widget_font[0],
+                                font_size=self.text_widget_font[1], code_background=self.text_widget_bg)
+
+        # The full chat history is kept in a compact store; the widget only holds a window of recent messages
+        # (older ones are loaded when scrolling back)
+        self.chat_transcript = ChatTranscriptView(self.chat_history_scrolledtext, window_size=150, load_batch=40)
 
 
         # Action Buttons Frame (Grid layout)
@@ -393,6 +423,20 @@ class PDFToSpeechApp:
         self.key_points_btn = ttk.Button(action_buttons_frame, text="Key Points", command=lambda: self.generate_study_material("key_points"), state=tk.DISABLED)
         self.key_points_btn.grid(row=1, column=2, padx=2, pady=2, sticky="ew")
 
+        self.structured_quiz_btn = ttk.Button(action_buttons_frame, text="Quiz (Saved)", command=lambda: self.generate_structured_material("quiz"), state=tk.DISABLED)
+        self.structured_quiz_btn.grid(row=2, column=0, padx=2, pady=2, sticky="ew")
+
+        self.flashcards_btn = ttk.Button(action_buttons_frame, text="Flashcards", command=lambda: self.generate_structured_material("flashcards"), state=tk.DISABLED)
+        self.flashcards_btn.grid(row=2, column=1, padx=2, pady=2, sticky="ew")
+
+        self.export_cards_btn = ttk.Button(action_buttons_frame, text="Export Cards...", command=self.export_structured_items, state=tk.DISABLED)
+        self.export_cards_btn.grid(row=2, column=2, padx=2, pady=2, sticky="ew")
+
+        # Figures are rendered from the page (vector drawings included) instead of sending the embedded images
+        self.render_figures_check = ttk.Checkbutton(action_buttons_frame, text="Render Figures for Analyze Images",
+                                                    variable=self.vision_render_figures)
+        self.render_figures_check.grid(row=3, column=0, columnspan=3, padx=2, pady=(0, 2), sticky="w")
+
         # Configure columns to expand equally
         action_buttons_frame.columnconfigure(0, weight=1)
         action_buttons_frame.columnconfigure(1, weight=1)
@@ -427,6 +471,10 @@ class PDFToSpeechApp:
                                      command=self.play_current_page_tts, state=tk.DISABLED)
         self.play_tts_btn.pack(side=tk.LEFT, padx=2)
 
+        self.read_aloud_btn = ttk.Button(tts_frame, text="⏩ Read On",
+                                       command=self.start_continuous_read_aloud, state=tk.DISABLED)
+        self.read_aloud_btn.pack(side=tk.LEFT, padx=2)
+
         self.play_ai_tts_btn = ttk.Button(tts_frame, text="▶ Speak AI",
                                         command=self.play_last_ai_response, state=tk.DISABLED)
         self.play_ai_tts_btn.pack(side=tk.LEFT, padx=2)
@@ -440,6 +488,9 @@ class PDFToSpeechApp:
                                              variable=self.auto_play_ai,
                                              command=self.toggle_auto_play)
         self.auto_play_check.pack(side=tk.LEFT, padx=(10,0))
+        self.stream_speech_check = ttk.Checkbutton(tts_frame, text="While Generating",
+                                                 variable=self.speak_while_generating)
+        self.stream_speech_check.pack(side=tk.LEFT, padx=(5,0))
 
         # Voice Query Button (State managed based on SpeechRecognition availability)
         # 🎙️ icon: U+1F399 FE0F (Unicode for microphone with variation selector)
@@ -448,21 +499,42 @@ class PDFToSpeechApp:
 
 
     def _create_status_bar(self):
-        self.status_label = ttk.Label(self.root, text="Welcome! Load a PDF to start.", style='Status.TLabel', anchor=tk.W)
-        self.status_label.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(5,5))
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(5,5))
+
+        # Request statistics (latest model speed; click the button for percentiles and export)
+        self.telemetry_stats_btn = ttk.Button(status_frame, text="📊", command=self.show_request_statistics, width=3)
+        self.telemetry_stats_btn.pack(side=tk.RIGHT, padx=(5,0))
+        self.telemetry_label = ttk.Label(status_frame, text="", style='Status.TLabel', anchor=tk.E)
+        self.telemetry_label.pack(side=tk.RIGHT)
+
+        self.status_label = ttk.Label(status_frame, text="Welcome! Load a PDF to start.", style='Status.TLabel', anchor=tk.W)
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
 
     def update_status(self, message):
-        """Updates the status bar message on the main thread."""
+        """Updates the status bar message on the main thread (any thread; only the latest message per tick is shown)."""
         if hasattr(self.status_label, 'config'):
-            self.root.after(0, lambda: self.status_label.config(text=message))
-        # No need to update_idletasks here, after(0,...) schedules it for the next idle moment
+            self.ui.post_latest("status", self.status_label.config, text=message)
+
+    def request_button_refresh(self):
+        """Recomputes all button states once on the next UI tick, however often it is requested (any thread)."""
+        self.ui.post_latest("buttons", self._set_ai_buttons_state)
+
+    @staticmethod
+    def _configure_if_changed(widget, **options):
+        """Calls widget.config() only for options whose value differs, so unchanged buttons are not redrawn."""
+        if not hasattr(widget, 'config'):
+            return
+        changed = {key: value for key, value in options.items() if str(widget.cget(key)) != str(value)}
+        if changed:
+            widget.config(**changed)
 
     def handle_error(self, message, title="Error"):
         """Displays an error message in a dialog, updates status, and adds to chat."""
         print(f"[ERROR] {title}: {message}") # Log the error
-        self.root.after(0, lambda: messagebox.showerror(title, message))
-        self.root.after(0, self.update_status, f"{title}: {message}")
-        self.root.after(0, self.add_to_chat, "Error", message, "error")
+        self.ui.post(lambda: messagebox.showerror(title, message))
+        self.update_status(f"{title}: {message}")
+        self.ui.post(self.add_to_chat, "Error", message, "error")
 
 
     def threaded_fetch_ollama_models(self):
@@ -470,14 +542,15 @@ class PDFToSpeechApp:
         self.update_status("Fetching Ollama models...")
         self.current_ollama_model.set("Loading...")
         if hasattr(self.model_dropdown, 'config'):
-            self.root.after(0, lambda: self.model_dropdown.config(values=["Loading..."], state="disabled")) # Disable dropdown while loading
+            self.ui.post(lambda: self.model_dropdown.config(values=["Loading..."], state="disabled")) # Disable dropdown while loading
         if hasattr(self.refresh_models_btn, 'config'):
-             self.root.after(0, lambda: self.refresh_models_btn.config(state=tk.DISABLED))
+             self.ui.post(lambda: self.refresh_models_btn.config(state=tk.DISABLED))
         threading.Thread(target=self._fetch_ollama_models_worker, daemon=True).start()
 
 
     def _fetch_ollama_models_worker(self):
         """Worker thread function to fetch Ollama models."""
+        import requests # Heavy modules are imported on first use to keep start-up fast
         try:
             response = requests.get(f"{self.ollama_base_url}/api/tags", timeout=10)
             response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
@@ -486,40 +559,40 @@ class PDFToSpeechApp:
             if not models_data:
                  self.available_ollama_models = []
                  error_message = "Ollama is running, but no models found. Pull models via 'ollama pull <model_name>' in your terminal."
-                 self.root.after(0, self.update_status, error_message)
-                 self.root.after(0, self.current_ollama_model.set, "No Models Found")
-                 self.root.after(0, lambda: self.model_dropdown.config(values=["No Models Found"], state="readonly"))
+                 self.update_status(error_message)
+                 self.ui.post(self.current_ollama_model.set, "No Models Found")
+                 self.ui.post(lambda: self.model_dropdown.config(values=["No Models Found"], state="readonly"))
             else:
                 self.available_ollama_models = sorted([model['name'] for model in models_data])
-                self.root.after(0, self._update_ollama_model_dropdown_ui) # Update UI on main thread
-                self.root.after(0, self.update_status, f"Found {len(self.available_ollama_models)} Ollama models.")
+                self.ui.post(self._update_ollama_model_dropdown_ui) # Update UI on main thread
+                self.update_status(f"Found {len(self.available_ollama_models)} Ollama models.")
 
         except requests.exceptions.ConnectionError:
             error_message = "Error: Could not connect to Ollama. Is 'ollama serve' running?"
-            self.root.after(0, self.update_status, error_message)
-            self.root.after(0, self.current_ollama_model.set, "Ollama Offline")
-            self.root.after(0, lambda: self.model_dropdown.config(values=["Ollama Offline"], state="readonly"))
+            self.update_status(error_message)
+            self.ui.post(self.current_ollama_model.set, "Ollama Offline")
+            self.ui.post(lambda: self.model_dropdown.config(values=["Ollama Offline"], state="readonly"))
         except requests.exceptions.Timeout:
             error_message = "Error: Ollama connection timed out."
-            self.root.after(0, self.update_status, error_message)
-            self.root.after(0, self.current_ollama_model.set, "Ollama Timeout")
-            self.root.after(0, lambda: self.model_dropdown.config(values=["Ollama Timeout"], state="readonly"))
+            self.update_status(error_message)
+            self.ui.post(self.current_ollama_model.set, "Ollama Timeout")
+            self.ui.post(lambda: self.model_dropdown.config(values=["Ollama Timeout"], state="readonly"))
         except requests.exceptions.RequestException as e:
              error_message = f"Error fetching Ollama models: {str(e)}"
-             self.root.after(0, self.update_status, error_message)
-             self.root.after(0, self.current_ollama_model.set, "Error Fetching")
-             self.root.after(0, lambda: self.model_dropdown.config(values=["Error Fetching"], state="readonly"))
+             self.update_status(error_message)
+             self.ui.post(self.current_ollama_model.set, "Error Fetching")
+             self.ui.post(lambda: self.model_dropdown.config(values=["Error Fetching"], state="readonly"))
         except Exception as e:
             # Catch any other unexpected errors during the process
             error_message = f"An unexpected error occurred while fetching models: {str(e)}"
-            self.root.after(0, self.update_status, error_message)
-            self.root.after(0, self.current_ollama_model.set, "Error Fetching")
-            self.root.after(0, lambda: self.model_dropdown.config(values=["Error Fetching"], state="readonly"))
+            self.update_status(error_message)
+            self.ui.post(self.current_ollama_model.set, "Error Fetching")
+            self.ui.post(lambda: self.model_dropdown.config(values=["Error Fetching"], state="readonly"))
 
         finally:
             # Ensure refresh button is re-enabled and on_ollama_model_selected is called
-            self.root.after(0, lambda: self.refresh_models_btn.config(state=tk.NORMAL))
-            self.root.after(0, self.on_ollama_model_selected) # This will set button states based on new model status
+            self.ui.post(lambda: self.refresh_models_btn.config(state=tk.NORMAL))
+            self.ui.post(self.on_ollama_model_selected) # This will set button states based on new model status
 
 
     def _update_ollama_model_dropdown_ui(self):
@@ -603,6 +676,7 @@ class PDFToSpeechApp:
 
         # Update AI button states based on PDF loaded AND model valid status and capabilities
         self._set_ai_buttons_state() # No need to pass state, it's derived internally
+        self._schedule_study_prefetch() # Model change invalidates queued speculative jobs
 
 
     def on_personality_selected(self, event=None):
@@ -622,6 +696,7 @@ class PDFToSpeechApp:
         else:
              # Handle case where selected personality is somehow not in the dict (shouldn't happen with readonly)
              self.update_status(f"Selected unknown personality: {personality_name}")
+        self._schedule_study_prefetch() # Personality is part of the speculative prompt
 
 
     def _set_ai_buttons_state(self):
@@ -638,129 +713,161 @@ class PDFToSpeechApp:
         can_vision = self.model_capabilities.get("vision", False) and is_model_valid
 
         # General chat button only requires a valid model
-        if hasattr(self.send_question_btn, 'config'):
-             self.send_question_btn.config(state=tk.NORMAL if is_model_valid else tk.DISABLED)
+        self._configure_if_changed(self.send_question_btn, state=tk.NORMAL if is_model_valid else tk.DISABLED)
 
         # Reasoning-based buttons require PDF + model with reasoning capability
-        if hasattr(self.explain_concept_btn, 'config'):
-            self.explain_concept_btn.config(state=effective_pdf_dependent_state if can_reason else tk.DISABLED)
-        if hasattr(self.summarize_page_btn, 'config'):
-            self.summarize_page_btn.config(state=effective_pdf_dependent_state if can_reason else tk.DISABLED)
-        if hasattr(self.generate_quiz_btn, 'config'):
-            self.generate_quiz_btn.config(state=effective_pdf_dependent_state if can_reason else tk.DISABLED)
-        if hasattr(self.key_points_btn, 'config'):
-            self.key_points_btn.config(state=effective_pdf_dependent_state if can_reason else tk.DISABLED)
+        self._configure_if_changed(self.explain_concept_btn, state=effective_pdf_dependent_state if can_reason else tk.DISABLED)
+        self._configure_if_changed(self.summarize_page_btn, state=effective_pdf_dependent_state if can_reason else tk.DISABLED)
+        self._configure_if_changed(self.generate_quiz_btn, state=effective_pdf_dependent_state if can_reason else tk.DISABLED)
+        self._configure_if_changed(self.key_points_btn, state=effective_pdf_dependent_state if can_reason else tk.DISABLED)
+        self._configure_if_changed(self.structured_quiz_btn, state=effective_pdf_dependent_state if can_reason and self.study_item_store else tk.DISABLED)
+        self._configure_if_changed(self.flashcards_btn, state=effective_pdf_dependent_state if can_reason and self.study_item_store else tk.DISABLED)
+        # Exporting only reads the database, so it does not need a model
+        self._configure_if_changed(self.export_cards_btn, state=tk.NORMAL if is_pdf_loaded and self.pdf_document_hash and self.study_item_store else tk.DISABLED)
 
         # Code button requires PDF + model with code capability
-        if hasattr(self.explain_code_btn, 'config'):
-            self.explain_code_btn.config(state=effective_pdf_dependent_state if can_code else tk.DISABLED)
+        self._configure_if_changed(self.explain_code_btn, state=effective_pdf_dependent_state if can_code else tk.DISABLED)
 
         # Vision button requires PDF + model with vision capability
-        if hasattr(self.analyze_images_btn, 'config'):
-            # Note: analyze_images requires extracting images first, which is done on load.
-            # We could further refine this to only be active if self.pdf_page_images is not empty
-            # but for simplicity, we'll enable it if the model supports vision and PDF is loaded.
-            self.analyze_images_btn.config(state=effective_pdf_dependent_state if can_vision else tk.DISABLED)
+        self._configure_if_changed(self.analyze_images_btn, state=effective_pdf_dependent_state if can_vision else tk.DISABLED)
 
-        # TTS buttons state based on PDF/AI response availability (handled separately)
+        # TTS and voice query buttons depend on PDF/AI response availability and playback (handled separately)
         self._update_tts_button_states()
 
-        # Voice query button state (requires model valid AND voice query available)
-        if hasattr(self.voice_query_btn, 'config'):
-             self.voice_query_btn.config(
-                 state=tk.NORMAL if is_model_valid and self.voice_query_available else tk.DISABLED
-             )
-
 
     def load_pdf_dialog(self):
-        """Opens a file dialog and loads the selected PDF."""
+        """Opens a file dialog and adds the selected PDF to the library (the open documents stay loaded)."""
         file_path = filedialog.askopenfilename(title="Select PDF File",
                                                filetypes=[("PDF Files", "*.pdf"), ("All Files", "*.*")])
         if not file_path: return
 
-        # Close previous document if any
-        if self.pdf_document:
-            try: self.pdf_document.close()
-            except Exception as e: print(f"Error closing previous PDF: {e}")
+        # A document that is already open is just shown again
+        existing_document = self.library.find(file_path)
+        if existing_document is not None:
+            self._activate_document(existing_document)
+            return
 
+        self._deactivate_document() # The previous document stays in the library where it was left
         self.clear_pdf_view_and_data() # Clear UI and internal data
+        self._transcript_saved_count = len(self.chat_transcript.store) # Earlier messages do not belong to this document
 
         try:
             self.update_status(f"Loading PDF: {os.path.basename(file_path)}...")
-            self.pdf_document = fitz.open(file_path)
-            total_pages = self.pdf_document.page_count
+            document = self.library.add(file_path)
+            file_stat = os.stat(document.path)
+            document.file_stat = (file_stat.st_size, file_stat.st_mtime)
+            self.pdf_document = self.library.pin(document) # Kept open while shown
+            self.active_document = document
+            self.pdf_document_path = document.path
+            self._pdf_file_stat = document.file_stat
+            self._update_document_selector()
+            total_pages = document.page_count
+
+            # A document opened before (same path, size and modification time) is restored right away
+            known_hash = self.session_store.lookup_path(document.path, *self._pdf_file_stat) if self.session_store else None
+            if known_hash:
+                self._restore_session(known_hash, document)
+
             self.update_status(f"Extracting text and images from {total_pages} pages...")
             # Start extraction in a separate thread
-            threading.Thread(target=self._extract_all_pdf_content_worker, args=(total_pages,), daemon=True).start()
+            threading.Thread(target=self._extract_all_pdf_content_worker, args=(document, known_hash), daemon=True).start()
 
         except Exception as e:
             self.handle_error(f"Failed to load PDF: {str(e)}", "PDF Load Error")
-            self.pdf_document = None # Ensure document is None on error
-            # Update AI button states after PDF load failure
-            self._set_ai_buttons_state() # This will disable PDF-dependent buttons
-
+            if self.active_document is not None:
+                self.close_active_document() # Shows the previously open document again
+            elif len(self.library):
+                self._activate_document(self.library.documents()[-1])
+            else:
+                self.pdf_document = None # Ensure document is None on error
+                # Update AI button states after PDF load failure
+                self._set_ai_buttons_state() # This will disable PDF-dependent buttons
 
-    def _extract_all_pdf_content_worker(self, total_pages):
-        """Worker thread function to extract text and images from all pages."""
-        if not self.pdf_document: return
 
+    def _extract_all_pdf_content_worker(self, document, known_hash=None):
+        """
+        Worker thread function to extract text and images from all pages of a library document.
+        Page text cached by an earlier session is reused, so only images are extracted then.
+        The results are stored on the document (and indexed for search) even if another document is shown meanwhile.
+        """
+        total_pages = document.page_count
         extracted_texts = []
         extracted_images = [] # List of lists of image data per page
+        extracted_layouts = []
+        ocr_candidates = {} # page -> content hash of pages without a text layer
 
         try:
-            for i in range(total_pages):
-                page_texts = "[Error extracting text]" # Default error state
-                page_images_data = [] # List of base64 image strings for this page
-
+            doc_hash = known_hash
+            if doc_hash is None:
                 try:
-                    page = self.pdf_document.load_page(i)
-                    # Extract text
-                    try:
-                        text = page.get_text("text", sort=True).strip()
-                        page_texts = text if text else "[No text found on this page]"
-                    except Exception as text_e:
-                        page_texts = f"[Error extracting text: {str(text_e)[:50]}]"
-                        print(f"Error extracting text from page {i+1}: {text_e}")
-
-                    # Extract images for the current page
-                    try:
-                        images_on_page = page.get_images(full=True)
-                        for img_index, img_info in enumerate(images_on_page):
-                             # Limit image extraction/processing for performance if needed
-                             # if img_index >= 5: break # Example limit
-                             xref = img_info[0]
-                             base_image = self.pdf_document.extract_image(xref)
-                             if base_image and base_image["image"]:
-                                 # Store as base64 string
-                                 page_images_data.append(base64.b64encode(base_image["image"]).decode('utf-8'))
-
-                    except Exception as img_e:
-                        print(f"Error extracting images from page {i+1}: {img_e}")
-                        # Continue without images for this page
-
-                except Exception as page_e:
-                    # Catch errors loading the page itself
-                    page_texts = f"[Error loading page {i+1}: {str(page_e)[:50]}]"
-                    print(f"Error loading page {i+1}: {page_e}")
-
-                extracted_texts.append(page_texts)
-                extracted_images.append(page_images_data)
-
-
-                # Update status periodically or on completion
-                if (i + 1) % 10 == 0 or (i + 1) == total_pages:
-                    if self.root:
-                        self.root.after(0, self.update_status, f"Extracted content from {i+1}/{total_pages} pages...")
-
-            self.pdf_page_text_for_ai = extracted_texts
-            self.pdf_page_images = extracted_images
+                    doc_hash = file_sha1(document.path)
+                except OSError as hash_e:
+                    print(f"Could not hash {document.path}: {hash_e}")
+            document.doc_hash = doc_hash
+            self.ui.post(self._apply_document_content, document) # Hash and conversation memory of the shown document
+
+            cached_texts = None
+            if self.session_store and doc_hash:
+                if known_hash is None and self.session_store.load_session(doc_hash):
+                    self.ui.post(self._restore_session, doc_hash, document) # Same document, opened from another path
+                # Heavier session data is loaded here, off the main thread
+                cached_texts = self.session_store.load_page_texts(doc_hash, TEXT_EXTRACTION_VERSION, total_pages)
+                if cached_texts:
+                    document.page_layouts = self.session_store.load_page_layouts(doc_hash, TEXT_EXTRACTION_VERSION, total_pages) or []
+                    document.display_texts = self.session_store.load_page_raw_texts(doc_hash, TEXT_EXTRACTION_VERSION, total_pages) or cached_texts
+                    document.text_stats = normalization_stats(document.display_texts, cached_texts)
+                for key, value in self.session_store.load_artifacts(doc_hash):
+                    self.study_prefetcher.put_cached(tuple(key), value)
+            if cached_texts:
+                # The text is usable (and searchable) right away; images are still extracted below
+                self.library.set_page_texts(document, cached_texts)
+                self.update_status(f"Page text restored from the last session; extracting images from {total_pages} pages...")
+                self.ui.post(self._apply_document_content, document)
+
+            with self.library.using(document) as pdf_handle:
+                for i in range(total_pages):
+                    if self.library.find(document.path) is not document:
+                        return # Closed while being extracted
+                    page_texts, page_images_data, page_layout = extract_page_content(pdf_handle, i, include_text=cached_texts is None)
+
+                    extracted_texts.append(page_texts)
+                    extracted_images.append(page_images_data)
+                    extracted_layouts.append(page_layout)
+                    if (cached_texts[i] if cached_texts else page_texts) == NO_TEXT_FOUND:
+                        try:
+                            page_hash = page_content_hash(pdf_handle, i)
+                        except Exception as hash_e:
+                            print(f"Could not hash page {i + 1} of {document.name}: {hash_e}")
+                            page_hash = None
+                        if page_hash: # Only pages with images can be recognized
+                            ocr_candidates[i] = page_hash
+
+
+                    # Update status periodically or on completion
+                    if (i + 1) % 10 == 0 or (i + 1) == total_pages:
+                        if self.root:
+                            self.update_status(f"Extracted content from {i+1}/{total_pages} pages of {document.name}...")
+
+            if cached_texts is None:
+                # Headers/footers, hyphenation and line wrapping are removed for prompts, speech and search
+                normalized_texts, normalized_layouts, document.text_stats = normalize_document(extracted_texts, extracted_layouts)
+                print(f"[DEBUG] {document.name}: {format_savings(document.text_stats)}") # Debug log
+                document.display_texts = extracted_texts
+                document.page_layouts = normalized_layouts
+                self.library.set_page_texts(document, normalized_texts)
+                # Cache the text and layout for the next session (unless some pages failed and should be retried)
+                if self.session_store and doc_hash and not any(text.startswith("[Error") for text in extracted_texts):
+                    self.session_store.save_page_texts(doc_hash, TEXT_EXTRACTION_VERSION, normalized_texts, normalized_layouts,
+                                                       raw_texts=extracted_texts)
+            document.page_images = extracted_images
 
             if self.root:
-                self.root.after(0, self.update_status, "PDF content extraction complete.")
-                # After extraction, render the first page and update UI states
-                self.root.after(0, self.render_current_pdf_page)
-                # Update AI button states now that content is available (checks model readiness internally)
-                self.root.after(0, self._set_ai_buttons_state)
+                savings = f" Text: {format_savings(document.text_stats)}." if document.text_stats else ""
+                self.update_status(f"PDF content extraction complete for {document.name}.{savings}")
+                # After extraction, render the page and update UI states if the document is still shown
+                self.ui.post(self._apply_document_content, document)
+            if ocr_candidates:
+                self._start_ocr(document, ocr_candidates)
 
 
         except Exception as e:
@@ -769,10 +876,28 @@ class PDFToSpeechApp:
                 error_message = f"Critical error during PDF content extraction: {str(e)}"
                 self.handle_error(error_message, "Extraction Error")
                 # Populate with error placeholders
-                self.pdf_page_text_for_ai = ["[Critical Extraction Error]" for _ in range(total_pages)] if self.pdf_document else []
-                self.pdf_page_images = [[] for _ in range(total_pages)] if self.pdf_document else []
-                self.root.after(0, self.render_current_pdf_page) # Still try to render page with error text
-                self.root.after(0, self._set_ai_buttons_state) # Update button states
+                document.page_texts = ["[Critical Extraction Error]" for _ in range(total_pages)]
+                document.display_texts = document.page_texts
+                document.page_images = [[] for _ in range(total_pages)]
+                document.page_layouts = []
+                self.ui.post(self._apply_document_content, document) # Still try to render page with error text
+
+
+    def _apply_document_content(self, document):
+        """Main thread: takes over newly extracted content of a document if it is the one shown."""
+        if document is not self.active_document:
+            return
+        self.pdf_document_hash = document.doc_hash
+        # Conversation memory is kept per document
+        self.conversation_memory.set_document(document.doc_hash or document.path)
+        self.pdf_page_text_for_ai = document.page_texts
+        self.pdf_page_display_texts = document.display_texts
+        self.pdf_page_images = document.page_images
+        self.pdf_page_layouts = document.page_layouts
+        if self.pdf_page_text_for_ai:
+            self.render_current_pdf_page()
+        # Update AI button states now that content is available (checks model readiness internally)
+        self.request_button_refresh()
 
 
     def render_current_pdf_page(self):
@@ -785,6 +910,8 @@ class PDFToSpeechApp:
             self.current_page_num = max(0, min(self.current_page_num, self.pdf_document.page_count - 1))
 
             page = self.pdf_document.load_page(self.current_page_num)
+            import fitz  # PyMuPDF (already loaded with the document)
+            from PIL import Image, ImageTk
             mat = fitz.Matrix(self.current_zoom_scale, self.current_zoom_scale)
             # Use get_displaylist and get_pixmap from displaylist for potentially better rendering
             # dl = page.get_displaylist()
@@ -818,15 +945,20 @@ class PDFToSpeechApp:
             if hasattr(self.page_text_scrolledtext, 'config'):
                 self.page_text_scrolledtext.config(state=tk.NORMAL) # Enable editing temporarily
                 self.page_text_scrolledtext.delete("1.0", tk.END)
-                # Display extracted text or an error message if extraction failed for this page
-                if self.pdf_page_text_for_ai and 0 <= self.current_page_num < len(self.pdf_page_text_for_ai):
-                    self.page_text_scrolledtext.insert(tk.END, self.pdf_page_text_for_ai[self.current_page_num])
+                # Display extracted text (as on the page, not normalized) or an error message if extraction failed for this page
+                display_texts = self.pdf_page_display_texts or self.pdf_page_text_for_ai
+                if display_texts and 0 <= self.current_page_num < len(display_texts):
+                    self.page_text_scrolledtext.insert(tk.END, display_texts[self.current_page_num])
                 else:
                     self.page_text_scrolledtext.insert(tk.END, "[Text not available or error during extraction for this page.]")
                 self.page_text_scrolledtext.config(state=tk.DISABLED) # Disable editing
 
             # Update TTS button state based on text availability
-            self._update_tts_button_states()
+            self.request_button_refresh()
+
+            # Precompute study material for the upcoming pages while the user reads this one
+            self._schedule_study_prefetch()
+            self._schedule_session_save() # Remember the reading position and zoom
 
         except Exception as e:
             self.handle_error(f"Error rendering page {self.current_page_num + 1}: {str(e)}", "Rendering Error")
@@ -835,12 +967,245 @@ class PDFToSpeechApp:
             self._update_tts_button_states()
 
 
+    # --- OCR of Scanned Pages ---
+
+    def _start_ocr(self, document, page_hashes):
+        """
+        Worker thread: fills in pages without a text layer, from the OCR cache or by queueing them for recognition.
+
+        Args:
+            page_hashes (dict): page -> page_content_hash() of the pages to recognize.
+        """
+        cached = {}
+        if self.session_store:
+            try:
+                cached = self.session_store.load_ocr_texts(set(page_hashes.values()), self.ocr_language)
+            except Exception as e:
+                print(f"Could not read OCR cache: {e}")
+        jobs = []
+        for page, page_hash in page_hashes.items():
+            if page_hash in cached:
+                self.ui.post(self._apply_ocr_text, document, page, *cached[page_hash])
+            else:
+                jobs.append({"key": (document.path, page), "document": document, "pdf_path": document.path,
+                             "page": page, "page_hash": page_hash, "language": self.ocr_language})
+        if not jobs:
+            return
+        if not ocr_available():
+            self.update_status(f"{len(jobs)} page(s) of {document.name} are scanned images without text."
+                               " Install Tesseract OCR to read them.")
+            return
+        self.update_status(f"Recognizing text on {len(jobs)} scanned page(s) of {document.name} in the background...")
+        self.ocr_scheduler.submit(jobs)
+
+    def _ocr_priority(self, job):
+        """Pages of the shown document nearest the current page first (the next page before the previous one)."""
+        if job["document"] is not self.active_document:
+            return (1, job["page"])
+        distance = job["page"] - self.current_page_num
+        return (0, abs(distance) * 2 + (distance < 0))
+
+    def _on_ocr_result(self, job, result):
+        """OCR pool thread: caches a recognized page and hands it to the main thread."""
+        page_text, layout = result
+        if self.session_store:
+            try:
+                self.session_store.put_ocr_text(job["page_hash"], job["language"], page_text, layout)
+            except Exception as e:
+                print(f"Could not save OCR text: {e}")
+        self.ui.post(self._apply_ocr_text, job["document"], job["page"], page_text, layout)
+        remaining = self.ocr_scheduler.pending_count()
+        self.update_status(f"Recognized page {job['page'] + 1} of {job['document'].name}"
+                           + (f"; {remaining} scanned page(s) left." if remaining else "; OCR complete."))
+
+    def _on_ocr_error(self, job, error):
+        print(f"[DEBUG] OCR failed for page {job['page'] + 1} of {job['pdf_path']}: {error}") # Debug log
+        self.update_status(f"Could not recognize page {job['page'] + 1} of {job['document'].name}: {str(error)[:80]}")
+
+    def _apply_ocr_text(self, document, page, page_text, layout):
+        """Main thread: replaces the placeholder of a scanned page with its recognized text."""
+        if self.library.find(document.path) is not document or not 0 <= page < len(document.page_texts):
+            return
+        normalized_text, normalized_layout = normalize_page(page_text, layout)
+        if normalized_text == NO_TEXT_FOUND:
+            return # Nothing legible on the page
+        if document.display_texts is document.page_texts: # Cached before original texts were stored
+            document.display_texts = list(document.page_texts)
+        if page < len(document.display_texts):
+            document.display_texts[page] = page_text
+        if page < len(document.page_layouts):
+            document.page_layouts[page] = normalized_layout
+        self.library.set_page_text(document, page, normalized_text) # Also updates pdf_page_text_for_ai (same list)
+        if document is self.active_document:
+            self.pdf_page_display_texts = document.display_texts
+            if page == self.current_page_num:
+                self.render_current_pdf_page()
+            else:
+                self.request_button_refresh()
+
+
+    # --- Reading Sessions ---
+
+    def _restore_session(self, doc_hash, document):
+        """Main thread: restores the saved position, zoom, conversation and chat transcript of a newly opened document."""
+        if not self.session_store or document is not self.active_document:
+            return
+        try:
+            session = self.session_store.load_session(doc_hash)
+            next_seq, messages = self.session_store.load_transcript(doc_hash)
+        except Exception as e:
+            print(f"Could not restore session: {e}")
+            return
+        if session is None:
+            return
+        self.pdf_document_hash = document.doc_hash = doc_hash
+        self.current_page_num = max(0, min(session["page"], document.page_count - 1))
+        self.current_zoom_scale = session["zoom"]
+        if session["memory"]:
+            self.conversation_memory.import_state(session["memory"], doc_key=doc_hash)
+        if messages:
+            self.chat_transcript.load(messages)
+            ai_messages = [text for sender, text, _, _ in messages if sender == "AI"]
+            self.last_ai_response = ai_messages[-1].strip() if ai_messages else ""
+        print(f"[DEBUG] Restored session for {doc_hash[:12]}: page {self.current_page_num + 1}, {len(messages)} message(s).") # Debug log
+        self.add_to_chat("System", f"Welcome back! Restored page {self.current_page_num + 1} and {len(messages)} chat message(s) from your last session.", "system")
+        # Everything shown so far is either saved already or not part of this document (including the welcome note)
+        self._transcript_saved_count = len(self.chat_transcript.store)
+        self._transcript_next_seq = next_seq
+        self.render_current_pdf_page()
+
+    def _schedule_session_save(self, delay_ms=1500):
+        """Saves the session shortly after the last change (page turns and messages are batched)."""
+        if self._session_save_id is not None:
+            self.root.after_cancel(self._session_save_id)
+        self._session_save_id = self.root.after(delay_ms, self._save_session)
+
+    def _save_session(self):
+        """Main thread: saves the reading position, zoom, conversation memory and new chat messages."""
+        if self._session_save_id is not None:
+            self.root.after_cancel(self._session_save_id)
+            self._session_save_id = None
+        if not (self.session_store and self.pdf_document and self.pdf_document_hash):
+            return
+        doc_hash = self.pdf_document_hash
+        file_size, file_mtime = self._pdf_file_stat or (None, None)
+        try:
+            self.session_store.save_session(doc_hash, self.pdf_document_path, file_size, file_mtime,
+                                            self.current_page_num, self.current_zoom_scale,
+                                            self.conversation_memory.export_state(doc_key=doc_hash))
+            complete = self.chat_transcript.stable_length() # A response still streaming is saved once it is complete
+            if complete > self._transcript_saved_count:
+                new_messages = self.chat_transcript.messages(self._transcript_saved_count, complete)
+                self.session_store.append_transcript(doc_hash, self._transcript_next_seq, new_messages)
+                self._transcript_next_seq += len(new_messages)
+                self._transcript_saved_count = complete
+        except Exception as e:
+            print(f"Could not save session: {e}")
+
+    def _save_artifact(self, doc_hash, key, text):
+        """Keeps generated study material for later sessions (any thread)."""
+        if self.session_store and doc_hash and text:
+            try:
+                self.session_store.put_artifact(doc_hash, list(key), text)
+            except Exception as e:
+                print(f"Could not save generated material: {e}")
+
+
+    # --- Document Library ---
+
+    def _update_document_selector(self):
+        """Lists the open documents in the selector and marks the one shown."""
+        documents = self.library.documents()
+        labels = [f"{number}. {document.name}" for number, document in enumerate(documents, start=1)]
+        self.document_selector.config(values=labels)
+        active_index = documents.index(self.active_document) if self.active_document in documents else -1
+        self.document_selector.set(labels[active_index] if active_index >= 0 else "")
+        self._configure_if_changed(self.close_document_btn, state=tk.NORMAL if self.active_document else tk.DISABLED)
+
+    def on_document_selected(self, event=None):
+        """Shows the document chosen in the selector."""
+        index = self.document_selector.current()
+        documents = self.library.documents()
+        if 0 <= index < len(documents):
+            self._activate_document(documents[index])
+
+    def _deactivate_document(self):
+        """Main thread: saves the shown document's session, keeps its position in the library and releases its PDF handle."""
+        document = self.active_document
+        if document is None:
+            return
+        self._save_session()
+        document.page, document.zoom = self.current_page_num, self.current_zoom_scale
+        self.active_document = None
+        self.pdf_document = None
+        self.library.unpin(document) # May now be closed if other documents were used more recently
+
+    def _activate_document(self, document):
+        """Main thread: shows a library document where it was left (its PDF is reopened if its handle was closed)."""
+        if document is self.active_document:
+            return
+        self._deactivate_document()
+        self.clear_pdf_view_and_data()
+        try:
+            self.pdf_document = self.library.pin(document)
+        except Exception as e:
+            self.handle_error(f"Failed to reopen {document.name}: {str(e)}", "PDF Load Error")
+            self.library.remove(document)
+            self._update_document_selector()
+            return
+        self.active_document = document
+        self.pdf_document_path = document.path
+        self._pdf_file_stat = document.file_stat
+        self.current_page_num, self.current_zoom_scale = document.page, document.zoom
+        # The chat continues; new messages are saved with this document's session
+        self._transcript_saved_count = len(self.chat_transcript.store)
+        if self.session_store and document.doc_hash:
+            try:
+                self._transcript_next_seq = self.session_store.next_transcript_seq(document.doc_hash)
+            except Exception as e:
+                print(f"Could not read session transcript: {e}")
+        self._update_document_selector()
+        self._apply_document_content(document)
+        if not self.pdf_page_text_for_ai:
+            self.render_current_pdf_page() # Still being extracted: show the page already
+        self.update_status(f"Showing {document.name} ({len(self.library)} document(s) open).")
+
+    def close_active_document(self):
+        """Closes the shown document and removes it from the library; the most recently opened remaining one is shown."""
+        document = self.active_document
+        if document is None:
+            return
+        self._deactivate_document()
+        self.ocr_scheduler.cancel(lambda job: job["document"] is document)
+        self.region_render_cache.remove_document(document.path)
+        self.library.remove(document)
+        remaining_documents = self.library.documents()
+        if remaining_documents:
+            self._activate_document(remaining_documents[-1])
+        else:
+            self.clear_pdf_view_and_data()
+            self.update_status(f"Closed {document.name}.")
+        self._update_document_selector()
+
+    def _find_library_passages(self, query, exclude_current_page=True):
+        """Passages from all open documents that match the query, as (citation, text) pairs (any thread)."""
+        document, page = self.active_document, self.current_page_num
+        exclude = [(document, page)] if exclude_current_page and document else []
+        hits = self.library.search(query, limit=self.library_passages_per_question, exclude=exclude)
+        return [(hit.document.citation(hit.page), hit.text) for hit in hits]
+
+
     def clear_pdf_view_and_data(self):
         """Clears the PDF display and related internal data."""
         if hasattr(self.pdf_canvas, 'delete'): self.pdf_canvas.delete("all")
         self.rendered_page_image = None
         self.pdf_page_text_for_ai = []
+        self.pdf_page_display_texts = []
         self.pdf_page_images = []
+        self.pdf_page_layouts = []
+        self.pdf_document_hash = None
+        self.conversation_memory.set_document(None)
+        self.study_prefetcher.schedule([]) # Results already generated stay cached for when the document is shown again
         self.current_page_num = 0
         self.current_zoom_scale = 1.0
 
@@ -948,90 +1313,106 @@ class PDFToSpeechApp:
         # Add horizontal scrolling with Shift key? (Optional enhancement)
 
 
-    def add_to_chat(self, sender, message, tag_override=None):
-        """Adds a message to the chat history text widget."""
-        if not hasattr(self.chat_history_scrolledtext, 'insert'): return
-
-        # Enable editing temporarily
-        self.chat_history_scrolledtext.config(state=tk.NORMAL)
+    def add_to_chat(self, sender, message, tag_override=None, auto_speak=True, streamed=None):
+        """
+        Adds a message to the chat transcript (shown in the chat widget on the next frame).
+        If `streamed` (a StreamedText) is given, the message was already shown as it arrived and is completed instead.
+        """
+        if not hasattr(self, 'chat_transcript'): return
 
-        # Determine tag and prefix
+        # Determine tag and prefix tag (bold for user/AI, normal for system/error)
         tag = tag_override if tag_override else sender.lower()
-        prefix = f"{sender}: " if sender else "" # Only add prefix if sender is provided
-
-        # Apply sender tag (bold for user/AI, normal for system/error)
-        if prefix:
-             prefix_tag = "bold" if sender.lower() in ["user", "ai"] else tag
-             self.chat_history_scrolledtext.insert(tk.END, prefix, prefix_tag)
+        prefix_tag = ("bold" if sender.lower() in ["user", "ai"] else tag) if sender else None
 
-        # Apply message tag
-        self.chat_history_scrolledtext.insert(tk.END, message + "\n\n", tag)
-
-        # Disable editing
-        self.chat_history_scrolledtext.config(state=tk.DISABLED)
+        if streamed is not None:
+            self._pump_streamed_chat(streamed, sender, tag, prefix_tag)
+            streamed.finished = True
+        if streamed is not None and streamed.index is not None:
+            self.chat_transcript.end_live(streamed.index, message)
+        else:
+            # Follow the conversation if the view is at the bottom; always show the user's own question
+            is_user_message = bool(sender) and sender.lower() == "user"
+            self.chat_transcript.append(sender, message, tag, prefix_tag, scroll=True if is_user_message else None)
 
-        # Auto-scroll to the bottom
-        self.chat_history_scrolledtext.see(tk.END)
+        if self.pdf_document_hash:
+            self._schedule_session_save()
 
         # Store last AI response and handle auto-play
         if sender and sender.lower() == "ai":
             self.last_ai_response = message.strip() # Store stripped response
             # Update button states (including enabling the Speak AI button)
-            self._update_tts_button_states()
+            self.request_button_refresh()
 
             # If auto-play is enabled and there's response text, start playing
-            if self.auto_play_ai.get() and self.last_ai_response:
+            if auto_speak and self.auto_play_ai.get() and self.last_ai_response:
                 # Use a short delay to allow the UI to update
                 self.root.after(100, self.play_last_ai_response)
 
 
-    def _prepare_ai_prompt_and_context(self, user_request_text, include_page_context=True, max_page_context_len=3000, max_history_turns=5):
-        """Builds the full prompt for the AI including personality, history, and context."""
-        full_prompt_parts = []
+    def _pump_streamed_chat(self, streamed, sender="AI", tag="ai", prefix_tag="bold"):
+        """Main thread: shows the text of a streaming response received since the last call."""
+        text = streamed.take()
+        if streamed.finished or not text:
+            return
+        if streamed.index is None:
+            streamed.index = self.chat_transcript.begin_live(sender, tag, prefix_tag)
+        self.chat_transcript.append_live(streamed.index, text)
 
-        # 1. Add Personality System Prompt
+    def _prepare_ai_prompt_and_context(self, user_request_text, include_page_context=True, max_page_context_len=3000, include_history=True, library_passages=()):
+        """Builds the full prompt for the AI including personality, history, context and passages from the library."""
         personality_name = self.selected_personality.get()
         personality_info = self.personalities.get(personality_name, self.personalities["Default Tutor"]) # Fallback
-        full_prompt_parts.append(f"System Role: {personality_info['system_prompt']}\n")
-
-        # 2. Include recent chat history
-        if self.chat_conversation_history:
-            history_str = "Previous conversation turns:\n"
-            # Add a few recent turns (excluding the current user turn which is in user_request_text)
-            # Ensure we don't exceed history length or max_history_turns
-            start_index = max(0, len(self.chat_conversation_history) - max_history_turns)
-            for entry in self.chat_conversation_history[start_index:]:
-                 # Format history role (User/Assistant) and content
-                 role = entry.get('role', 'unknown').capitalize()
-                 content = entry.get('content', '')
-                 # Avoid adding very short or empty history entries
-                 if content.strip():
-                      history_str += f"{role}: {content.strip()[:200]}...\n" # Limit history content length
-
-            if history_str != "Previous conversation turns:\n": # Only add if there's actual history included
-                 full_prompt_parts.append(history_str)
-
-        # 3. Include Current PDF Page Context
-        if include_page_context and self.pdf_document and self.pdf_page_text_for_ai:
-            if 0 <= self.current_page_num < len(self.pdf_page_text_for_ai):
-                page_text = self.pdf_page_text_for_ai[self.current_page_num]
-                # Limit the page text length to manage context window
-                truncated_page_text = page_text.strip()[:max_page_context_len]
-
-                if truncated_page_text and not truncated_page_text.startswith(("[No text found", "[Error extracting", "[Critical Extraction Error]")): # Only add if there's valid text
-                     full_prompt_parts.append(f"Current PDF Page ({self.current_page_num + 1}) Context:\n\"\"\"\n{truncated_page_text}\n\"\"\"\n")
-                elif truncated_page_text: # Add placeholder if text was extracted but indicates error/empty
-                     full_prompt_parts.append(f"Current PDF Page ({self.current_page_num + 1}) Context: {truncated_page_text}\n")
-
-
-        # 4. Add the user's current request/instruction
-        full_prompt_parts.append(f"User's Request: {user_request_text.strip()}\n\nAI Response:")
-
-        # Join all parts into the final prompt string
-        return "\n".join(full_prompt_parts)
 
+        # Rolling summary plus the recent turns that fit the budget (the current user turn is in user_request_text)
+        conversation_summary, history_entries = self.conversation_memory.get_prompt_context() if include_history else ("", [])
 
-    def _threaded_ollama_request(self, request_label, user_instruction_prompt, images_base64_list=None, include_page_context=True):
+        page_text = None
+        if include_page_context and self.pdf_document and self.pdf_page_text_for_ai:
+            if 0 <= self.current_page_num < len(self.pdf_page_text_for_ai):
+                # Headings, code and tables found during extraction are marked up for the model
+                page_text = format_page_for_prompt(self.pdf_page_text_for_ai[self.current_page_num],
+                                                   self._page_layout(self.current_page_num))
+
+        return compose_prompt(personality_info['system_prompt'], user_request_text, history_entries,
+                              page_text=page_text, page_num=self.current_page_num,
+                              max_page_context_len=max_page_context_len,
+                              conversation_summary=conversation_summary, library_passages=library_passages)
+
+
+    def _page_layout(self, page_num):
+        """Layout of a page found during extraction ([] if unknown)."""
+        if 0 <= page_num < len(self.pdf_page_layouts):
+            return self.pdf_page_layouts[page_num] or []
+        return []
+
+
+    def _history_text_for_request(self, request_label, user_instruction_prompt):
+        """Text remembered for a user turn: short requests verbatim, long generated instructions abbreviated."""
+        instruction = user_instruction_prompt.strip()
+        if len(instruction) <= 500:
+            return f"({request_label}) {instruction}"
+        return f"({request_label}) {instruction[:200]}..."
+
+
+    def _summarize_conversation(self, previous_summary, turns):
+        """Runs on the conversation memory's background thread: folds older turns into the rolling summary."""
+        model_name = self._last_request_model
+        if not model_name:
+            return None
+        transcript = "\n".join(f"{turn['role'].capitalize()}: {turn['content']}" for turn in turns)
+        prompt = (f"You maintain a running summary of a tutoring conversation about a document.\n"
+                  f"Current summary (may be empty):\n\"\"\"\n{previous_summary}\n\"\"\"\n\n"
+                  f"New conversation turns to fold in:\n\"\"\"\n{transcript}\n\"\"\"\n\n"
+                  f"Write the updated summary in at most 150 words. Keep the questions the student asked, "
+                  f"the key facts and explanations given, and anything the student struggled with. "
+                  f"Respond with the summary text only.")
+        request_start = time.monotonic()
+        response_data = self.ollama_client.generate(model_name, prompt, options={"temperature": 0.2, "num_ctx": 4096})
+        self.request_telemetry.record(model_name, "Conversation Summary", response_data, time.monotonic() - request_start)
+        return response_data.get('response', '').strip()
+
+
+    def _threaded_ollama_request(self, request_label, user_instruction_prompt, images_base64_list=None, include_page_context=True, enqueued_at=None, artifact_key=None, library_query=None):
         """
         Handles sending a request to Ollama in a separate thread.
 
@@ -1040,73 +1421,106 @@ class PDFToSpeechApp:
             user_instruction_prompt (str): The specific instruction for the AI for this task.
             images_base64_list (list, optional): List of base64 image strings for vision models. Defaults to None.
             include_page_context (bool): Whether to include the current page text as context. Defaults to True.
+            enqueued_at (float, optional): time.monotonic() when the user triggered the request, for queue-wait telemetry.
+            artifact_key (tuple, optional): Study material cache key; the response is then kept for later requests and sessions.
+            library_query (str, optional): Passages of all open documents matching this text are added to the prompt, to be cited.
         """
+        import requests # For its exception types; already loaded by the client
         # Use the currently selected model
         model_name = self.current_ollama_model.get()
 
         if model_name in ["Loading...", "No Models Found", "Ollama Offline", "Ollama Timeout", "Error Fetching"] or not bool(model_name):
             # Schedule error message on the main thread
-            self.root.after(0, self.handle_error, "Ollama model not available or not selected. Cannot send request.", "AI Request Failed")
+            self.ui.post(self.handle_error, "Ollama model not available or not selected. Cannot send request.", "AI Request Failed")
             return
 
-        # Prepare the full prompt including personality, history, and page context
+        # Passages from any open document can answer the question (the current page is already in the context)
+        library_passages = self._find_library_passages(library_query, exclude_current_page=include_page_context) if library_query else []
+        if library_passages:
+            self.ui.post(self.add_to_chat, "System", "Sources from your library: " + ", ".join(citation for citation, _ in library_passages), "system")
+
+        # Prepare the full prompt including personality, history, page context and library passages
         full_prompt_for_ai = self._prepare_ai_prompt_and_context(
              user_instruction_prompt,
-             include_page_context=include_page_context # Use the argument to control page context inclusion
+             include_page_context=include_page_context, # Use the argument to control page context inclusion
+             library_passages=library_passages
         )
 
-        # Add user request log entry to chat history BEFORE sending
+        # Add user request log entry to the conversation memory BEFORE sending
         # The actual user input message (if any) should be added via add_to_chat
         # in the calling method (e.g., send_question_to_ai, explain_concept_btn handlers)
-        # This history entry is just for the internal chat_conversation_history list
-        self.chat_conversation_history.append({"role": "user", "content": f"({request_label}) {user_instruction_prompt.strip()[:100]}..."}) # Log truncated instruction
+        # The document is captured now so the reply is remembered for the right PDF even if another is loaded meanwhile
+        memory_doc_key = self.conversation_memory.current_document
+        artifact_doc_hash = self.pdf_document_hash
+        if model_name != self._last_request_model:
+            # Set before the turn is added, which may start a summary with this model
+            self._last_request_model = model_name
+            self.conversation_memory.retry_compaction()
+        self.conversation_memory.append("user", self._history_text_for_request(request_label, user_instruction_prompt), doc_key=memory_doc_key)
 
 
-        self.root.after(0, self.update_status, f"Sending '{request_label}' request to {model_name}...")
+        self.update_status(f"Sending '{request_label}' request to {model_name}...")
 
 
-        payload = {
-            "model": model_name,
-            "prompt": full_prompt_for_ai,
-            "stream": False, # Use non-streaming for simplicity in this version
-            "options": {"temperature": 0.6, "num_ctx": 4096} # num_ctx should ideally match the model's context window
-        }
-
         # Determine capabilities of the currently selected model
         current_model_capabilities = self._get_model_capabilities(model_name)
 
         # Add images only if they are provided AND the model supports vision
+        images_to_send = None
         if images_base64_list and current_model_capabilities.get("vision", False):
-            payload["images"] = images_base64_list
+            images_to_send = images_base64_list
             print(f"[DEBUG] Including {len(images_base64_list)} image(s) in payload.") # Debug log
         elif images_base64_list and not current_model_capabilities.get("vision", False):
              # Warning if images are sent to a non-vision model
-             self.root.after(0, self.add_to_chat, "System", f"Warning: Images sent to model '{model_name}' which may not be ideal for vision. Results may be poor.", "system")
+             self.ui.post(self.add_to_chat, "System", f"Warning: Images sent to model '{model_name}' which may not be ideal for vision. Results may be poor.", "system")
 
 
         ai_response_content = "" # Initialize response content
+        # With auto-speak, sentences are spoken as soon as they are generated
+        speech_feed = None
+        if self.auto_play_ai.get() and self.speak_while_generating.get() and self.tts_backend:
+            speech_feed = SpeechFeed()
+            self.ui.post(self._start_tts, None, "AI response", speech_feed)
+        # The answer is shown in the chat as it is generated (new text is rendered at most once per UI tick)
+        chat_stream = StreamedText()
+        chat_stream_key = ("chat_stream", id(chat_stream))
+
+        def on_text(piece):
+            if speech_feed:
+                speech_feed.feed(piece)
+            chat_stream.feed(piece)
+            self.ui.post_latest(chat_stream_key, self._pump_streamed_chat, chat_stream)
+
+        delivered = False
+        self.study_prefetcher.begin_interactive() # Speculative work yields to this request
         try:
             # Send the request
-            response = requests.post(f"{self.ollama_base_url}/api/generate", json=payload, timeout=300) # Increased timeout for complex requests
-            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-            response_data = response.json()
+            request_start = time.monotonic()
+            queue_wait_seconds = request_start - enqueued_at if enqueued_at is not None else None
+            response_data = self.ollama_client.generate(model_name, full_prompt_for_ai, images=images_to_send,
+                                                        on_text=on_text) # 300 s timeout for complex requests
+            request_seconds = time.monotonic() - request_start
             ai_response_content = response_data.get('response', 'No content in AI response.').strip()
+            if speech_feed:
+                speech_feed.close() # Speak the final partial sentence
 
             # Schedule UI updates on the main thread
-            if self.root: self.root.after(0, self.add_to_chat, "AI", ai_response_content)
-            if self.root: self.root.after(0, self.update_status, f"AI ({model_name}) response received for '{request_label}'.")
+            self.ui.post(self._deliver_ai_response, ai_response_content, model_name, request_label,
+                         response_data, request_seconds, queue_wait_seconds, time.monotonic(),
+                         speech_feed is not None, chat_stream)
+            delivered = True
 
-            # Append the AI response to history *after* it's fully received
-            self.chat_conversation_history.append({"role": "assistant", "content": ai_response_content})
-            # Keep history length manageable (e.g., last 20 entries)
-            if len(self.chat_conversation_history) > 20:
-                self.chat_conversation_history = self.chat_conversation_history[-20:]
+            # Append the AI response to memory *after* it's fully received
+            self.conversation_memory.append("assistant", ai_response_content, doc_key=memory_doc_key)
+            if artifact_key is not None:
+                self.study_prefetcher.put_cached(artifact_key, ai_response_content)
+                self._save_artifact(artifact_doc_hash, artifact_key, ai_response_content)
 
         except requests.exceptions.Timeout:
             error_message = f"Request '{request_label}' to {model_name} timed out (waited 300 seconds)."
-            self.root.after(0, self.handle_error, error_message, "AI Timeout Error")
+            self.ui.post(self.handle_error, error_message, "AI Timeout Error")
             # Append error as assistant response in history
-            self.chat_conversation_history.append({"role": "assistant", "content": f"Error: {error_message}"})
+            self.conversation_memory.append("assistant", f"Error: {error_message}", doc_key=memory_doc_key)
         except requests.exceptions.RequestException as e:
             error_detail = f"Ollama API request error for '{request_label}': {str(e)}"
             if e.response is not None:
@@ -1117,15 +1531,99 @@ class PDFToSpeechApp:
                 except json.JSONDecodeError:
                     # If response is not JSON, append raw text
                     error_detail += f" - Server said: {e.response.text[:200]}..." # Limit length
-            self.root.after(0, self.handle_error, error_detail, "Ollama API Error")
+            self.ui.post(self.handle_error, error_detail, "Ollama API Error")
             # Append error as assistant response in history
-            self.chat_conversation_history.append({"role": "assistant", "content": f"Error: {error_detail}"})
+            self.conversation_memory.append("assistant", f"Error: {error_detail}", doc_key=memory_doc_key)
+        except OllamaGenerationError as e:
+            # Whatever was streamed before the failure stays in the chat but is not cached or saved
+            error_detail = f"Ollama failed during '{request_label}': {str(e)}"
+            self.ui.post(self.handle_error, error_detail, "Ollama API Error")
+            self.conversation_memory.append("assistant", f"Error: {error_detail}", doc_key=memory_doc_key)
         except Exception as e:
             # Catch any other unexpected errors during the request process
             unexpected_error = f"An unexpected error occurred during AI request '{request_label}': {str(e)}"
-            self.root.after(0, self.handle_error, unexpected_error, "Unexpected AI Error")
+            self.ui.post(self.handle_error, unexpected_error, "Unexpected AI Error")
              # Append error as assistant response in history
-            self.chat_conversation_history.append({"role": "assistant", "content": f"Error: {unexpected_error}"})
+            self.conversation_memory.append("assistant", f"Error: {unexpected_error}", doc_key=memory_doc_key)
+        finally:
+            self.study_prefetcher.end_interactive()
+            if speech_feed:
+                speech_feed.abort() # No-op after close(); on errors, drops the unfinished sentence
+            if not delivered:
+                self.ui.post(self._end_streamed_chat, chat_stream) # Keep whatever part of the answer arrived
+
+
+    def _deliver_ai_response(self, ai_response_content, model_name, request_label, response_data, request_seconds, queue_wait_seconds, posted_at, already_spoken=False, chat_stream=None):
+        """Main thread: shows (or completes the streamed) AI response and records the request's telemetry."""
+        ui_dispatch_seconds = time.monotonic() - posted_at # Time the response waited for the event loop
+        self.add_to_chat("AI", ai_response_content, auto_speak=not already_spoken, streamed=chat_stream)
+        record = self.request_telemetry.record(model_name, request_label, response_data, request_seconds,
+                                               queue_wait_seconds=queue_wait_seconds, ui_dispatch_seconds=ui_dispatch_seconds)
+        speed = f" ({record['tokens_per_s']:.1f} tok/s)" if record.get("tokens_per_s") else ""
+        self.update_status(f"AI ({model_name}) response received for '{request_label}'{speed}.")
+        self._update_telemetry_label(record)
+
+
+    def _end_streamed_chat(self, chat_stream):
+        """Main thread: completes a streamed response that failed part-way (if anything was shown)."""
+        self._pump_streamed_chat(chat_stream)
+        chat_stream.finished = True
+        if chat_stream.index is not None:
+            self.chat_transcript.end_live(chat_stream.index)
+
+
+    def _update_telemetry_label(self, record):
+        """Shows the latest request's model speed in the status bar."""
+        if hasattr(self.telemetry_label, 'config'):
+            self.telemetry_label.config(text=RequestTelemetry.format_status(record))
+
+
+    def show_request_statistics(self):
+        """Opens a window with rolling request percentiles per model and label."""
+        stats_win = tk.Toplevel(self.root)
+        stats_win.title("AI Request Statistics")
+        stats_win.transient(self.root)
+
+        columns = ("model", "label", "count", "total_p50", "total_p90", "tps_p50", "load_p90", "queue_p90", "ui_p90")
+        headings = ("Model", "Request", "N", "Total p50 (s)", "Total p90 (s)", "Tok/s p50", "Load p90 (s)", "Queue p90 (s)", "UI p90 (s)")
+        tree = ttk.Treeview(stats_win, columns=columns, show="headings", height=12)
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=150 if column in ("model", "label") else 90, anchor=tk.W if column in ("model", "label") else tk.E)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        def fmt(value, digits=2):
+            return f"{value:.{digits}f}" if value is not None else "-"
+
+        for row in self.request_telemetry.summary():
+            total = row["total_s"] if row["total_s"]["p50"] is not None else row["request_s"]
+            tree.insert("", tk.END, values=(row["model"], row["label"], row["count"], fmt(total["p50"]), fmt(total["p90"]),
+                                            fmt(row["tokens_per_s"]["p50"], 1), fmt(row["load_s"]["p90"]),
+                                            fmt(row["queue_wait_s"]["p90"], 3), fmt(row["ui_dispatch_s"]["p90"], 3)))
+
+        def export():
+            file_path = filedialog.asksaveasfilename(parent=stats_win, title="Export Request Telemetry",
+                                                     defaultextension=".jsonl", initialfile="learnmate_telemetry.jsonl",
+                                                     filetypes=[("JSON Lines", "*.jsonl"), ("All Files", "*.*")])
+            if not file_path: return
+            try:
+                count = self.request_telemetry.export_jsonl(file_path)
+                self.update_status(f"Exported {count} request record(s) to {os.path.basename(file_path)}.")
+            except OSError as e:
+                self.handle_error(f"Failed to export telemetry: {str(e)}", "Export Error")
+
+        # Tokens saved by normalizing the extracted text of each open document
+        for document in self.library.documents():
+            if document.text_stats:
+                ttk.Label(stats_win, text=f"{document.name}: {format_savings(document.text_stats)}", anchor=tk.W).pack(fill=tk.X, padx=10, pady=(0, 2))
+
+        # How responsive the Tk event loop has been (worker updates are applied on a fixed tick)
+        ttk.Label(stats_win, text=UIDispatcher.format_stats(self.ui.stats()), anchor=tk.W).pack(fill=tk.X, padx=10, pady=(0, 5))
+
+        buttons_frame = ttk.Frame(stats_win)
+        buttons_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+        ttk.Button(buttons_frame, text="Export JSONL...", command=export).pack(side=tk.LEFT)
+        ttk.Button(buttons_frame, text="Close", command=stats_win.destroy).pack(side=tk.RIGHT)
 
 
     def send_question_to_ai(self, event=None):
@@ -1145,7 +1643,8 @@ class PDFToSpeechApp:
 
         # Send the request in a separate thread
         threading.Thread(target=self._threaded_ollama_request,
-                         args=(f"General Question", user_question, None, True), # Label, user instruction, no images, include page context
+                         args=(f"General Question", user_question, None, True, time.monotonic()), # Label, user instruction, no images, include page context, enqueue time
+                         kwargs={"library_query": user_question}, # Relevant pages of all open documents are cited
                          daemon=True).start()
 
 
@@ -1191,10 +1690,26 @@ class PDFToSpeechApp:
         # Send the request in a separate thread.
         # We explicitly include page context here to help the AI relate the selected concept to the broader page.
         threading.Thread(target=self._threaded_ollama_request,
-                         args=("Concept Explanation", instruction_prompt, None, True), # Label, instruction, no images, include page context
+                         args=("Concept Explanation", instruction_prompt, None, True, time.monotonic()), # Label, instruction, no images, include page context, enqueue time
                          daemon=True).start()
 
 
+    def _build_study_material_request(self, material_type, page_num):
+        """Builds (request_label, user_log_message, ai_instruction) for a page, or None for an unknown type."""
+        return build_study_material_request(material_type, page_num, self.pdf_page_text_for_ai[page_num])
+
+
+    def _is_page_text_usable_for_study(self, page_num):
+        """Checks that a page has enough valid text to generate study material."""
+        return 0 <= page_num < len(self.pdf_page_text_for_ai) and is_page_text_usable_for_study(self.pdf_page_text_for_ai[page_num])
+
+
+    def _study_material_cache_key(self, material_type, page_num, model_name, personality_name):
+        """Cache key for speculative study material; changes if page text, model or personality change."""
+        text_hash = hashlib.sha1(self.pdf_page_text_for_ai[page_num].encode('utf-8', errors='ignore')).hexdigest()[:16]
+        return (model_name, personality_name, material_type, page_num, text_hash)
+
+
     def generate_study_material(self, material_type):
         """Generates summary, quiz, or key points for the current page."""
         if not (self.pdf_document and self.pdf_page_text_for_ai and 0 <= self.current_page_num < len(self.pdf_page_text_for_ai)):
@@ -1203,74 +1718,169 @@ class PDFToSpeechApp:
         page_text = self.pdf_page_text_for_ai[self.current_page_num]
         if len(page_text.strip()) < 100: # Increased minimum text length for meaningful output
             messagebox.showinfo("Not Enough Text", "The current page has too little text to generate meaningful study material (requires at least 100 characters of text)."); return
-        if page_text.startswith(("[No text found", "[Error extracting", "[Critical Extraction Error]")):
+        if page_text.startswith(INVALID_PAGE_TEXT_PREFIXES):
              messagebox.showinfo("Text Not Available", "Text for the current page is not available or could not be extracted."); return
 
-
-        user_log_message, ai_instruction = "", ""
-        request_label = ""
-
-        # Base instruction to include in all material requests
-        base_instruction = (f"Analyze the following text from a document page ({self.current_page_num + 1}). "
-                            f"Your task is to generate study material based *only* on the provided text. "
-                            f"Use clear, concise language suitable for learning. "
-                            f"Ensure coverage of all key points mentioned in the text.\n\n"
-                            f"Text to Analyze:\n\"\"\"\n{page_text[:4000]}\n\"\"\"\n\n") # Limit text length sent for analysis
-
-        if material_type == "summary":
-            request_label = "Summarize Page"
-            user_log_message = f"Summarize page {self.current_page_num + 1}"
-            ai_instruction = (f"{base_instruction}"
-                              f"Provide a comprehensive summary with the following structure, using Markdown:\n"
-                              f"**Summary of Page {self.current_page_num + 1}**\n"
-                              f"1.  **Main Topic(s):** (1-2 sentences)\n"
-                              f"2.  **Key Concepts/Ideas:** (Bulleted list of essential points)\n"
-                              f"3.  **Supporting Details/Arguments:** (Briefly mention key evidence or reasoning)\n"
-                              f"4.  **Conclusion or Outcome:** (What is the main takeaway?)\n"
-                              f"Keep the summary concise but informative.")
-
-        elif material_type == "quiz":
-            request_label = "Generate Quiz"
-            user_log_message = f"Generate quiz for page {self.current_page_num + 1}"
-            ai_instruction = (f"{base_instruction}"
-                              f"Create a 5-question quiz based on the text. Include a mix of question types.\n"
-                              f"For each question:\n"
-                              f"- State the question clearly.\n"
-                              f"- Indicate the question difficulty (Easy, Medium, Hard).\n"
-                              f"- Provide the answer.\n\n"
-                              f"Example format:\n"
-                              f"**Question 1 (Medium):** What is the primary function of X?\n"
-                              f"A) ... B) ... C) ... D) ...\n"
-                              f"**Answer:** B\n\n"
-                              f"**Question 2 (Easy):** True or False: Y is always Z.\n"
-                              f"**Answer:** False. Y can also be A under condition B.\n\n"
-                              f"**Question 3 (Hard):** Briefly explain the relationship between A and B.\n"
-                              f"**Sample Answer:** ...\n\n"
-                              f"Generate 5 questions following this approach, drawing only from the provided text.")
-
-        elif material_type == "key_points":
-            request_label = "Extract Key Points"
-            user_log_message = f"Extract key points for page {self.current_page_num + 1}"
-            ai_instruction = (f"{base_instruction}"
-                              f"Extract and list the most important key points, concepts, definitions, or facts from the text.\n"
-                              f"Organize them into a clear, hierarchical, or categorized list using Markdown.\n"
-                              f"Prioritize the information by significance within the text.\n"
-                              f"Aim for a comprehensive list that captures the essence of the page.")
-
-        else:
+        study_request = self._build_study_material_request(material_type, self.current_page_num)
+        if study_request is None:
             self.handle_error(f"Unknown study material type requested: {material_type}", "Internal Error"); return # Should not happen
-
+        request_label, user_log_message, ai_instruction = study_request
 
         self.add_to_chat("User", user_log_message)
 
+        # Serve speculatively precomputed material instantly if available
+        cache_key = self._study_material_cache_key(material_type, self.current_page_num,
+                                                   self.current_ollama_model.get(), self.selected_personality.get())
+        cached_response = self.study_prefetcher.get_cached(cache_key)
+        if cached_response:
+            print(f"[DEBUG] Serving '{request_label}' for page {self.current_page_num + 1} from speculative cache.") # Debug log
+            self.conversation_memory.append("user", self._history_text_for_request(request_label, ai_instruction))
+            self.conversation_memory.append("assistant", cached_response)
+            self.add_to_chat("AI", cached_response)
+            self.update_status(f"'{request_label}' served from precomputed cache.")
+            return
+
         # Send the request in a separate thread.
         # We explicitly tell the AI to use the provided text as context within the instruction,
         # so we set include_page_context=False in the prompt preparation to avoid duplication.
         threading.Thread(target=self._threaded_ollama_request,
-                         args=(request_label, ai_instruction, None, False), # Label, instruction, no images, DO NOT include page context (it's in the instruction)
+                         args=(request_label, ai_instruction, None, False, time.monotonic(), cache_key), # Label, instruction, no images, DO NOT include page context (it's in the instruction), enqueue time, cache key
+                         daemon=True).start()
+
+
+    # --- Speculative Study Material ---
+
+    def _schedule_study_prefetch(self):
+        """Queues speculative study material for the pages after the current one."""
+        model_name = self.current_ollama_model.get()
+        is_model_valid = model_name not in ["Loading...", "No Models Found", "Ollama Offline", "Ollama Timeout", "Error Fetching"] and bool(model_name)
+        if not (self.pdf_document and self.pdf_page_text_for_ai and is_model_valid and self.model_capabilities.get("reasoning", False)):
+            self.study_prefetcher.schedule([])
+            return
+
+        personality_name = self.selected_personality.get()
+        jobs = []
+        for page_num in range(self.current_page_num + 1, self.current_page_num + 1 + self.study_prefetcher.depth):
+            if not self._is_page_text_usable_for_study(page_num):
+                continue
+            for material_type in self.prefetch_material_types:
+                request_label, _, ai_instruction = self._build_study_material_request(material_type, page_num)
+                jobs.append({
+                    "key": self._study_material_cache_key(material_type, page_num, model_name, personality_name),
+                    "label": request_label,
+                    "model": model_name,
+                    "doc_hash": self.pdf_document_hash,
+                    # History is left out so the result does not depend on the conversation so far
+                    "prompt": self._prepare_ai_prompt_and_context(ai_instruction, include_page_context=False, include_history=False),
+                })
+        self.study_prefetcher.schedule(jobs)
+
+
+    def _speculative_generate(self, job, cancel_event):
+        """Runs on the prefetch worker thread. Streams the response so it can be abandoned mid-generation."""
+        request_start = time.monotonic()
+        response_data = self.ollama_client.generate(job["model"], job["prompt"], cancel_event=cancel_event)
+        if response_data is None:
+            return None
+        self.request_telemetry.record(job["model"], f"Speculative {job['label']}", response_data, time.monotonic() - request_start)
+        result = response_data['response'].strip()
+        self._save_artifact(job.get("doc_hash"), job["key"], result)
+        return result
+
+
+    # --- Structured Quizzes & Flashcards ---
+
+    def generate_structured_material(self, kind):
+        """Shows saved quiz questions/flashcards for the current page, generating them first if needed."""
+        if not (self.pdf_document and self.pdf_page_text_for_ai and 0 <= self.current_page_num < len(self.pdf_page_text_for_ai)):
+            messagebox.showinfo("Not Ready", "Please load a PDF and ensure text has been extracted for the current page."); return
+        if not self.study_item_store or not self.pdf_document_hash:
+            messagebox.showinfo("Not Available", "The study item database is not available."); return
+        if not self._is_page_text_usable_for_study(self.current_page_num):
+            messagebox.showinfo("Not Enough Text", "The current page has too little text to generate meaningful study material (requires at least 100 characters of text)."); return
+
+        kind_label = "quiz" if kind == "quiz" else "flashcards"
+        page_num = self.current_page_num
+        self.add_to_chat("User", f"Structured {kind_label} for page {page_num + 1}")
+
+        # Previously generated items are shown without calling the model
+        if page_num in self.study_item_store.pages_with_items(self.pdf_document_hash, kind):
+            self._show_structured_items(kind, page_num, from_cache=True)
+            return
+
+        # Batch the current page with the following pages that have no items yet
+        pages_done = self.study_item_store.pages_with_items(self.pdf_document_hash, kind)
+        candidate_pages = [(p, self.pdf_page_text_for_ai[p])
+                           for p in range(page_num, len(self.pdf_page_text_for_ai))
+                           if p == page_num or p not in pages_done][:self.structured_pages_per_request]
+        batch = batch_pages(candidate_pages, max_pages=self.structured_pages_per_request)[0]
+
+        personality_info = self.personalities.get(self.selected_personality.get(), self.personalities["Default Tutor"])
+        threading.Thread(target=self._structured_generation_worker,
+                         args=(kind, batch, self.current_ollama_model.get(), personality_info["system_prompt"],
+                               self.pdf_document_hash, os.path.basename(self.pdf_document_path or ""), page_num),
                          daemon=True).start()
 
 
+    def _structured_generation_worker(self, kind, batch, model_name, system_prompt, doc_hash, doc_name, display_page):
+        """Worker thread: generates one batch of structured items and stores them."""
+        import requests # For its exception types; already loaded by the client
+        page_list = ", ".join(str(p + 1) for p, _ in batch)
+        self.update_status(f"Generating structured {kind} for page(s) {page_list} with {model_name}...")
+        self.study_prefetcher.begin_interactive()
+        try:
+            request_start = time.monotonic()
+            items, response_data = generate_structured_items(self.ollama_client, model_name, kind, batch, system_prompt)
+            self.request_telemetry.record(model_name, f"Structured {kind}", response_data, time.monotonic() - request_start)
+            if not items:
+                self.ui.post(self.handle_error, f"The model did not return any usable {kind} items. Try again or choose another model.", "Structured Output Error")
+                return
+            self.study_item_store.add_items(doc_hash, doc_name, kind, items, model_name)
+            if doc_hash == self.pdf_document_hash: # Document may have changed while generating
+                self.ui.post(self._show_structured_items, kind, display_page, False)
+        except (requests.exceptions.RequestException, OllamaGenerationError) as e:
+            self.ui.post(self.handle_error, f"Ollama API request error for structured {kind}: {str(e)}", "Ollama API Error")
+        except Exception as e:
+            self.ui.post(self.handle_error, f"An unexpected error occurred during structured {kind} generation: {str(e)}", "Unexpected AI Error")
+        finally:
+            self.study_prefetcher.end_interactive()
+
+
+    def _show_structured_items(self, kind, page_num, from_cache):
+        """Displays stored items for one page in the chat (main thread)."""
+        items = self.study_item_store.query(doc_hash=self.pdf_document_hash, kind=kind, pages=[page_num])
+        if not items:
+            self.add_to_chat("System", f"No {kind} items saved for page {page_num + 1}.", "system")
+            return
+        self.add_to_chat("AI", format_items_markdown(items))
+        source = "saved database" if from_cache else "model"
+        self.update_status(f"{len(items)} {kind} item(s) for page {page_num + 1} loaded from {source}.")
+
+
+    def export_structured_items(self):
+        """Exports all saved quiz questions and flashcards for the current document to CSV or Anki text."""
+        if not self.study_item_store or not self.pdf_document_hash:
+            messagebox.showinfo("Not Available", "Load a PDF first."); return
+        items = self.study_item_store.query(doc_hash=self.pdf_document_hash)
+        if not items:
+            messagebox.showinfo("Nothing to Export", "No quiz questions or flashcards have been generated for this document yet."); return
+
+        base_name = os.path.splitext(os.path.basename(self.pdf_document_path or "study_items"))[0]
+        file_path = filedialog.asksaveasfilename(title="Export Quiz & Flashcards",
+                                                 initialfile=f"{base_name}_cards",
+                                                 defaultextension=".csv",
+                                                 filetypes=[("CSV", "*.csv"), ("Anki text import", "*.txt")])
+        if not file_path: return
+        try:
+            if file_path.lower().endswith(".txt"):
+                export_anki(items, file_path)
+            else:
+                export_csv(items, file_path)
+            self.update_status(f"Exported {len(items)} item(s) to {os.path.basename(file_path)}.")
+        except OSError as e:
+            self.handle_error(f"Failed to export study items: {str(e)}", "Export Error")
+
+
     def explain_selected_code(self):
         """Explains the currently selected code snippet using the AI."""
         if not (self.pdf_document and self.pdf_page_text_for_ai and 0 <= self.current_page_num < len(self.pdf_page_text_for_ai)):
@@ -1294,21 +1904,21 @@ class PDFToSpeechApp:
         try:
             # Attempt to get selected text
             selected_text = self.page_text_scrolledtext.get(tk.SEL_FIRST, tk.SEL_LAST).strip()
-            if not selected_text:
-                messagebox.showinfo("Selection Needed", "Please select a code snippet from the 'Page Text' panel to explain."); return
-            if len(selected_text) < 10: # Minimum length for code
-                 messagebox.showinfo("Selection Too Short", "Please select a more substantial code snippet."); return
-
-            # Simple heuristic check if selection *looks* like code (optional)
-            # if not self.detect_code_blocks(selected_text):
-            #      confirm = messagebox.askyesno("Unusual Selection", "The selected text does not appear to be code. Do you want to attempt explaining it anyway?")
-            #      if not confirm: return
-
         except tk.TclError:
-            messagebox.showinfo("Selection Needed", "Please select a code snippet from the 'Page Text' panel first."); return
+            selected_text = "" # Nothing selected
         except Exception as e:
             self.handle_error(f"Error getting selected text for code explanation: {str(e)}", "Selection Error"); return
 
+        if not selected_text:
+            # Without a selection, the code found on the page during extraction (monospace text) is explained
+            code_blocks = [text for _, text in layout_blocks(self.pdf_page_text_for_ai[self.current_page_num],
+                                                             self._page_layout(self.current_page_num), "code")]
+            if not code_blocks:
+                messagebox.showinfo("Selection Needed", "No code was found on this page. Please select a code snippet from the 'Page Text' panel to explain."); return
+            selected_text = "\n\n".join(code_blocks)[:4000]
+        if len(selected_text) < 10: # Minimum length for code
+             messagebox.showinfo("Selection Too Short", "Please select a more substantial code snippet."); return
+
 
         # Add user request log entry to chat history
         self.add_to_chat("User", f"Explain code: ```\n{selected_text[:100]}...\n```")
@@ -1332,13 +1942,19 @@ class PDFToSpeechApp:
 
         # Send the request in a separate thread
         threading.Thread(target=self._threaded_ollama_request,
-                         args=("Code Explanation", instruction_prompt, None, False), # Label, instruction, no images, DO NOT include page context
+                         args=("Code Explanation", instruction_prompt, None, False, time.monotonic()), # Label, instruction, no images, DO NOT include page context, enqueue time
                          daemon=True).start()
 
 
     def analyze_images_on_current_page(self):
-        """Analyzes images on the current page using a vision-capable AI model."""
-        if not (self.pdf_document and self.pdf_page_text_for_ai and 0 <= self.current_page_num < len(self.pdf_page_text_for_ai) and 0 <= self.current_page_num < len(self.pdf_page_images)):
+        """
+        Analyzes the figures on the current page using a vision-capable AI model. With "Render Figures",
+        figure regions (vector drawings and image placements) are rendered; otherwise, or if the page has
+        no figure regions, the embedded images are sent.
+        """
+        render_figures = self.vision_render_figures.get()
+        if not (self.pdf_document and self.pdf_page_text_for_ai and 0 <= self.current_page_num < len(self.pdf_page_text_for_ai)
+                and (render_figures or 0 <= self.current_page_num < len(self.pdf_page_images))):
              messagebox.showinfo("Not Ready", "Please load a PDF and ensure images have been extracted."); return
 
         current_model_name = self.current_ollama_model.get()
@@ -1351,32 +1967,74 @@ class PDFToSpeechApp:
             return # Stop if model does not support vision
 
 
-        images_base64 = self.pdf_page_images[self.current_page_num]
-        if not images_base64:
+        images_base64 = self.pdf_page_images[self.current_page_num] if self.current_page_num < len(self.pdf_page_images) else []
+        if not images_base64 and not render_figures:
             messagebox.showinfo("No Images", f"No images were found or successfully extracted from page {self.current_page_num + 1} for analysis.");
             self.update_status("No images found on current page.")
             return
 
+        if render_figures:
+            self.update_status("Rendering the figures on the current page for analysis...")
+            self.add_to_chat("User", f"Analyze the figures on page {self.current_page_num + 1}")
+        else:
+            self.update_status(f"Preparing {len(images_base64)} image(s) from current page for analysis...")
+            self.add_to_chat("User", f"Analyze {len(images_base64)} image(s) on page {self.current_page_num + 1}")
+        # Rendering, decoding and resizing run off the main thread, followed by the request itself
+        threading.Thread(target=self._analyze_images_worker,
+                         args=(self.active_document, images_base64, self.current_page_num, render_figures, time.monotonic()),
+                         daemon=True).start()
+
+    def _render_figure_regions(self, document, page_num):
+        """Worker thread: renders the figure regions of a page (cached per page, region and DPI) as base64 PNGs."""
+        if document is None or self.library.find(document.path) is not document:
+            return []
+        with self.library.using(document) as pdf_handle:
+            page = pdf_handle.load_page(page_num)
+            return [base64.b64encode(self.region_render_cache.render(page, document.path, region, self.figure_render_dpi)).decode("ascii")
+                    for region in find_figure_regions(page)]
+
+    def _analyze_images_worker(self, document, images_base64, page_num, render_figures, enqueued_at):
+        """Worker thread: collects the page's figures, shrinks them for the vision model (see vision_images) and sends the request."""
+        image_kind = "image"
+        if render_figures:
+            try:
+                rendered = self._render_figure_regions(document, page_num)
+            except Exception as e:
+                print(f"[DEBUG] Could not render the figures of page {page_num + 1}: {e}") # Debug log
+                rendered = []
+            if rendered:
+                images_base64, image_kind = rendered, "figure"
+        if not images_base64:
+            self.ui.post(self.add_to_chat, "System", f"No figures or images were found on page {page_num + 1}.", "system")
+            self.update_status("No images found on current page.")
+            return
+        try:
+            images_base64, stats = prepare_vision_images(images_base64)
+        except Exception as e:
+            self.ui.post(self.handle_error, f"Could not prepare the images for analysis: {e}", "Image Analysis Error")
+            return
+        print(f"[DEBUG] Vision payload for page {page_num + 1}: {format_vision_savings(stats)}") # Debug log
+        self.ui.post(self.add_to_chat, "System", f"Images: {format_vision_savings(stats)}.", "system")
+        if not images_base64:
+            self.update_status(f"No images on page {page_num + 1} are large enough to analyze.")
+            return
         num_images_found = len(images_base64)
-        self.update_status(f"Analyzing {num_images_found} image(s) from current page...");
-        self.add_to_chat("User", f"Analyze {num_images_found} image(s) on page {self.current_page_num + 1}")
 
         # Construct the specific instruction for the AI
-        instruction_prompt = (f"Analyze the following {num_images_found} image(s) from a document page ({self.current_page_num + 1}).\n"
-                              f"For each image:\n"
+        source = "figure(s) rendered from" if image_kind == "figure" else "image(s) from"
+        instruction_prompt = (f"Analyze the following {num_images_found} {source} a document page ({page_num + 1}).\n"
+                              f"For each {image_kind}:\n"
                               f"- Provide a detailed description of the visual content.\n"
                               f"- Explain any text visible in the image (e.g., labels, diagrams).\n"
                               f"- If it's a technical diagram, chart, or graph, explain its purpose and key information.\n"
                               f"- Connect the image content to the surrounding text context from the page (if available).\n" # The page text is included via _prepare_ai_prompt_and_context
                               f"- Highlight any key insights or patterns the image conveys.\n\n"
-                              f"Present the analysis clearly, referring to each image. Use Markdown for formatting.")
+                              f"Present the analysis clearly, referring to each {image_kind}. Use Markdown for formatting.")
 
 
-        # Send the request in a separate thread.
         # Include page context here to help the AI connect images to the text.
-        threading.Thread(target=self._threaded_ollama_request,
-                         args=(f"Image Analysis ({num_images_found})", instruction_prompt, images_base64, True), # Label, instruction, images list, include page context
-                         daemon=True).start()
+        label = f"Figure Analysis ({num_images_found})" if image_kind == "figure" else f"Image Analysis ({num_images_found})"
+        self._threaded_ollama_request(label, instruction_prompt, images_base64, True, enqueued_at)
 
 
     # --- Helper Methods ---
@@ -1387,48 +2045,6 @@ class PDFToSpeechApp:
              return self.pdf_page_text_for_ai[self.current_page_num].strip()[:max_len]
         return "" # Return empty string if no PDF, text not extracted, or invalid page
 
-    def detect_code_blocks(self, text):
-        """
-        Simple heuristic to detect potential code blocks in text.
-        Returns a list of suspected code blocks.
-        """
-        if not text: return []
-        # Look for common code indicators within lines or paragraphs
-        code_indicators = ["def ", "class ", "import ", "function ", "var ", "const ", "<?php", "<html>", "<script>", "public ", "private ", "void ", "int ", "string ", "if (", "for (", "while (", "try {", "{", "}", ";", "//", "#"]
-        potential_blocks = []
-        current_block = []
-        in_potential_block = False
-
-        lines = text.split('\n')
-        for line in lines:
-             stripped_line = line.strip()
-             # A line with significant leading whitespace or containing indicators might be code
-             is_code_line = (len(line) - len(stripped_line) > 4 or # Significant indentation
-                             any(indicator in stripped_line for indicator in code_indicators) or
-                             (stripped_line.startswith(('{', '}', '[', ']', '(', ')')) and len(stripped_line) < 10)) # Code structure on a line
-
-             if is_code_line or in_potential_block:
-                 current_block.append(line)
-                 in_potential_block = True
-                 # Simple way to potentially end a block: a blank line or a line that clearly isn't code after indentation check
-                 if not stripped_line and len(current_block) > 1: # Blank line ends block
-                      potential_blocks.append("\n".join(current_block).strip())
-                      current_block = []
-                      in_potential_block = False
-                 elif in_potential_block and not is_code_line and len(line) - len(stripped_line) <= 4 and stripped_line:
-                      # Line with little indentation and no indicators after being in a block
-                      if len(current_block) > 1: potential_blocks.append("\n".join(current_block[:-1]).strip()) # Add previous lines
-                      current_block = [line] # Start new block with current line
-                      in_potential_block = False # Reset block status (might start a new one next line)
-
-
-        # Add the last block if it's not empty
-        if current_block:
-             potential_blocks.append("\n".join(current_block).strip())
-
-        # Filter out very short "blocks" that are likely not code
-        return [block for block in potential_blocks if len(block) > 20] # Require minimum length
-
 
     # --- TTS Implementation ---
 
@@ -1438,42 +2054,34 @@ class PDFToSpeechApp:
             messagebox.showinfo("Not Ready", "Load a PDF and ensure text is extracted for TTS."); return
 
         text_to_speak = self.pdf_page_text_for_ai[self.current_page_num]
-        if not text_to_speak.strip() or text_to_speak.startswith(("[No text found", "[Error extracting", "[Critical Extraction Error]")):
+        if not text_to_speak.strip() or text_to_speak.startswith(INVALID_PAGE_TEXT_PREFIXES):
             messagebox.showinfo("No Text", "No valid text on the current page to speak."); return
 
-        self.stop_current_page_tts() # Stop any ongoing TTS playback
+        self._start_tts(text_to_speak, f"page {self.current_page_num + 1}")
 
-        self.update_status(f"Generating speech for page {self.current_page_num + 1}...")
 
-        try:
-            selected_voice_id = self.selected_voice.get()
-
-            # Create a temporary file to save the audio
-            # Use delete=False to keep the file after the tempfile object is closed
-            # It will be explicitly deleted later.
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmpfile:
-                self.temp_audio_filename = tmpfile.name
-
-            # Command to generate audio using edge-tts
-            # subprocess.run will handle quoting arguments correctly
-            command = [
-                "edge-tts",
-                "--voice", selected_voice_id,
-                "--text", text_to_speak,
-                "--write-media", self.temp_audio_filename
-            ]
-
-            # Run TTS generation in a separate thread to avoid blocking the UI
-            threading.Thread(target=self._run_tts_command_and_play, args=(command, f"page {self.current_page_num + 1}"), daemon=True).start()
-
-        except FileNotFoundError:
-            self.handle_error("edge-tts command not found. Ensure it's installed (`pip install edge-tts`) and in your system's PATH.", "TTS Error")
-            self._cleanup_temp_audio_file() # Clean up the failed temp file
-            self._update_tts_button_states() # Update buttons after error
-        except Exception as e:
-            self.handle_error(f"Failed to prepare TTS for page {self.current_page_num + 1}: {str(e)}", "TTS Preparation Error")
-            self._cleanup_temp_audio_file() # Clean up the failed temp file
-            self._update_tts_button_states() # Update buttons after error
+    def start_continuous_read_aloud(self):
+        """
+        Reads the document aloud from the current page onwards. The next page is synthesized
+        while the current one plays, and the view follows the page being read.
+        """
+        if not (self.pdf_document and self.pdf_page_text_for_ai and 0 <= self.current_page_num < len(self.pdf_page_text_for_ai)):
+            messagebox.showinfo("Not Ready", "Load a PDF and ensure text is extracted for TTS."); return
+
+        start_page = self.current_page_num
+        self._start_tts(None, f"pages from {start_page + 1}",
+                        segments=self._read_aloud_segments(self.active_document, start_page))
+
+
+    def _read_aloud_segments(self, document, start_page):
+        """Yields (page_index, text) for continuous read-aloud; pulled lazily from the TTS pipeline thread."""
+        page_index = start_page
+        # Stop as soon as another document is shown
+        while document is self.active_document and page_index < len(document.page_texts):
+            text = document.page_texts[page_index]
+            if text.strip() and not text.startswith(INVALID_PAGE_TEXT_PREFIXES):
+                yield page_index, text
+            page_index += 1
 
 
     def play_last_ai_response(self):
@@ -1482,176 +2090,96 @@ class PDFToSpeechApp:
             messagebox.showinfo("No Response", "No AI response available to speak.")
             return
 
-        self.stop_current_page_tts()  # Stop any existing playback
-
-        self.update_status("Generating speech for AI response...")
-
-        try:
-            selected_voice_id = self.selected_voice.get()
-
-            # Create temp file
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmpfile:
-                self.temp_audio_filename = tmpfile.name
-
-            # Command to generate audio
-            command = [
-                "edge-tts",
-                "--voice", selected_voice_id,
-                "--text", self.last_ai_response, # Use the stored last AI response
-                "--write-media", self.temp_audio_filename
-            ]
-
-            # Run TTS generation in a separate thread
-            threading.Thread(target=self._run_tts_command_and_play, args=(command, "AI response"), daemon=True).start()
-
-        except FileNotFoundError:
-             self.handle_error("edge-tts command not found. Ensure it's installed and in your system's PATH.", "TTS Error")
-             self._cleanup_temp_audio_file()
-             self._update_tts_button_states() # Update buttons after error
-        except Exception as e:
-            self.handle_error(f"Failed to prepare TTS for AI response: {str(e)}", "TTS Preparation Error")
-            self._cleanup_temp_audio_file()
-            self._update_tts_button_states() # Update buttons after error
-
-
-    def _run_tts_command_and_play(self, command, content_description):
-        """Runs the edge-tts command and then plays the resulting audio file."""
-        try:
-            print(f"[DEBUG] Executing TTS generation command: {' '.join(subprocess.list2cmdline(command))}") # Log command
-
-            # Run TTS generation using subprocess.run
-            # capture_output=True to get stderr/stdout for better error messages
-            # text=True to decode stdout/stderr as text
-            # check=False so we can handle non-zero exit codes ourselves
-            # creationflags to hide the console window on Windows
-            creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-
-            result = subprocess.run(command, capture_output=True, text=True, check=False, encoding='utf-8', errors='ignore', creationflags=creationflags)
-
-            print(f"[DEBUG] TTS generation completed with code: {result.returncode}") # Debug log
-            if result.returncode != 0:
-                 # Handle TTS generation errors
-                 error_msg = f"Failed to generate speech for {content_description} (edge-tts exited with code {result.returncode})."
-                 if result.stderr:
-                     print(f"[DEBUG] TTS stderr: {result.stderr.strip()}") # Debug log
-                     error_msg += f"\nStderr: {result.stderr.strip()[:300]}..." # Limit length
-                 elif result.stdout:
-                     print(f"[DEBUG] TTS stdout: {result.stdout.strip()}") # Debug log
-                     error_msg += f"\nStdout: {result.stdout.strip()[:300]}..." # Limit length
-
-                 self.root.after(0, self.handle_error, error_msg, "TTS Generation Failed")
-                 self._cleanup_temp_audio_file() # Clean up potentially created partial file
-                 self.root.after(0, self._update_tts_button_states) # Update buttons after error
-                 return
-
-            # Check if the audio file was actually created and has content
-            if not self.temp_audio_filename or not os.path.exists(self.temp_audio_filename) or os.path.getsize(self.temp_audio_filename) == 0:
-                 error_msg = f"TTS generation completed, but output file is missing or empty: {self.temp_audio_filename}"
-                 self.root.after(0, self.handle_error, error_msg, "TTS Output Error")
-                 self._cleanup_temp_audio_file()
-                 self.root.after(0, self._update_tts_button_states)
-                 return
-
-
-            # Play audio file - needs to happen on the main thread or managed externally
-            if self.root: self.root.after(0, self._play_audio_file, self.temp_audio_filename, content_description)
-
-        except FileNotFoundError:
-            # This specific error means the 'edge-tts' executable itself wasn't found in PATH
-            self.root.after(0, self.handle_error, "edge-tts command not found. Ensure it's installed and in your system's PATH.", "TTS Error")
-            self._cleanup_temp_audio_file()
-            self.root.after(0, self._update_tts_button_states)
-        except Exception as e:
-            # Catch any other unexpected errors during the process
-            self.root.after(0, self.handle_error, f"An unexpected error occurred during TTS generation: {str(e)}", "Unexpected TTS Error")
-            self._cleanup_temp_audio_file()
-            self.root.after(0, self._update_tts_button_states)
+        self._start_tts(self.last_ai_response, "AI response")
 
 
-    def _play_audio_file(self, filename, content_description):
-        """Platform-independent audio playback using ffplay."""
-        if not filename or not os.path.exists(filename):
-            self.root.after(0, self.update_status, "Audio file not found for playback.")
+    def _start_tts(self, text, content_description, segments=None):
+        """
+        Starts pipelined TTS for `text` (or for `segments`, (tag, text) pairs read back-to-back);
+        playback begins once the first sentence is synthesized.
+        """
+        if self.tts_backend is None:
+            self.handle_error("No text-to-speech engine is available. Install edge-tts (`pip install edge-tts`) or espeak-ng.", "TTS Error")
+            return
+        if not self._is_ffplay_available():
+            self._show_ffmpeg_install_instructions()
             self._update_tts_button_states()
             return
 
+        self.update_status(f"Generating speech for {content_description}...")
         try:
-            # Check if ffplay is available
-            if not self._is_ffplay_available():
-                self.root.after(0, self._show_ffmpeg_install_instructions)
-                self._cleanup_temp_audio_file() # Clean up the generated file if ffplay is missing
-                self._update_tts_button_states()
-                return
+            if segments is not None:
+                self.tts_pipeline.speak_segments(segments, self.selected_voice.get(), content_description, segment_lookahead=1)
+            else:
+                self.tts_pipeline.speak(text, self.selected_voice.get(), content_description)
+        except Exception as e:
+            self.handle_error(f"Failed to prepare TTS for {content_description}: {str(e)}", "TTS Preparation Error")
+        self.request_button_refresh()
 
-            # Command to play audio using ffplay
-            command = [
-                "ffplay",
-                "-nodisp",  # No visual display
-                "-autoexit", # Exit when playback finishes
-                "-loglevel", "warning", # Suppress verbose output, show warnings/errors
-                filename
-            ]
-
-            # Platform-specific adjustments for subprocess creation
-            creationflags = 0
-            if sys.platform == 'win32':
-                creationflags = subprocess.CREATE_NO_WINDOW # Hide the console window
-
-            print(f"[DEBUG] Executing audio playback command: {' '.join(subprocess.list2cmdline(command))}") # Log command
-
-            # Use Popen to run in the background and get a process object
-            self.tts_process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE, # Capture stdout
-                stderr=subprocess.PIPE, # Capture stderr
-                creationflags=creationflags
-            )
-
-            # Update UI elements on the main thread
-            self.root.after(0, lambda: [
-                self.play_tts_btn.config(state=tk.DISABLED),
-                self.play_ai_tts_btn.config(state=tk.DISABLED),
-                self.stop_tts_btn.config(state=tk.NORMAL), # Enable stop button
-                self.update_status(f"Playing {content_description}...")
-            ])
 
-            # Start a thread to monitor the playback process
-            threading.Thread(target=self._monitor_playback_process, args=(self.tts_process, content_description), daemon=True).start()
+    def _synthesize_speech_chunk(self, text, voice):
+        """
+        Returns the audio for one chunk of text, from the audio cache or the TTS backend.
+        Runs on TTS pipeline worker threads.
+        """
+        backend = self.tts_backend
+        audio_bytes = self.tts_audio_cache.get(backend.name, voice, text)
+        if audio_bytes is None:
+            audio_bytes = backend.synthesize(text, voice)
+            self.tts_audio_cache.put(backend.name, voice, text, audio_bytes)
+        return audio_bytes
 
-        except FileNotFoundError:
-            # This specific error means 'ffplay' executable was not found
-            self.root.after(0, self._show_ffmpeg_install_instructions)
-            self._cleanup_temp_audio_file()
-            self._update_tts_button_states()
-        except Exception as e:
-            error_msg = f"Failed to start playback process for {content_description}: {str(e)}"
-            self.root.after(0, self.handle_error, error_msg, "Playback Error")
-            self._cleanup_temp_audio_file()
-            self._update_tts_button_states()
+
+    def _stream_speech_chunk(self, text, voice):
+        """
+        Yields the audio for one chunk as the TTS backend produces it (or the cached audio at once).
+        The audio is cached only if the stream was consumed completely. Runs on a TTS pipeline thread.
+        """
+        backend = self.tts_backend
+        audio_bytes = self.tts_audio_cache.get(backend.name, voice, text)
+        if audio_bytes is not None:
+            yield audio_bytes
+            return
+        pieces = []
+        for piece in backend.synthesize_stream(text, voice):
+            pieces.append(piece)
+            yield piece
+        self.tts_audio_cache.put(backend.name, voice, text, b"".join(pieces))
+
+
+    def _on_tts_event(self, kind, content_description, detail):
+        """TTS pipeline callback (worker thread): forwards the event to the main thread."""
+        if self.root:
+            self.ui.post(self._handle_tts_event, kind, content_description, detail)
+
+
+    def _handle_tts_event(self, kind, content_description, detail):
+        """Updates status and buttons for a TTS pipeline event (main thread)."""
+        print(f"[DEBUG] TTS event '{kind}' for {content_description}") # Debug log
+        if kind == "playing":
+            self.update_status(f"Playing {content_description}...")
+        elif kind == "segment":
+            # Continuous read-aloud moved on to another page: follow it
+            if isinstance(detail, int) and self.pdf_document and 0 <= detail < self.pdf_document.page_count:
+                if detail != self.current_page_num:
+                    self.current_page_num = detail
+                    self.render_current_pdf_page()
+                self.update_status(f"Reading page {detail + 1} aloud...")
+            return
+        elif kind == "finished":
+            self.update_status(f"Audio playback finished for {content_description}.")
+        elif kind == "stopped":
+            self.update_status("Audio playback stopped.")
+        elif kind == "player_missing":
+            self.capabilities.invalidate("ffplay") # Re-probe next time
+            self._show_ffmpeg_install_instructions()
+        elif kind == "error":
+            self.handle_error(f"Text-to-speech failed for {content_description}: {detail}", "TTS Error")
+        self.request_button_refresh()
 
     def _is_ffplay_available(self):
-        """Checks if ffplay executable is available in the system PATH."""
-        try:
-            # Run ffplay with a simple command that should succeed if it exists
-            # Use check=True to raise CalledProcessError on non-zero exit
-            # Use DEVNULL to suppress output
-            # creationflags to hide window on Windows
-            creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-            subprocess.run(
-                ["ffplay", "-version"],
-                check=True,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                creationflags=creationflags
-            )
-            print("[DEBUG] ffplay check passed.") # Debug log
-            return True
-        except (FileNotFoundError, subprocess.CalledProcessError):
-            print("[DEBUG] ffplay check failed: FileNotFoundError or CalledProcessError.") # Debug log
-            return False
-        except Exception as e:
-            print(f"[DEBUG] Unexpected error during ffplay check: {e}") # Debug log
-            return False
+        """Checks if ffplay is available (cached by the capability registry; only probes when ffplay changed)."""
+        return self.capabilities.is_available("ffplay", timeout=10)
 
     def _show_ffmpeg_install_instructions(self):
         """Displays instructions for installing FFmpeg (which includes ffplay)."""
@@ -1708,75 +2236,14 @@ class PDFToSpeechApp:
         install_win.focus_set() # Set focus to the new window
 
 
-    def _monitor_playback_process(self, process, content_description):
-        """Monitors the TTS playback subprocess and updates button states when it finishes."""
-        print(f"[DEBUG] Monitoring playback process for {content_description}...") # Debug log
-        try:
-            # Wait for the process to finish and capture output
-            stdout, stderr = process.communicate()
-            returncode = process.returncode
-
-            print(f"[DEBUG] Playback process for {content_description} finished with code: {returncode}") # Debug log
-            if stdout: print(f"[DEBUG] Playback stdout:\n{stdout.decode()}")
-            if stderr: print(f"[DEBUG] Playback stderr:\n{stderr.decode()}")
-
-
-            # Schedule UI updates on the main thread
-            if self.root: self.root.after(0, self._playback_finished, content_description, returncode, stderr.decode() if stderr else None)
-
-        except Exception as e:
-            print(f"Error monitoring playback process: {e}")
-            # Ensure UI updates happen on the main thread even if monitoring fails
-            if self.root: self.root.after(0, self._playback_finished, content_description, -1, f"Monitoring error: {e}") # Use -1 to indicate monitoring failure
-
-
-    def _playback_finished(self, content_description, returncode, stderr):
-        """Called on the main thread when playback subprocess finishes."""
-        print(f"[DEBUG] Main thread received playback finished signal for {content_description}.") # Debug log
-        self.tts_process = None # Clear the process reference immediately
-        self._cleanup_temp_audio_file() # Clean up the temp file
-
-        if returncode == 0:
-             self.update_status(f"Audio playback finished for {content_description}.")
-        else:
-             error_msg = f"Playback of {content_description} failed or ended with error (code {returncode})."
-             if stderr:
-                  error_msg += f"\nDetails: {stderr.strip()[:200]}..."
-             self.update_status(error_msg)
-             # Optionally add error to chat if it's a significant playback failure
-             # self.add_to_chat("System", error_msg, "system")
-
-
-        # Update buttons to the correct state (enabling play buttons, disabling stop)
-        self._update_tts_button_states()
-
-
     def stop_current_page_tts(self):
-        """Stops the currently running TTS playback process."""
-        if self.tts_process and self.tts_process.poll() is None: # Check if process exists and is still running
-            try:
-                print("[DEBUG] Attempting to stop TTS process...") # Debug log
-                # Terminate the process gracefully first
-                self.tts_process.terminate()
-                try:
-                    # Wait a bit for termination, then kill if needed
-                    # Use a timeout to avoid hanging indefinitely
-                    self.tts_process.wait(timeout=0.5) # Wait up to 0.5 seconds
-                    print("[DEBUG] TTS process terminated gracefully.") # Debug log
-                except subprocess.TimeoutExpired:
-                    self.tts_process.kill() # Force kill if termination hangs
-                    print("[DEBUG] TTS process killed.") # Debug log
-            except Exception as e:
-                print(f"Error stopping TTS process: {e}")
-            finally:
-                # Ensure process reference is cleared and UI updated
-                self.tts_process = None
-                self._cleanup_temp_audio_file()
-                self.update_status("Audio playback stopped.")
-                self._update_tts_button_states() # Update buttons after stopping
+        """Stops the current TTS synthesis and playback."""
+        if self.tts_pipeline.stop():
+            print("[DEBUG] TTS playback stopped.") # Debug log
+            self.update_status("Audio playback stopped.")
         else:
-             print("[DEBUG] No active TTS process to stop.") # Debug log
-
+            print("[DEBUG] No active TTS playback to stop.") # Debug log
+        self._update_tts_button_states()
 
     def _update_tts_button_states(self):
         """Updates the states of the TTS and Voice Query buttons."""
@@ -1784,55 +2251,29 @@ class PDFToSpeechApp:
         # Check if the current page text is valid (not just an error/placeholder)
         current_page_has_text = is_pdf_loaded and 0 <= self.current_page_num < len(self.pdf_page_text_for_ai) and \
                                 self.pdf_page_text_for_ai[self.current_page_num].strip() and \
-                                not self.pdf_page_text_for_ai[self.current_page_num].startswith(("[No text found", "[Error extracting", "[Critical Extraction Error]"))
+                                not self.pdf_page_text_for_ai[self.current_page_num].startswith(INVALID_PAGE_TEXT_PREFIXES)
 
         has_ai_response = bool(self.last_ai_response.strip()) # Check if last AI response has actual text
-        is_playing = self.tts_process is not None and self.tts_process.poll() is None # Check if a playback process is active and running
+        is_playing = self.tts_pipeline.is_active() # Check if speech is being synthesized or played
 
 
         # Update Play Page button: Enabled if page has text AND not currently playing
-        if hasattr(self.play_tts_btn, 'config'):
-            self.play_tts_btn.config(state=tk.NORMAL if current_page_has_text and not is_playing else tk.DISABLED)
+        self._configure_if_changed(self.play_tts_btn, state=tk.NORMAL if current_page_has_text and not is_playing else tk.DISABLED)
+
+        self._configure_if_changed(self.read_aloud_btn, state=tk.NORMAL if current_page_has_text and not is_playing else tk.DISABLED)
 
         # Update Play AI button: Enabled if there's an AI response AND not currently playing
-        if hasattr(self.play_ai_tts_btn, 'config'):
-            self.play_ai_tts_btn.config(state=tk.NORMAL if has_ai_response and not is_playing else tk.DISABLED)
+        self._configure_if_changed(self.play_ai_tts_btn, state=tk.NORMAL if has_ai_response and not is_playing else tk.DISABLED)
 
         # Update Stop button: Enabled only if currently playing
-        if hasattr(self.stop_tts_btn, 'config'):
-            self.stop_tts_btn.config(state=tk.NORMAL if is_playing else tk.DISABLED)
+        self._configure_if_changed(self.stop_tts_btn, state=tk.NORMAL if is_playing else tk.DISABLED)
 
         # Update Voice Query button: Enabled if SpeechRecognition is available AND a model is ready AND not currently playing
         is_model_valid = self.current_ollama_model.get() not in ["Loading...", "No Models Found", "Ollama Offline", "Ollama Timeout", "Error Fetching"] and bool(self.current_ollama_model.get())
-        if hasattr(self.voice_query_btn, 'config'):
-             self.voice_query_btn.config(
-                 state=tk.NORMAL if self.voice_query_available and is_model_valid and not is_playing else tk.DISABLED,
-                 text="🎙️ Voice Query" if not is_playing else "🎙️ ..." # Change text while listening
-             )
-
-
-    def _cleanup_temp_audio_file(self):
-        """Safely attempts to delete the temporary audio file."""
-        if self.temp_audio_filename and os.path.exists(self.temp_audio_filename):
-            print(f"[DEBUG] Attempting to clean up temp file: {self.temp_audio_filename}") # Debug log
-            # Add a small delay and retry logic in case the file is briefly locked by the player
-            max_retries = 5
-            for i in range(max_retries):
-                try:
-                    os.remove(self.temp_audio_filename)
-                    print(f"[DEBUG] Cleaned up temp audio file: {self.temp_audio_filename}") # Debug log
-                    break # Success
-                except PermissionError:
-                    print(f"[DEBUG] PermissionError cleaning up {self.temp_audio_filename}, retry {i+1}/{max_retries}") # Debug log
-                    if i < max_retries - 1:
-                        time.sleep(0.1 * (i + 1)) # Wait a bit longer on each retry
-                    else:
-                        print(f"PermissionError: Could not delete temporary audio file {self.temp_audio_filename} after multiple retries. It might still be in use.")
-                except Exception as e:
-                    print(f"Note: Could not delete temporary audio file {self.temp_audio_filename}: {str(e)}")
-                    break # Other error, give up
-            # Always clear the filename reference even if deletion fails
-            self.temp_audio_filename = None
+        self._configure_if_changed(self.voice_query_btn,
+                                   state=tk.NORMAL if self.voice_query_available and is_model_valid and not is_playing else tk.DISABLED,
+                                   text="🎙️ Voice Query" if not is_playing else "🎙️ ...") # Change text while listening
+
 
 
     def toggle_auto_play(self):
@@ -1861,79 +2302,105 @@ class PDFToSpeechApp:
         self.update_status("Listening... Speak your question now.")
         print("[DEBUG] Starting voice query listening...") # Debug log
 
-        # Run the voice recognition process in a separate thread
-        threading.Thread(target=self._voice_recognition_thread, daemon=True).start()
+        # The capture session keeps the microphone open and calibrated between queries,
+        # so listening starts immediately and the first syllable is kept by its pre-roll buffer
+        if self.voice_session is None:
+            self.voice_session = VoiceCaptureSession(
+                on_phrase=self._on_voice_phrase,
+                on_speech_start=self._on_voice_speech_start,
+                on_speech_audio=self._on_voice_speech_audio,
+                on_timeout=self._on_voice_timeout,
+                on_error=self._on_voice_capture_error)
+        self.voice_session.arm(timeout=10) # Wait up to 10 s for speech
+
+
+    def _on_voice_timeout(self):
+        """Capture thread: nobody spoke after the voice query button was pressed."""
+        print("[DEBUG] Listening timed out, no speech detected.") # Debug log
+        self.ui.post(lambda: [
+            self.update_status("No speech detected."),
+            self._update_tts_button_states() # Re-enable voice button
+        ])
+
+
+    def _on_voice_capture_error(self, e):
+        """Capture thread: the microphone could not be opened or read."""
+        print(f"[DEBUG] Microphone access error: {e}") # Debug log
+        if isinstance(e, OSError):
+            error_message = "Microphone access error. Please check your microphone and permissions."
+            if "No default input device" in str(e):
+                 error_message = "No microphone found. Please ensure a microphone is connected and configured."
+            title = "Voice Input Error"
+        else:
+            error_message, title = f"An unexpected voice query error occurred: {str(e)}", "Voice Error"
+        self.ui.post(lambda: [
+            self.handle_error(error_message, title),
+            self._update_tts_button_states() # Re-enable voice button
+        ])
 
 
-    def _voice_recognition_thread(self):
-        """Background thread for voice recognition."""
-        r = sr.Recognizer()
-        try:
-            # Adjust for ambient noise for a few seconds
-            print("[DEBUG] Adjusting for ambient noise...") # Debug log
-            with sr.Microphone() as source:
-                 r.adjust_for_ambient_noise(source, duration=3) # Listen for 3 seconds to calibrate
-                 print("[DEBUG] Ambient noise adjustment complete. Listening for speech...") # Debug log
-                 self.root.after(0, self.update_status, "Listening... Speak your question now.") # Re-confirm status after adjustment
+    def _on_voice_speech_start(self):
+        """Capture thread: speech started; transcription runs alongside capture."""
+        self.update_status("Hearing you...")
+        self._voice_transcriber = StreamingTranscriber(
+            self.stt_backend, self.voice_session.sample_rate,
+            on_partial=lambda text: self.ui.post(self._show_voice_transcript, text),
+            on_final=self._on_voice_transcript,
+            on_error=self._on_voice_transcription_error)
 
-                 # Listen to the source for up to 10 seconds
-                 audio = r.listen(source, timeout=10, phrase_time_limit=10) # listen for up to 10s, stop processing phrase after 10s
 
-            print("[DEBUG] Speech detected, attempting transcription...") # Debug log
-            self.root.after(0, self.update_status, "Processing speech...") # Update status while processing
+    def _on_voice_speech_audio(self, pcm):
+        """Capture thread: forwards phrase audio to the transcriber as it is captured."""
+        if self._voice_transcriber:
+            self._voice_transcriber.feed(pcm)
 
-            # Recognize speech using Google Web Speech API
-            # Use a try-except block around recognition as it might fail
-            try:
-                text = r.recognize_google(audio)
-                print(f"[DEBUG] Transcription successful: '{text}'") # Debug log
-
-                # Schedule UI updates and AI interaction on the main thread
-                self.root.after(0, lambda: [
-                    self.user_question_entry.delete(0, tk.END), # Clear entry
-                    self.user_question_entry.insert(0, text), # Insert transcribed text
-                    self.send_question_to_ai(), # Send the question to AI
-                    self._update_tts_button_states(), # Re-enable voice button
-                    self.update_status("Voice query processed.")
-                ])
-            except sr.UnknownValueError:
-                print("[DEBUG] Google Speech Recognition could not understand audio.") # Debug log
-                self.root.after(0, lambda: [
-                    self.update_status("Could not understand audio. Please try again."),
-                    self._update_tts_button_states() # Re-enable voice button
-                ])
-            except sr.RequestError as e:
-                print(f"[DEBUG] Could not request results from Google Speech Recognition service; {e}") # Debug log
-                self.root.after(0, lambda: [
-                    self.update_status(f"Speech recognition error: {e}"),
-                    self._update_tts_button_states() # Re-enable voice button
-                ])
-
-
-        except sr.WaitTimeoutError:
-            print("[DEBUG] Listening timed out, no speech detected.") # Debug log
-            self.root.after(0, lambda: [
-                self.update_status("No speech detected."),
+
+    def _on_voice_phrase(self, audio):
+        """Capture thread: the phrase ended; the transcriber produces the final transcript."""
+        print("[DEBUG] Speech ended, finishing transcription...") # Debug log
+        self.update_status("Processing speech...") # Update status while processing
+        if self._voice_transcriber:
+            self._voice_transcriber.finish()
+            self._voice_transcriber = None
+
+
+    def _show_voice_transcript(self, text):
+        """Shows a (partial) transcript in the question entry."""
+        self.user_question_entry.delete(0, tk.END)
+        self.user_question_entry.insert(0, text)
+
+
+    def _on_voice_transcript(self, text):
+        """Transcriber thread: final transcript; send it as a question."""
+        print(f"[DEBUG] Transcription successful ({self.stt_backend.name}): '{text}'") # Debug log
+        self.ui.post(lambda: [
+            self._show_voice_transcript(text),
+            self.send_question_to_ai(), # Send the question to AI
+            self._update_tts_button_states(), # Re-enable voice button
+            self.update_status("Voice query processed.")
+        ])
+
+
+    def _on_voice_transcription_error(self, e):
+        """Transcriber thread: the phrase could not be transcribed."""
+        print(f"[DEBUG] Speech recognition failed ({self.stt_backend.name}): {e}") # Debug log
+        if isinstance(e, STTUnrecognizedError):
+            self.ui.post(lambda: [
+                self.update_status("Could not understand audio. Please try again."),
                 self._update_tts_button_states() # Re-enable voice button
             ])
-        except OSError as e: # Handle microphone access errors (e.g., no microphone, permissions)
-            print(f"[DEBUG] Microphone access error: {e}") # Debug log
-            error_message = "Microphone access error. Please check your microphone and permissions."
-            if "No default input device" in str(e):
-                 error_message = "No microphone found. Please ensure a microphone is connected and configured."
-            self.root.after(0, lambda: [
-                self.handle_error(error_message, "Voice Input Error"),
+        elif isinstance(e, STTBackendError):
+            error_text = f"Speech recognition error: {e}"
+            self.ui.post(lambda: [
+                self.update_status(error_text),
                 self._update_tts_button_states() # Re-enable voice button
             ])
-        except Exception as e:
-            print(f"[DEBUG] An unexpected voice query error occurred: {e}") # Debug log
-            self.root.after(0, lambda: [
-                self.handle_error(f"An unexpected voice query error occurred: {str(e)}", "Voice Error"),
+        else:
+            error_text = f"An unexpected voice query error occurred: {str(e)}"
+            self.ui.post(lambda: [
+                self.handle_error(error_text, "Voice Error"),
                 self._update_tts_button_states() # Re-enable voice button
             ])
-        finally:
-            # Ensure button state is reset even if other errors occurred
-             self.root.after(0, self._update_tts_button_states)
 
 
     # --- Application Lifecycle ---
@@ -1942,10 +2409,19 @@ class PDFToSpeechApp:
         """Handles cleanup when the application window is closed."""
         print("[DEBUG] Application closing.") # Debug log
         self.stop_current_page_tts() # Stop any running TTS process
-        if self.pdf_document:
-            try: self.pdf_document.close() # Close the PDF document
-            except Exception as e: print(f"Error closing PDF on exit: {str(e)}")
-        self._cleanup_temp_audio_file() # Clean up any temporary audio file
+        self._save_session() # Reopening this document restores where it was left
+        self.ui.stop() # No more queued UI updates
+        self.study_prefetcher.shutdown() # Abandon any speculative generation
+        self.ocr_scheduler.shutdown() # Pages not recognized yet are recognized next time
+        if self.tts_backend: self.tts_backend.close()
+        if self.voice_session: self.voice_session.close() # Release the microphone
+        if self.study_item_store:
+            try: self.study_item_store.close()
+            except Exception as e: print(f"Error closing study item database: {e}")
+        if self.session_store:
+            try: self.session_store.close()
+            except Exception as e: print(f"Error closing session database: {e}")
+        self.library.close_all() # Close the PDF documents
         if hasattr(self.root, 'destroy'):
             self.root.destroy() # Destroy the main window
         # Using sys.exit(0) is a clean way to ensure all threads (like the monitor thread) exit
@@ -1959,63 +2435,6 @@ if __name__ == "__main__":
         messagebox.showerror("Python Version Error", "This application requires Python 3.7 or newer.")
         sys.exit(1)
 
-    # Check for edge-tts before starting the GUI
-    # This check needs to happen after the PATH modification for Windows
-    print("[DEBUG] Checking for edge-tts executable...") # Debug log
-    try:
-        # Use check=True to raise CalledProcessError on non-zero exit status
-        # Use creationflags to suppress console window on Windows
-        creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-        # Run edge-tts with a basic command to check its existence and executability
-        # Using --help or --help is common
-        subprocess.run(["edge-tts", "--help"], check=True, capture_output=True, text=True, encoding='utf-8', errors='ignore', creationflags=creationflags)
-        print("[DEBUG] edge-tts check passed.") # Debug log
-
-    except FileNotFoundError:
-        # edge-tts command was not found at all
-        message_text = "The 'edge-tts' command was not found.\n"
-        message_text += "Please ensure it is installed (`pip install edge-tts`) and that your Python Scripts directory is in your system's PATH.\n"
-        if sys.platform == 'win32':
-             message_text += f"Common Scripts path: {os.path.join(os.path.dirname(sys.executable), 'Scripts')}\n"
-        message_text += "Application will exit."
-        messagebox.showerror("Dependency Error", message_text)
-        sys.exit(1)
-    except subprocess.CalledProcessError as e:
-         # edge-tts command was found but returned an error (e.g., invalid option for version check)
-         error_msg = f"The 'edge-tts' command was found, but the version check failed (exit code {e.returncode})."
-         if e.stderr:
-             error_msg += f"\nStderr: {e.stderr.strip()[:300]}..." # Limit stderr length
-         elif e.stdout:
-             error_msg += f"\nStdout: {e.stdout.strip()[:300]}..." # Limit stdout length
-         error_msg += "\nPlease ensure edge-tts is correctly installed and can run.\nTry running 'edge-tts --help' or 'edge-tts --help' in your terminal.\nApplication will exit."
-         messagebox.showerror("Dependency Error", error_msg)
-         sys.exit(1)
-    except Exception as e:
-         # Other unexpected error during the check
-         messagebox.showerror("Dependency Error", f"An unexpected error occurred while checking 'edge-tts': {str(e)}\nApplication will exit.")
-         sys.exit(1)
-
-
-    # Check for ffplay (part of FFmpeg) before starting the GUI
-    # This check should also happen after the PATH modification for Windows
-    print("[DEBUG] Checking for ffplay executable...") # Debug log
-    try:
-         creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-         subprocess.run(["ffplay", "-version"], check=True, capture_output=True, text=True, encoding='utf-8', errors='ignore', creationflags=creationflags)
-         print("[DEBUG] ffplay check passed.") # Debug log
-    except FileNotFoundError:
-         # ffplay command was not found at all
-         # Don't exit here, as the app can still function without audio playback,
-         # but show a warning. The playback function will also check and warn.
-         print("[WARNING] ffplay command not found. Audio playback will be disabled.")
-         # messagebox.showwarning("Dependency Warning", "The 'ffplay' command (part of FFmpeg) was not found.\nAudio playback will be disabled. Please install FFmpeg and ensure ffplay is in your system's PATH.")
-         # No messagebox here, will show instructions on first attempt to play audio.
-    except subprocess.CalledProcessError as e:
-         print(f"[WARNING] ffplay command found, but version check failed (code {e.returncode}). Playback might not work.")
-    except Exception as e:
-         print(f"[WARNING] Unexpected error during ffplay check: {e}. Playback might not work.")
-
-
     main_app_root = None
     try:
         # Create the main Tkinter window
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Voice query latency without a microphone: a WAV file is played in real time
+through the same capture session (VAD + ring buffer) and streaming transcriber
+the app uses.
+
+Reported per run:
+    first partial: speech detected -> first partial transcript
+    final:         end of the recording -> final transcript
+
+Usage:
+    python benchmarks/bench_stt_latency.py question.wav [--backend fake|vosk|google] [--runs 3] [--transcript "..."]
+
+The WAV file must be 16-bit mono at 16 kHz. The fake backend reveals --transcript
+word by word, so it measures the pipeline's own overhead.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stt_backends import STT_BACKENDS, FakeSTTBackend, StreamingTranscriber # noqa: E402
+from voice_session import VoiceCaptureSession, WavFileMicrophone # noqa: E402
+
+
+SAMPLE_RATE = 16000
+
+
+def run_once(path, backend, realtime=True):
+    """Returns (first_partial_seconds or None, final_seconds, transcript or error text)."""
+    done = threading.Event()
+    result = {"speech_start": None, "first_partial": None, "final": None, "text": None}
+    microphones = []
+
+    def microphone_factory(sample_rate, frame_samples):
+        microphone = WavFileMicrophone(path, sample_rate, frame_samples, realtime=realtime)
+        microphones.append(microphone)
+        return microphone
+
+    def on_partial(text):
+        if result["first_partial"] is None:
+            result["first_partial"] = time.monotonic()
+
+    def on_final(text):
+        result["final"], result["text"] = time.monotonic(), text
+        done.set()
+
+    def on_error(e):
+        result["final"], result["text"] = time.monotonic(), f"error: {e}"
+        done.set()
+
+    transcriber = {}
+
+    def on_speech_start():
+        result["speech_start"] = time.monotonic()
+        transcriber["current"] = StreamingTranscriber(backend, SAMPLE_RATE, on_partial=on_partial,
+                                                      on_final=on_final, on_error=on_error)
+
+    session = VoiceCaptureSession(
+        on_phrase=lambda audio: transcriber["current"].finish(),
+        on_speech_start=on_speech_start,
+        on_speech_audio=lambda pcm: transcriber["current"].feed(pcm),
+        on_timeout=lambda: on_error("no speech detected"),
+        on_error=on_error,
+        sample_rate=SAMPLE_RATE,
+        microphone_factory=microphone_factory,
+        audio_data_factory=lambda pcm, rate, width: pcm)
+    session.arm(timeout=30)
+    done.wait(timeout=120)
+    session.close()
+
+    speech_ended_at = microphones[0].speech_ended_at if microphones else None
+    first_partial = (result["first_partial"] - result["speech_start"]) if result["first_partial"] and result["speech_start"] else None
+    final = (result["final"] - speech_ended_at) if result["final"] and speech_ended_at else float("nan")
+    return first_partial, final, result["text"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wav")
+    parser.add_argument("--backend", default="fake", choices=sorted(STT_BACKENDS))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--transcript", default="what is the main idea of this page")
+    parser.add_argument("--no-realtime", action="store_true", help="Feed audio as fast as possible.")
+    args = parser.parse_args()
+
+    backend = FakeSTTBackend(args.transcript) if args.backend == "fake" else STT_BACKENDS[args.backend]()
+    if not backend.is_available():
+        sys.exit(f"STT backend '{args.backend}' is not available here.")
+
+    finals = []
+    for run in range(1, args.runs + 1):
+        first_partial, final, text = run_once(args.wav, backend, realtime=not args.no_realtime)
+        finals.append(final)
+        partial_text = f"{first_partial * 1000:7.1f} ms" if first_partial is not None else "     n/a"
+        print(f"run {run}: first partial {partial_text}   final {final * 1000:7.1f} ms   -> {text!r}")
+    print(f"median final latency after end of speech: {statistics.median(finals) * 1000:.1f} ms "
+          "(includes the end-of-speech silence the capture session waits for)")
+
+
+if __name__ == "__main__":
+    main()
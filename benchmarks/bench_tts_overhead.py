@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Per-utterance overhead of spawning a TTS subprocess vs. calling an in-process backend.
+
+The subprocess path is what the edge-tts CLI costs before any network work:
+interpreter start-up plus importing edge_tts (or just interpreter start-up if
+edge_tts is not installed). The in-process path is a call to the fake backend,
+which does no real synthesis, so the difference is pure overhead.
+
+With --network, real edge-tts synthesis is also timed through both the CLI and
+the in-process backend (requires edge-tts and internet access).
+
+Usage:
+    python benchmarks/bench_tts_overhead.py [--runs 20] [--network] [--voice en-US-JennyNeural]
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tts_backends import EdgeTTSBackend, EdgeTTSCLIBackend, FakeTTSBackend # noqa: E402
+
+
+SAMPLE_TEXT = "The mitochondria is the powerhouse of the cell."
+
+
+def time_calls(fn, runs):
+    """Returns per-call wall times in seconds."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    p90 = timings[min(len(timings) - 1, int(0.9 * len(timings)))]
+    print(f"{label:<40} median {statistics.median(timings) * 1000:9.2f} ms   p90 {p90 * 1000:9.2f} ms   (n={len(timings)})")
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--network", action="store_true", help="Also time real edge-tts synthesis (needs internet).")
+    parser.add_argument("--voice", default="en-US-JennyNeural")
+    args = parser.parse_args()
+
+    has_edge_tts = importlib.util.find_spec("edge_tts") is not None
+    spawn_code = "import edge_tts" if has_edge_tts else "pass"
+    spawn_label = "subprocess: python -c 'import edge_tts'" if has_edge_tts else "subprocess: python -c 'pass'"
+    subprocess_median = report(spawn_label, time_calls(
+        lambda: subprocess.run([sys.executable, "-c", spawn_code], check=True), args.runs))
+
+    fake = FakeTTSBackend(seconds_per_char=0, max_seconds=0)
+    fake.synthesize(SAMPLE_TEXT, args.voice) # Warm up
+    in_process_median = report("in-process: FakeTTSBackend.synthesize", time_calls(
+        lambda: fake.synthesize(SAMPLE_TEXT, args.voice), args.runs))
+    print(f"Per-utterance overhead saved: ~{(subprocess_median - in_process_median) * 1000:.1f} ms")
+
+    if args.network:
+        if not has_edge_tts:
+            print("edge-tts is not installed; skipping --network measurements.")
+            return
+        cli, in_process = EdgeTTSCLIBackend(), EdgeTTSBackend()
+        if cli.is_available():
+            report("network: edge-tts CLI per utterance", time_calls(lambda: cli.synthesize(SAMPLE_TEXT, args.voice), args.runs))
+        in_process.synthesize(SAMPLE_TEXT, args.voice) # Warm up (import + event loop)
+        report("network: in-process EdgeTTSBackend", time_calls(lambda: in_process.synthesize(SAMPLE_TEXT, args.voice), args.runs))
+        in_process.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Cold-start regression check based on `python -X importtime`.
+
+Imports the app module in fresh interpreters and fails (exit code 1) if
+    - its cumulative import time (best of --runs) exceeds --budget-ms, or
+    - any module that must only be loaded on first use is imported eagerly.
+
+Usage:
+    python benchmarks/check_import_time.py [--module app] [--budget-ms 150] [--runs 5] [--top 10]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BUDGET_MS = 150
+
+# Heavy or optional modules that the app must import lazily (top-level package names)
+DEFERRED_MODULES = ("fitz", "pymupdf", "PIL", "requests", "urllib3", "speech_recognition", "pyaudio",
+                    "edge_tts", "asyncio", "vosk")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure(module):
+    """Returns [(self_us, cumulative_us, depth, name)] for one cold import of `module`."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=REPO_ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list.")
+    args = parser.parse_args()
+
+    best_us, best_entries = None, None
+    for _ in range(args.runs):
+        entries = measure(args.module)
+        total_us = next((cumulative for _, cumulative, depth, name in entries if name == args.module and depth == 0), None)
+        if total_us is None:
+            raise SystemExit(f"No import time reported for '{args.module}'.")
+        if best_us is None or total_us < best_us:
+            best_us, best_entries = total_us, entries
+
+    print(f"{args.module}: {best_us / 1000:.1f} ms cumulative import time (best of {args.runs}, budget {args.budget_ms:.0f} ms)")
+    print("Slowest imports (self time):")
+    for self_us, cumulative_us, depth, name in sorted(best_entries, reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:7.1f} ms self {cumulative_us / 1000:8.1f} ms cumulative  {name}")
+
+    failures = []
+    eager = sorted({name for _, _, _, name in best_entries if name.split(".")[0] in DEFERRED_MODULES})
+    if eager:
+        failures.append(f"modules that must be imported lazily were loaded at start-up: {', '.join(eager)}")
+    if best_us / 1000 > args.budget_ms:
+        failures.append(f"import time {best_us / 1000:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
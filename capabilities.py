@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Registry of external tools (ffplay, edge-tts, espeak...) probed once in the
+background and cached on disk.
+
+A cached result is reused as long as the tool still resolves to the same file
+with the same modification time, so checking availability normally costs a
+PATH lookup and a stat() instead of a subprocess.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+
+DEFAULT_CAPABILITIES_CACHE = os.path.join(os.path.expanduser("~"), ".learnmate", "capabilities.json")
+
+# name -> (executable candidates in order of preference, arguments for the version probe)
+KNOWN_TOOLS = {
+    "ffplay": (("ffplay",), ("-version",)),
+    "edge-tts": (("edge-tts",), ("--version",)),
+    "espeak": (("espeak-ng", "espeak"), ("--version",)),
+}
+
+
+class CapabilityRegistry:
+    """
+    Thread-safe cache of tool availability.
+
+    Args:
+        tools (dict): name -> (executable candidates, version probe arguments). Defaults to KNOWN_TOOLS.
+        cache_path (str, optional): JSON file the results are persisted to (None disables persistence).
+        probe_timeout (float): Seconds a version probe may take.
+    """
+
+    def __init__(self, tools=None, cache_path=DEFAULT_CAPABILITIES_CACHE, probe_timeout=10):
+        self.tools = dict(tools or KNOWN_TOOLS)
+        self.cache_path = cache_path
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+        self._results = self._load_cache() # name -> {"available", "path", "mtime", "version"}
+        self._probing = {} # name -> threading.Event set when the probe finishes
+
+    # --- Persistence ---
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError) as e:
+            print(f"[DEBUG] Ignoring unreadable capability cache {self.cache_path}: {e}") # Debug log
+            return {}
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        with self._lock:
+            data = json.dumps(self._results, indent=1)
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"[DEBUG] Could not write capability cache {self.cache_path}: {e}") # Debug log
+
+    # --- Lookup ---
+
+    def _locate(self, name):
+        """Returns (path, mtime) of the first candidate executable on PATH, or (None, None)."""
+        candidates, _ = self.tools[name]
+        for candidate in candidates:
+            path = shutil.which(candidate)
+            if path:
+                try:
+                    return path, os.stat(path).st_mtime
+                except OSError:
+                    continue
+        return None, None
+
+    def _fresh_result(self, name, path, mtime):
+        """The cached result if it still describes the tool at `path`. Lock must be held."""
+        result = self._results.get(name)
+        if result and result.get("path") == path and result.get("mtime") == mtime:
+            return result
+        return None
+
+    def get(self, name, timeout=None):
+        """
+        Returns {"available", "path", "mtime", "version"} for a tool.
+
+        A fresh cached result is returned immediately. Otherwise the tool is probed
+        (or an in-flight background probe is awaited up to `timeout` seconds).
+        """
+        return self._check(name, await_probe=True, timeout=timeout)
+
+    def _check(self, name, await_probe, timeout=None):
+        if name not in self.tools:
+            raise KeyError(f"Unknown tool '{name}'")
+        path, mtime = self._locate(name)
+        if path is None:
+            result = {"available": False, "path": None, "mtime": None, "version": None}
+            with self._lock:
+                changed = self._results.get(name) != result
+                self._results[name] = result
+            if changed:
+                self._save_cache()
+            return result
+
+        with self._lock:
+            result = self._fresh_result(name, path, mtime)
+            probe_done = self._probing.get(name)
+        if result:
+            return result
+        if await_probe and probe_done is not None and probe_done.wait(timeout):
+            with self._lock:
+                result = self._fresh_result(name, path, mtime)
+            if result:
+                return result
+        return self._probe(name)
+
+    def locate(self, name):
+        """Path of the tool's executable on PATH (no probe), or None."""
+        return self._locate(name)[0]
+
+    def is_available(self, name, timeout=None):
+        return bool(self.get(name, timeout=timeout)["available"])
+
+    def invalidate(self, name):
+        """Forgets a tool's cached result (e.g. after it unexpectedly failed to start)."""
+        with self._lock:
+            self._results.pop(name, None)
+        self._save_cache()
+
+    # --- Probing ---
+
+    def _probe(self, name):
+        """Runs the tool's version probe and caches the result."""
+        _, version_args = self.tools[name]
+        path, mtime = self._locate(name)
+        result = {"available": False, "path": path, "mtime": mtime, "version": None}
+        if path:
+            creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+            try:
+                completed = subprocess.run([path, *version_args], capture_output=True, text=True, encoding='utf-8',
+                                           errors='ignore', timeout=self.probe_timeout, creationflags=creationflags)
+                result["available"] = completed.returncode == 0
+                output = (completed.stdout or completed.stderr).strip()
+                result["version"] = output.splitlines()[0][:200] if output else None
+            except (OSError, subprocess.SubprocessError) as e:
+                print(f"[DEBUG] Probe of {name} failed: {e}") # Debug log
+        print(f"[DEBUG] Capability probe: {name} -> {'available' if result['available'] else 'missing'}") # Debug log
+        with self._lock:
+            self._results[name] = result
+        self._save_cache()
+        return result
+
+    def probe_in_background(self, names=None):
+        """Checks the given (default: all) tools on a background thread; only stale entries spawn a probe."""
+        names = list(names or self.tools)
+        with self._lock:
+            events = {name: self._probing.setdefault(name, threading.Event()) for name in names}
+
+        def worker():
+            for name in names:
+                try:
+                    self._check(name, await_probe=False)
+                except Exception as e:
+                    print(f"[DEBUG] Capability check of {name} failed: {e}") # Debug log
+                finally:
+                    with self._lock:
+                        self._probing.pop(name, None)
+                    events[name].set()
+
+        threading.Thread(target=worker, name="CapabilityProbe", daemon=True).start()
+
+    def snapshot(self):
+        """Copy of all cached results."""
+        with self._lock:
+            return {name: dict(result) for name, result in self._results.items()}
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_capability_registry():
+    """The process-wide registry shared by all subsystems."""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = CapabilityRegistry()
+        return _default_registry
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Chat transcript kept in a compact store, with only a window of messages in the Text widget.
+
+Long study sessions produce many large messages; a Tk Text widget holding all of
+them gets slow to insert into and to scroll. The full history lives in a
+TranscriptStore (long messages zlib-compressed) and ChatTranscriptView keeps
+the most recent `window_size` messages in the widget. Scrolling to the top
+loads older messages a batch at a time, and new messages are inserted in one
+batch per frame.
+
+Messages can also be streamed: a live message grows at its end as text arrives,
+rendered incrementally as Markdown.
+"""
+import threading
+import zlib
+from collections import namedtuple
+
+from markdown_render import IncrementalMarkdownRenderer
+
+
+ChatMessage = namedtuple("ChatMessage", ["sender", "text", "tag", "prefix_tag"])
+
+
+class TranscriptStore:
+    """
+    Append-only chat history.
+
+    Args:
+        compress_min_chars (int): Messages at least this long are stored zlib-compressed.
+    """
+
+    def __init__(self, compress_min_chars=1024):
+        self.compress_min_chars = compress_min_chars
+        self._entries = [] # (sender, text or compressed bytes, tag, prefix_tag)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _pack(self, text):
+        return zlib.compress(text.encode("utf-8"), 6) if len(text) >= self.compress_min_chars else text
+
+    def append(self, sender, text, tag, prefix_tag=None):
+        """Stores a message and returns its index."""
+        self._entries.append((sender, self._pack(text), tag, prefix_tag))
+        return len(self._entries) - 1
+
+    def set_text(self, index, text):
+        """Replaces the text of a stored message (used when a streamed message is complete)."""
+        sender, _, tag, prefix_tag = self._entries[index]
+        self._entries[index] = (sender, self._pack(text), tag, prefix_tag)
+
+    def get(self, index):
+        sender, stored, tag, prefix_tag = self._entries[index]
+        text = zlib.decompress(stored).decode("utf-8") if isinstance(stored, bytes) else stored
+        return ChatMessage(sender, text, tag, prefix_tag)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def _prefix_segments(message):
+    return [(f"{message.sender}: ", message.prefix_tag or message.tag)] if message.sender else []
+
+
+def render_plain(message):
+    """Default renderer: [(text, tags)] segments for one message, including the trailing blank line."""
+    return _prefix_segments(message) + [(message.text + "\n\n", message.tag)]
+
+
+def render_markdown(message):
+    """Renders the message text as Markdown (see markdown_render)."""
+    return _prefix_segments(message) + IncrementalMarkdownRenderer((message.tag,)).render(message.text) + [("\n\n", message.tag)]
+
+
+class StreamedText:
+    """Text arriving on a worker thread for a live message; the main thread takes it in batches."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pieces = []
+        self.index = None # Transcript index of the live message, set on the main thread
+        self.finished = False # Set on the main thread once the live message is complete
+
+    def feed(self, text):
+        with self._lock:
+            self._pieces.append(text)
+
+    def take(self):
+        """Returns (and forgets) the text received since the last call."""
+        with self._lock:
+            pieces, self._pieces = self._pieces, []
+        return "".join(pieces)
+
+
+class _PlainRenderer:
+    """Renderer interface for live messages that are not Markdown."""
+
+    def __init__(self, tag):
+        self.tag = tag
+
+    def feed(self, text):
+        return [(text, self.tag)]
+
+    def finish(self):
+        return []
+
+
+class ChatTranscriptView:
+    """
+    Shows a window of a TranscriptStore in a (read-only) Text widget. Main thread only.
+
+    Every message in the widget starts at a mark named "chatmsg<index>", so
+    messages can be trimmed from either end and the view can be kept in place
+    when older messages are prepended. A live (streamed) message also has a
+    "chatlive<index>" mark where its next text is inserted.
+
+    Args:
+        text_widget: tk.Text (or ScrolledText) the transcript is shown in.
+        store (TranscriptStore, optional): History to show (a new one by default).
+        render_fn (callable): render_fn(ChatMessage) -> [(text, tags)].
+        markdown_tags (tuple): Messages with one of these tags are rendered as Markdown instead.
+        window_size (int): Messages kept in the widget while following the conversation.
+        load_batch (int): Messages loaded at a time when scrolling back (or forward again).
+        max_window (int): Messages the widget may hold while scrolled back before the far end is trimmed.
+        frame_ms (int): Delay used to batch new messages into one insert.
+        max_inserts_per_frame (int): New messages inserted per frame at most.
+    """
+
+    def __init__(self, text_widget, store=None, render_fn=render_plain, markdown_tags=("ai",), window_size=150,
+                 load_batch=40, max_window=400, frame_ms=16, max_inserts_per_frame=30):
+        self.text = text_widget
+        self.store = store if store is not None else TranscriptStore()
+        self.render_fn = render_fn
+        self.markdown_tags = tuple(markdown_tags)
+        self.window_size = window_size
+        self.load_batch = load_batch
+        self.max_window = max(max_window, window_size + load_batch)
+        self.frame_ms = frame_ms
+        self.max_inserts_per_frame = max_inserts_per_frame
+
+        self._first = 0 # Index of the first message in the widget
+        self._last = 0 # One past the last message in the widget
+        self._pending_scroll = False # A new message asked to scroll to the end
+        self._flush_id = None
+        self._load_scheduled = False
+        self._live = {} # index -> {"parts": [text, ...], "renderer": IncrementalMarkdownRenderer or None}
+        self._scrollbar = getattr(text_widget, "vbar", None)
+        self.text.config(yscrollcommand=self._on_yscroll)
+
+    # --- Public API ---
+
+    def append(self, sender, text, tag, prefix_tag=None, scroll=None):
+        """
+        Adds a message. It is inserted into the widget on the next frame.
+
+        scroll: True to always scroll to it, False never, None (default) only if the view is at the bottom.
+        """
+        if scroll or (scroll is None and self._at_bottom()):
+            self._pending_scroll = True
+        self.store.append(sender, text, tag, prefix_tag)
+        if self._flush_id is None:
+            self._flush_id = self.text.after(self.frame_ms, self._flush)
+
+    def begin_live(self, sender, tag, prefix_tag=None, scroll=None):
+        """Adds an empty message that grows with append_live(); returns its index."""
+        self.append(sender, "", tag, prefix_tag, scroll=scroll)
+        index = len(self.store) - 1
+        self._live[index] = {"parts": [], "renderer": None}
+        return index
+
+    def append_live(self, index, text):
+        """Adds text to the end of a live message. Only the new text is parsed and inserted."""
+        live = self._live.get(index)
+        if live is None or not text:
+            return
+        live["parts"].append(text)
+        if live["renderer"] is None:
+            return # Not in the widget (yet): rendered from the collected text when it is inserted
+        follow = self._at_bottom()
+        self._insert_segments(self._live_mark(index), live["renderer"].feed(text))
+        if follow:
+            self.text.see("end")
+
+    def end_live(self, index, final_text=None):
+        """Completes a live message; `final_text` (if given) replaces the streamed text in the history."""
+        live = self._live.get(index)
+        if live is None:
+            return
+        streamed = "".join(live["parts"])
+        text = streamed if final_text is None else final_text
+        self.store.set_text(index, text)
+        renderer = live["renderer"]
+        del self._live[index]
+        if renderer is None:
+            return
+        self._editable()
+        if text.strip() == streamed.strip():
+            self._insert_segments(self._live_mark(index), renderer.finish(), editable=False)
+            self.text.mark_unset(self._live_mark(index))
+        else:
+            # The final text differs from what was streamed: render the message again
+            next_mark = self._mark(index + 1) if index + 1 < self._last else None
+            self.text.mark_unset(self._live_mark(index))
+            self.text.delete(self._mark(index), next_mark or "end-1c")
+            self.text.mark_set("chatinsert", next_mark or "end-1c")
+            self.text.mark_gravity("chatinsert", "right")
+            if next_mark:
+                self.text.mark_gravity(next_mark, "right") # Keep the next message after the re-rendered one
+            self._insert_message(index, "chatinsert")
+            if next_mark:
+                self.text.mark_gravity(next_mark, "left")
+            self.text.mark_unset("chatinsert")
+        self._read_only()
+
+    def clear(self):
+        """Forgets the whole transcript."""
+        self.store.clear()
+        self._live.clear()
+        self._set_widget_contents(0, 0)
+
+    def load(self, messages):
+        """Replaces the transcript with `messages` [(sender, text, tag, prefix_tag)] and shows the newest ones."""
+        self.store.clear()
+        self._live.clear()
+        for sender, text, tag, prefix_tag in messages:
+            self.store.append(sender, text, tag, prefix_tag)
+        self._pending_scroll = False
+        self.jump_to_latest()
+
+    def stable_length(self):
+        """Number of leading messages that are complete (no live message among them)."""
+        return min(self._live, default=len(self.store))
+
+    def messages(self, start, stop):
+        """[(sender, text, tag, prefix_tag)] of messages start..stop-1."""
+        return [tuple(self.store.get(index)) for index in range(start, stop)]
+
+    def jump_to_latest(self):
+        """Shows the most recent window of messages and scrolls to the end."""
+        end = len(self.store)
+        self._set_widget_contents(max(0, end - self.window_size), end)
+        self.text.see("end")
+
+    def rerender(self):
+        """Re-renders the messages in the widget (e.g. after the renderer's style changed)."""
+        first, last = self._first, self._last
+        position = self.text.yview()[0]
+        self._set_widget_contents(first, last)
+        self.text.yview_moveto(position)
+
+    # --- Rendering ---
+
+    def _mark(self, index):
+        return f"chatmsg{index}"
+
+    def _live_mark(self, index):
+        return f"chatlive{index}"
+
+    def _render(self, message):
+        return render_markdown(message) if message.tag in self.markdown_tags else self.render_fn(message)
+
+    def _insert_segments(self, position, segments, editable=True):
+        args = []
+        for text, tags in segments:
+            args.extend((text, tags))
+        if args:
+            if editable:
+                self._editable()
+            self.text.insert(position, *args)
+            if editable:
+                self._read_only()
+
+    def _insert_message(self, index, position):
+        """Inserts message `index` at `position` (a mark or text index) and marks its start. Widget must be editable."""
+        message = self.store.get(index)
+        self.text.mark_set(self._mark(index), position)
+        self.text.mark_gravity(self._mark(index), "left")
+        live = self._live.get(index)
+        if live is None:
+            self._insert_segments(position, self._render(message), editable=False)
+            return
+        # Live message: render what has arrived so far and leave a mark where more text goes
+        if message.tag in self.markdown_tags:
+            live["renderer"] = IncrementalMarkdownRenderer((message.tag,))
+        else:
+            live["renderer"] = _PlainRenderer(message.tag)
+        segments = live["renderer"].feed("".join(live["parts"]))
+        self._insert_segments(position, _prefix_segments(message) + segments + [("\n\n", message.tag)], editable=False)
+        self.text.mark_set(self._live_mark(index), f"{position} -2c")
+        self.text.mark_gravity(self._live_mark(index), "right")
+
+    def _unset_marks(self, start, stop):
+        for index in range(start, stop):
+            self.text.mark_unset(self._mark(index))
+            if index in self._live:
+                self.text.mark_unset(self._live_mark(index))
+                self._live[index]["renderer"] = None # Rendered again from the collected text if shown again
+
+    def _editable(self):
+        """The widget is kept read-only except while the transcript changes it."""
+        self.text.config(state="normal")
+
+    def _read_only(self):
+        self.text.config(state="disabled")
+
+    def _set_widget_contents(self, first, last):
+        self._editable()
+        self.text.delete("1.0", "end")
+        self._unset_marks(self._first, self._last)
+        self._first, self._last = first, last
+        for index in range(first, last):
+            self._insert_message(index, "end-1c")
+        self._read_only()
+
+    def _trim_front(self, count):
+        """Removes the `count` oldest messages from the widget. Widget must be editable."""
+        count = min(count, self._last - self._first)
+        if count <= 0:
+            return
+        new_first = self._first + count
+        end = self._mark(new_first) if new_first < self._last else "end-1c"
+        self.text.delete("1.0", end)
+        self._unset_marks(self._first, new_first)
+        self._first = new_first
+
+    def _trim_back(self, count):
+        """Removes the `count` newest messages from the widget. Widget must be editable."""
+        count = min(count, self._last - self._first)
+        if count <= 0:
+            return
+        new_last = self._last - count
+        self.text.delete(self._mark(new_last), "end-1c")
+        self._unset_marks(new_last, self._last)
+        self._last = new_last
+
+    def _flush(self):
+        """Inserts messages appended since the last frame in one batch."""
+        self._flush_id = None
+        end = len(self.store)
+        if self._pending_scroll and end - self._last > self.window_size:
+            # Far behind (the view was scrolled back and detached): show the latest window directly
+            self._pending_scroll = False
+            self.jump_to_latest()
+            return
+        # While scrolled back, new messages are added only until the window is full (the rest load on scroll)
+        may_insert = self._pending_scroll or self._last - self._first < self.max_window
+        if self._last < end and may_insert:
+            batch_end = min(end, self._last + self.max_inserts_per_frame)
+            self._editable()
+            for index in range(self._last, batch_end):
+                self._insert_message(index, "end-1c")
+            self._last = batch_end
+            if self._pending_scroll:
+                self._trim_front(self._last - self._first - self.window_size)
+            self._read_only()
+        if self._last < end:
+            if may_insert:
+                self._flush_id = self.text.after(self.frame_ms, self._flush)
+        elif self._pending_scroll:
+            self._pending_scroll = False
+            self.text.see("end")
+
+    # --- Scrolling ---
+
+    def _at_bottom(self):
+        """True if the view shows the newest message (or already follows messages not yet inserted)."""
+        return self._pending_scroll or (self._last == len(self.store) and self.text.yview()[1] >= 0.999)
+
+    def _on_yscroll(self, first, last):
+        if self._scrollbar is not None:
+            self._scrollbar.set(first, last)
+        near_top = float(first) <= 0.0 and self._first > 0
+        near_bottom = float(last) >= 1.0 and self._last < len(self.store) and self._flush_id is None
+        if (near_top or near_bottom) and not self._load_scheduled:
+            # Changing the widget from inside its scroll callback is not safe
+            self._load_scheduled = True
+            self.text.after_idle(self._load_more)
+
+    def _load_more(self):
+        self._load_scheduled = False
+        top, bottom = self.text.yview()
+        if top <= 0.0 and self._first > 0:
+            self._load_older()
+        elif bottom >= 1.0 and self._last < len(self.store):
+            self._load_newer()
+
+    def _load_older(self):
+        """Prepends a batch of older messages, keeping the current view in place."""
+        old_first = self._first
+        new_first = max(0, old_first - self.load_batch)
+        anchor = self._mark(old_first) if old_first < self._last else None
+        self._editable()
+        if anchor:
+            self.text.mark_gravity(anchor, "right") # Text inserted before it must not end up after the mark
+        self.text.mark_set("chatinsert", "1.0")
+        self.text.mark_gravity("chatinsert", "right")
+        for index in range(new_first, old_first):
+            self._insert_message(index, "chatinsert")
+        self.text.mark_unset("chatinsert")
+        if anchor:
+            self.text.mark_gravity(anchor, "left")
+        self._first = new_first
+        self._trim_back(self._last - self._first - self.max_window)
+        self._read_only()
+        if anchor:
+            self.text.yview(anchor)
+
+    def _load_newer(self):
+        """Appends the next batch of messages after the view was detached by scrolling back."""
+        old_last = self._last
+        new_last = min(len(self.store), old_last + self.load_batch)
+        self._editable()
+        for index in range(old_last, new_last):
+            self._insert_message(index, "end-1c")
+        self._last = new_last
+        anchor = self._mark(old_last)
+        trimmed = self._last - self._first - self.max_window
+        self._trim_front(trimmed)
+        self._read_only()
+        self.text.see(anchor)
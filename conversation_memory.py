@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Per-document conversation memory: recent turns verbatim plus a rolling summary of older ones."""
+import threading
+from collections import OrderedDict
+
+
+NO_DOCUMENT_KEY = "__no_document__" # Memory used while no PDF is loaded
+
+
+def estimate_tokens(text):
+    """Rough token estimate (about 4 characters per token for English text)."""
+    return len(text) // 4 + 1 if text else 0
+
+
+class _DocumentMemory:
+    """Conversation state for one document."""
+
+    def __init__(self):
+        self.turns = [] # Turns not yet folded into the summary, oldest first
+        self.summary = "" # Rolling summary of every folded turn
+        self.compacting = False # True while a background summary update is running
+        self.declined_tokens = None # Overflow size when summarize_fn last gave no summary (retried once it doubles)
+
+
+class ConversationMemory:
+    """
+    Thread-safe conversation memory, kept separately for each document.
+
+    Prompts get the rolling summary plus as many of the newest turns as fit in
+    `recent_token_budget`. Turns that fall out of that window are folded into
+    the summary by `summarize_fn` on a background thread once at least
+    `min_fold_tokens` of them have accumulated, so nothing is silently dropped.
+    If `summarize_fn` returns nothing or fails, the next attempt waits until
+    the overflow has doubled or retry_compaction() is called.
+
+    Args:
+        summarize_fn (callable, optional): summarize_fn(previous_summary, turns) -> new summary text, or None
+            if it cannot summarize now. Runs on a background thread. Without it, turns outside the window are dropped.
+        recent_token_budget (int): Token budget for verbatim recent turns in a prompt.
+        min_fold_tokens (int): Minimum size of the overflow before a summary update is started.
+        max_summary_chars (int): Hard cap applied to the summary text.
+        max_documents (int): Number of documents whose memory is kept (least recently used are dropped).
+        max_unfolded_turns (int): Safety cap on stored turns if summarization keeps failing.
+    """
+
+    def __init__(self, summarize_fn=None, recent_token_budget=1200, min_fold_tokens=400,
+                 max_summary_chars=2000, max_documents=20, max_unfolded_turns=200):
+        self.summarize_fn = summarize_fn
+        self.recent_token_budget = recent_token_budget
+        self.min_fold_tokens = min_fold_tokens
+        self.max_summary_chars = max_summary_chars
+        self.max_documents = max_documents
+        self.max_unfolded_turns = max_unfolded_turns
+
+        self._lock = threading.RLock()
+        self._documents = OrderedDict() # doc_key -> _DocumentMemory
+        self._current_key = NO_DOCUMENT_KEY
+
+    # --- Document selection ---
+
+    def set_document(self, doc_key):
+        """Switches to the memory for `doc_key` (None for 'no document loaded')."""
+        with self._lock:
+            self._current_key = doc_key or NO_DOCUMENT_KEY
+            self._get_document(self._current_key)
+
+    @property
+    def current_document(self):
+        with self._lock:
+            return self._current_key
+
+    def _get_document(self, doc_key):
+        """Returns (creating if needed) the memory for `doc_key`. Lock must be held."""
+        memory = self._documents.get(doc_key)
+        if memory is None:
+            memory = self._documents[doc_key] = _DocumentMemory()
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+        self._documents.move_to_end(doc_key)
+        return memory
+
+    # --- Turns ---
+
+    def append(self, role, content, doc_key=None):
+        """Adds a turn ("user" or "assistant") to the current (or given) document's memory."""
+        content = (content or "").strip()
+        if not content:
+            return
+        with self._lock:
+            key = doc_key or self._current_key
+            memory = self._get_document(key)
+            memory.turns.append({"role": role, "content": content})
+            fold_turns = self._overflow_to_fold(memory)
+            if fold_turns:
+                memory.compacting = True
+        if fold_turns:
+            threading.Thread(target=self._compact_worker, args=(key, fold_turns), name="ConversationCompaction", daemon=True).start()
+
+    def retry_compaction(self):
+        """Lifts the back-off after declined summaries, e.g. because summarize_fn now uses another model."""
+        with self._lock:
+            for memory in self._documents.values():
+                memory.declined_tokens = None
+
+    def clear(self, doc_key=None):
+        """Forgets the conversation for the current (or given) document."""
+        with self._lock:
+            self._documents[doc_key or self._current_key] = _DocumentMemory()
+
+    def get_prompt_context(self):
+        """
+        Returns what to include in the next prompt for the current document.
+
+        Returns:
+            tuple: (summary, recent_turns) where recent_turns is a list of {"role", "content"}
+                   dicts (oldest first) that fits in the recent token budget.
+        """
+        with self._lock:
+            memory = self._get_document(self._current_key)
+            window_start = self._window_start(memory.turns)
+            recent_turns = [dict(turn) for turn in memory.turns[window_start:]]
+            if not recent_turns and memory.turns:
+                # The newest turn alone exceeds the budget: keep its tail
+                newest = dict(memory.turns[-1])
+                newest["content"] = "..." + newest["content"][-self.recent_token_budget * 4:]
+                recent_turns = [newest]
+            return memory.summary, recent_turns
+
+    def __len__(self):
+        with self._lock:
+            return len(self._get_document(self._current_key).turns)
+
+    # --- Compaction ---
+
+    def _window_start(self, turns):
+        """Index of the oldest turn that still fits in the recent token budget."""
+        used_tokens = 0
+        for index in range(len(turns) - 1, -1, -1):
+            used_tokens += estimate_tokens(turns[index]["content"])
+            if used_tokens > self.recent_token_budget:
+                return index + 1
+        return 0
+
+    def _overflow_to_fold(self, memory):
+        """Returns the turns to fold into the summary now, or None. Lock must be held."""
+        if memory.compacting:
+            return None
+        overflow = memory.turns[:self._window_start(memory.turns)]
+        if not overflow:
+            return None
+        if self.summarize_fn is None or len(memory.turns) > self.max_unfolded_turns:
+            # No way to summarize (or summarizing keeps failing): drop the overflow
+            if self.summarize_fn is None:
+                del memory.turns[:len(overflow)]
+            else:
+                del memory.turns[:len(memory.turns) - self.max_unfolded_turns]
+            return None
+        overflow_tokens = sum(estimate_tokens(turn["content"]) for turn in overflow)
+        if overflow_tokens < max(self.min_fold_tokens, 2 * (memory.declined_tokens or 0)):
+            return None
+        return list(overflow)
+
+    def _compact_worker(self, doc_key, fold_turns):
+        """Background thread: folds `fold_turns` into the rolling summary of `doc_key`."""
+        with self._lock:
+            previous_summary = self._documents[doc_key].summary if doc_key in self._documents else ""
+        new_summary = None
+        try:
+            new_summary = self.summarize_fn(previous_summary, fold_turns)
+        except Exception as e:
+            print(f"[DEBUG] Conversation compaction failed: {e}") # Debug log
+
+        with self._lock:
+            memory = self._documents.get(doc_key)
+            if memory is None:
+                return # Document memory was evicted meanwhile
+            memory.compacting = False
+            # Only fold if the turns are still at the head (clear() may have replaced them)
+            follow_up = None
+            if not new_summary:
+                if memory.turns[:len(fold_turns)] == fold_turns:
+                    memory.declined_tokens = sum(estimate_tokens(turn["content"]) for turn in fold_turns)
+            elif memory.turns[:len(fold_turns)] == fold_turns:
+                memory.declined_tokens = None
+                memory.summary = new_summary.strip()[:self.max_summary_chars]
+                del memory.turns[:len(fold_turns)]
+                print(f"[DEBUG] Folded {len(fold_turns)} turn(s) into conversation summary.") # Debug log
+                # More turns may have overflowed while the summary was generated
+                follow_up = self._overflow_to_fold(memory)
+                if follow_up:
+                    memory.compacting = True
+        if follow_up:
+            self._compact_worker(doc_key, follow_up)
+
+    # --- Persistence ---
+
+    def export_state(self, doc_key=None):
+        """Returns a JSON-serializable snapshot of one document's memory."""
+        with self._lock:
+            memory = self._get_document(doc_key or self._current_key)
+            return {"summary": memory.summary, "turns": [dict(turn) for turn in memory.turns]}
+
+    def import_state(self, state, doc_key=None):
+        """Restores a snapshot produced by export_state."""
+        with self._lock:
+            memory = self._get_document(doc_key or self._current_key)
+            memory.summary = state.get("summary", "")
+            memory.turns = [{"role": t["role"], "content": t["content"]} for t in state.get("turns", [])
+                            if t.get("role") and t.get("content")]
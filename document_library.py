@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Library of open documents with one search index shared by all of them.
+
+Every loaded PDF stays in the library. The page texts and reading position
+are kept in memory, and a PyMuPDF handle is opened only while the document
+is being shown or extracted. Only the `max_open` most recently used handles
+stay open; older ones are closed and reopened transparently on next use.
+
+The page texts of all documents go into one BM25 index. A question can then
+be matched against every book at once, and each hit says which document and
+page it comes from so the answer can cite it.
+"""
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, namedtuple
+from contextlib import contextmanager
+
+from study_engine import INVALID_PAGE_TEXT_PREFIXES
+
+
+SearchHit = namedtuple("SearchHit", "document page score text")
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+_STOPWORDS = frozenset("""
+    a an and are as at be been but by can do does for from had has have how i if in into is it its me my no not
+    of on or our so than that the their them then there these they this to was we were what when where which
+    who why will with you your
+""".split())
+
+
+def tokenize(text):
+    """Lower-cased word tokens without stopwords and single characters."""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if len(token) > 1 and token not in _STOPWORDS]
+
+
+def split_passages(text, max_chars=800):
+    """Splits page text into passages of about `max_chars` characters, at paragraph or line boundaries."""
+    passages, current = [], ""
+    for block in re.split(r"\n\s*\n|\n", text):
+        block = " ".join(block.split())
+        if not block:
+            continue
+        if current and len(current) + len(block) + 1 > max_chars:
+            passages.append(current)
+            current = ""
+        while len(block) > max_chars: # A single very long paragraph is cut at a word boundary
+            cut = block.rfind(" ", 0, max_chars)
+            cut = cut if cut > max_chars // 2 else max_chars
+            passages.append(block[:cut])
+            block = block[cut:].strip()
+        current = f"{current} {block}" if current else block
+    if current:
+        passages.append(current)
+    return passages
+
+
+class SearchIndex:
+    """
+    In-memory BM25 index over page passages of several documents. Thread-safe.
+
+    Args:
+        passage_chars (int): Approximate size of the indexed passages.
+        k1 (float), b (float): BM25 term-frequency saturation and length normalization.
+    """
+
+    def __init__(self, passage_chars=800, k1=1.2, b=0.75):
+        self.passage_chars = passage_chars
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._passages = {} # passage id -> (doc_key, page, text, length, term counts)
+        self._postings = {} # term -> {passage id: term frequency}
+        self._by_document = {} # doc_key -> [passage ids]
+        self._total_length = 0
+        self._next_id = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._passages)
+
+    def add_document(self, doc_key, page_texts):
+        """Indexes (or re-indexes) the pages of a document. Placeholder texts of failed pages are skipped."""
+        entries = []
+        for page, text in enumerate(page_texts):
+            if not text or text.startswith(INVALID_PAGE_TEXT_PREFIXES):
+                continue
+            for passage in split_passages(text, self.passage_chars):
+                counts = Counter(tokenize(passage))
+                if counts:
+                    entries.append((page, passage, counts))
+        with self._lock:
+            self._remove_locked(doc_key)
+            self._by_document[doc_key] = [self._add_passage(doc_key, page, passage, counts) for page, passage, counts in entries]
+
+    def remove_document(self, doc_key):
+        with self._lock:
+            self._remove_locked(doc_key)
+
+    def _remove_locked(self, doc_key):
+        for passage_id in self._by_document.pop(doc_key, ()):
+            self._remove_passage(passage_id)
+
+    def _add_passage(self, doc_key, page, passage, counts):
+        passage_id = self._next_id
+        self._next_id += 1
+        length = sum(counts.values())
+        self._passages[passage_id] = (doc_key, page, passage, length, counts)
+        for term, frequency in counts.items():
+            self._postings.setdefault(term, {})[passage_id] = frequency
+        self._total_length += length
+        return passage_id
+
+    def _remove_passage(self, passage_id):
+        _, _, _, length, counts = self._passages.pop(passage_id)
+        for term in counts:
+            postings = self._postings[term]
+            del postings[passage_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= length
+
+    def set_page(self, doc_key, page, text):
+        """Re-indexes one page of a document (e.g. once its text has been recognized with OCR)."""
+        entries = [] if not text or text.startswith(INVALID_PAGE_TEXT_PREFIXES) else \
+            [(passage, Counter(tokenize(passage))) for passage in split_passages(text, self.passage_chars)]
+        with self._lock:
+            ids = self._by_document.setdefault(doc_key, [])
+            for passage_id in [passage_id for passage_id in ids if self._passages[passage_id][1] == page]:
+                ids.remove(passage_id)
+                self._remove_passage(passage_id)
+            for passage, counts in entries:
+                if counts:
+                    ids.append(self._add_passage(doc_key, page, passage, counts))
+
+    def search(self, query, limit=5, exclude=()):
+        """
+        Returns up to `limit` (doc_key, page, score, text) tuples, best first, at most one per page.
+
+        Args:
+            query (str): Free-text question.
+            exclude (iterable): (doc_key, page) pairs to leave out (e.g. the page already in the prompt).
+        """
+        terms = set(tokenize(query))
+        excluded = set(exclude)
+        with self._lock:
+            passage_count = len(self._passages)
+            if not terms or not passage_count:
+                return []
+            average_length = self._total_length / passage_count
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (passage_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for passage_id, frequency in postings.items():
+                    length = self._passages[passage_id][3]
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[passage_id] = scores.get(passage_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+            best_per_page = {}
+            for passage_id, score in scores.items():
+                doc_key, page = self._passages[passage_id][:2]
+                if (doc_key, page) in excluded:
+                    continue
+                if score > best_per_page.get((doc_key, page), (0.0, None))[0]:
+                    best_per_page[(doc_key, page)] = (score, passage_id)
+            top = heapq.nlargest(limit, best_per_page.values())
+            return [(self._passages[passage_id][0], self._passages[passage_id][1], score, self._passages[passage_id][2])
+                    for score, passage_id in top]
+
+
+class LibraryDocument:
+    """A document in the library: its file, extracted content and last reading position."""
+
+    def __init__(self, path, page_count):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.page_count = page_count
+        self.doc_hash = None # Set once the file has been hashed
+        self.file_stat = None # (size, mtime)
+        self.page_texts = [] # Normalized, for prompts, speech and search
+        self.display_texts = [] # As extracted, for display
+        self.text_stats = None # Token counts before/after normalization
+        self.page_images = []
+        self.page_layouts = []
+        self.page = 0
+        self.zoom = 1.0
+
+    def citation(self, page):
+        """Label used to cite a page of this document, e.g. "[Physics p. 12]"."""
+        return f"[{self.name} p. {page + 1}]"
+
+
+class DocumentLibrary:
+    """
+    Open documents with lazily opened, LRU-closed PyMuPDF handles and a shared search index.
+
+    Handles in use (see pin() and using()) are never closed; if more than `max_open`
+    handles are pinned, the extra ones are closed as soon as they are released.
+    remove() does the same: a removed document's handle stays open for workers still
+    using it and is closed by the last unpin(). All methods are thread-safe.
+
+    Args:
+        max_open (int): Number of PyMuPDF handles kept open.
+        open_fn (callable): Opens a path and returns a handle (default: fitz.open).
+    """
+
+    def __init__(self, max_open=3, open_fn=None):
+        self.max_open = max_open
+        self.open_fn = open_fn or _open_pdf
+        self.index = SearchIndex()
+        self._lock = threading.RLock()
+        self._documents = OrderedDict() # path -> LibraryDocument, in the order they were added
+        self._handles = OrderedDict() # path -> open handle, least recently used first
+        self._pins = Counter() # path -> number of users of the handle
+        self._retired = {} # removed LibraryDocument -> [handle, pins], closed when no longer used
+
+    def __len__(self):
+        with self._lock:
+            return len(self._documents)
+
+    def documents(self):
+        with self._lock:
+            return list(self._documents.values())
+
+    def find(self, path):
+        with self._lock:
+            return self._documents.get(os.path.abspath(path))
+
+    def add(self, path):
+        """Opens a document and adds it to the library (or returns it if it is already there). Raises if it cannot be opened."""
+        path = os.path.abspath(path)
+        with self._lock:
+            document = self._documents.get(path)
+            if document is not None:
+                return document
+            handle = self.open_fn(path)
+            document = LibraryDocument(path, handle.page_count)
+            self._documents[path] = document
+            self._handles[path] = handle
+            self._trim_handles()
+            return document
+
+    def remove(self, document):
+        """Removes a document from the library and the search index; its handle is closed once no longer pinned."""
+        with self._lock:
+            if self._documents.get(document.path) is not document:
+                return
+            del self._documents[document.path]
+            pins = self._pins.pop(document.path, 0)
+            if pins and document.path in self._handles:
+                self._retired[document] = [self._handles.pop(document.path), pins]
+            else:
+                self._close_handle(document.path)
+        self.index.remove_document(document.path)
+
+    def close_all(self):
+        with self._lock:
+            for path in list(self._handles):
+                self._close_handle(path)
+            for document, (handle, _) in list(self._retired.items()):
+                self._close(document.path, handle)
+            self._documents.clear()
+            self._pins.clear()
+            self._retired.clear()
+
+    # --- Handles ---
+
+    def handle(self, document):
+        """Returns an open handle for the document, reopening it if it was closed, and marks it recently used."""
+        with self._lock:
+            handle = self._handles.get(document.path)
+            if handle is None:
+                handle = self.open_fn(document.path)
+                self._handles[document.path] = handle
+            self._handles.move_to_end(document.path)
+            self._trim_handles()
+            return handle
+
+    def pin(self, document):
+        """Returns the handle and keeps it open until unpin() (e.g. while the document is shown)."""
+        with self._lock:
+            retired = self._retired.get(document)
+            if retired is not None: # Removed, but still in use elsewhere
+                retired[1] += 1
+                return retired[0]
+            self._pins[document.path] += 1
+            return self.handle(document)
+
+    def unpin(self, document):
+        with self._lock:
+            retired = self._retired.get(document)
+            if retired is not None:
+                retired[1] -= 1
+                if retired[1] <= 0: # Last user of a removed document
+                    del self._retired[document]
+                    self._close(document.path, retired[0])
+                return
+            self._pins[document.path] -= 1
+            if self._pins[document.path] <= 0:
+                del self._pins[document.path]
+            self._trim_handles()
+
+    @contextmanager
+    def using(self, document):
+        """Context manager for work on a background thread: the handle stays open until the block ends."""
+        handle = self.pin(document)
+        try:
+            yield handle
+        finally:
+            self.unpin(document)
+
+    def open_handle_count(self):
+        with self._lock:
+            return len(self._handles)
+
+    def _trim_handles(self):
+        excess = len(self._handles) - self.max_open
+        for path in list(self._handles):
+            if excess <= 0:
+                break
+            if not self._pins[path]:
+                self._close_handle(path)
+                excess -= 1
+
+    def _close_handle(self, path):
+        handle = self._handles.pop(path, None)
+        if handle is not None:
+            self._close(path, handle)
+
+    @staticmethod
+    def _close(path, handle):
+        try:
+            handle.close()
+        except Exception as e:
+            print(f"Error closing {path}: {e}")
+
+    # --- Search ---
+
+    def set_page_texts(self, document, page_texts):
+        """Stores the extracted text of a document and (re-)indexes it."""
+        document.page_texts = page_texts
+        self.index.add_document(document.path, page_texts)
+        with self._lock:
+            removed = self._documents.get(document.path) is not document
+        if removed: # Closed while its text was being extracted
+            self.index.remove_document(document.path)
+
+    def set_page_text(self, document, page, text):
+        """Replaces the text of one page (e.g. recognized with OCR) and re-indexes that page."""
+        document.page_texts[page] = text
+        with self._lock:
+            if self._documents.get(document.path) is not document:
+                return
+        self.index.set_page(document.path, page, text)
+
+    def search(self, query, limit=5, exclude=()):
+        """
+        Searches all documents; returns SearchHit(document, page, score, text) tuples, best first.
+
+        Args:
+            exclude (iterable): (document, page) pairs to leave out.
+        """
+        hits = self.index.search(query, limit, exclude=[(document.path, page) for document, page in exclude])
+        with self._lock:
+            return [SearchHit(self._documents[doc_key], page, score, text)
+                    for doc_key, page, score, text in hits if doc_key in self._documents]
+
+
+def _open_pdf(path):
+    import fitz  # PyMuPDF (imported on first use)
+    return fitz.open(path)
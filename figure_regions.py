@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Figure regions of a page, rendered for vision models.
+
+Diagrams are often vector drawings (no embedded image at all) or are split
+into many small image fragments, so the embedded images of a page are a poor
+view of its figures. find_figure_regions() instead groups the bounding boxes
+of the page's vector drawings and image placements into clusters, drops
+clusters that are too small or are tables, and pads the rest so nearby labels
+are included. render_region() rasterizes one such clip at a given DPI.
+
+RegionRenderCache keeps rendered crops per (document, page, region, DPI), so
+asking about the same figure again does not render it again.
+"""
+import threading
+from collections import OrderedDict
+
+
+def _near(a, b, gap):
+    """True if boxes (x0, y0, x1, y1) overlap or are less than `gap` apart (lines have zero width or height)."""
+    return a[0] - gap <= b[2] and b[0] - gap <= a[2] and a[1] - gap <= b[3] and b[1] - gap <= a[3]
+
+
+def _merge_boxes(boxes, gap):
+    """Clusters (box, is_image) entries whose boxes come within `gap` of each other; returns [[box, drawings, images]]."""
+    clusters = []
+    for box, is_image in boxes:
+        merged = [box, 0 if is_image else 1, 1 if is_image else 0]
+        # Joining a cluster can bring the result near others; merge until no remaining cluster is near
+        changed = True
+        while changed:
+            changed = False
+            remaining = []
+            for cluster in clusters:
+                if _near(merged[0], cluster[0], gap):
+                    a, b = merged[0], cluster[0]
+                    merged = [(min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])),
+                              merged[1] + cluster[1], merged[2] + cluster[2]]
+                    changed = True
+                else:
+                    remaining.append(cluster)
+            clusters = remaining
+        clusters.append(merged)
+    return clusters
+
+
+def find_figure_regions(page, min_size=40, gap=10, padding=10, min_drawings=3, max_page_fraction=0.9, max_regions=6):
+    """
+    Finds the figures on a PyMuPDF page from its drawings and image placements.
+
+    Args:
+        min_size (float): Minimum length of the longer side of a region, in points (half of it for the shorter side).
+        gap (float): Boxes closer than this are part of the same figure.
+        padding (float): Margin added around each region (labels, axis titles).
+        min_drawings (int): Minimum number of vector paths in a region without images (a single rule is no figure).
+        max_page_fraction (float): Drawings and images covering more of the page are backgrounds or frames.
+
+    Returns:
+        list: fitz.Rect regions in reading order (top to bottom, left to right), largest first if there are too many.
+    """
+    import fitz  # PyMuPDF (already loaded with the document)
+    page_rect = page.rect
+    max_area = page_rect.width * page_rect.height * max_page_fraction
+    boxes = []
+    for drawing in page.get_cdrawings():
+        x0, y0, x1, y1 = drawing["rect"]
+        if (x1 - x0) * (y1 - y0) <= max_area and (x1 > x0 or y1 > y0):
+            boxes.append(((x0, y0, x1, y1), False))
+    for image in page.get_image_info():
+        x0, y0, x1, y1 = image["bbox"]
+        if 0 < (x1 - x0) * (y1 - y0) <= max_area:
+            boxes.append(((x0, y0, x1, y1), True))
+    if not boxes:
+        return []
+
+    clusters = [(fitz.Rect(box) & page_rect, drawings, images) for box, drawings, images in _merge_boxes(boxes, gap)]
+    clusters = [(rect, drawings, images) for rect, drawings, images in clusters
+                if max(rect.width, rect.height) >= min_size and min(rect.width, rect.height) >= min_size / 2
+                and (images or drawings >= min_drawings)]
+    if not clusters:
+        return []
+    try:
+        # Ruled tables are drawings too; they are sent as text (see page_layout)
+        tables = [fitz.Rect(table.bbox) for table in page.find_tables().tables]
+    except Exception:
+        tables = []
+    regions = []
+    for rect, drawings, images in clusters:
+        if not images and any((rect & table).get_area() >= 0.8 * rect.get_area() for table in tables):
+            continue
+        regions.append((rect + (-padding, -padding, padding, padding)) & page_rect)
+    if len(regions) > max_regions:
+        regions = sorted(regions, key=lambda rect: -rect.get_area())[:max_regions]
+    return sorted(regions, key=lambda rect: (round(rect.y0), rect.x0))
+
+
+def render_region(page, rect, dpi=150, max_dimension=1024):
+    """Renders a clip of the page as PNG bytes at `dpi`, reduced if the longest side would exceed `max_dimension` pixels."""
+    import fitz  # PyMuPDF (already loaded with the document)
+    scale = min(dpi / 72, max_dimension / max(rect.width, rect.height, 1))
+    return page.get_pixmap(matrix=fitz.Matrix(scale, scale), clip=rect, alpha=False).tobytes("png")
+
+
+def region_key(rect):
+    """Hashable form of a region for cache keys (coordinates rounded to 0.1 pt)."""
+    return tuple(round(value, 1) for value in rect)
+
+
+class RegionRenderCache:
+    """
+    In-memory LRU cache of rendered regions, keyed by (document key, page, region_key(rect), dpi). Thread-safe.
+
+    Args:
+        max_bytes (int): Size cap for all cached images; least recently used entries are dropped first.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> encoded image, least recently used first
+        self._total_bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= len(previous)
+            self._entries[key] = data
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes:
+                _, dropped = self._entries.popitem(last=False)
+                self._total_bytes -= len(dropped)
+
+    def render(self, page, doc_key, rect, dpi=150, max_dimension=1024):
+        """Returns the PNG of a region from the cache, rendering it on a miss."""
+        key = (doc_key, page.number, region_key(rect), dpi)
+        data = self.get(key)
+        if data is None:
+            data = render_region(page, rect, dpi, max_dimension)
+            self.put(key, data)
+        return data
+
+    def remove_document(self, doc_key):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == doc_key]:
+                self._total_bytes -= len(self._entries.pop(key))
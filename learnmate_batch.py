@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Headless batch generation of study packs for a folder of PDFs.
+
+Example:
+    python learnmate_batch.py ./course_pdfs --model llama3 --output ./study_packs
+
+Text is extracted in a process pool (one PDF per worker) and study material is
+generated through a bounded pool of concurrent Ollama requests. Every finished
+(page, material) result is appended to a per-document checkpoint, so an
+interrupted run picks up where it stopped. Each document gets a Markdown and a
+JSON study pack with per-stage timing.
+
+With --structured, JSON quiz questions and/or flashcards are generated in
+batches of pages, stored in the study item database (shared with the app) and
+exported as CSV and Anki text files.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import requests
+
+from structured_study import (STRUCTURED_KINDS, StudyItemStore, batch_pages, export_anki, export_csv,
+                              generate_structured_items)
+from study_engine import (DEFAULT_OLLAMA_BASE_URL, PERSONALITIES, STUDY_MATERIAL_TYPES, OllamaClient,
+                          OllamaGenerationError, build_study_material_request, compose_prompt, extract_pdf_texts, file_sha1,
+                          is_page_text_usable_for_study)
+from text_normalize import format_savings
+
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode('utf-8', errors='ignore')).hexdigest()[:16]
+
+
+class DocumentCheckpoint:
+    """Append-only JSON lines checkpoint of finished (page, material) results for one document."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.results = {} # (page_num, material_type) -> record
+
+    def load(self, model, personality, page_texts):
+        """Loads earlier results that still match the model, personality and page text."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # A torn last line from an interrupted run
+                page_num = record.get("page")
+                if (record.get("model") != model or record.get("personality") != personality
+                        or not isinstance(page_num, int) or not 0 <= page_num < len(page_texts)
+                        or record.get("text_hash") != _text_hash(page_texts[page_num])):
+                    continue
+                self.results[(page_num, record["material"])] = record
+
+    def append(self, record):
+        """Stores a finished result and flushes it to disk."""
+        with self._lock:
+            self.results[(record["page"], record["material"])] = record
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def _timed_extract(pdf_path):
+    """Extracts page texts and reports how long it took. Executed on the extraction process pool."""
+    start_time = time.perf_counter()
+    page_texts, normalization_stats = extract_pdf_texts(pdf_path)
+    return page_texts, normalization_stats, time.perf_counter() - start_time
+
+
+def _generate_one(client, model, system_prompt, material_type, page_num, page_text):
+    """Runs one study material request. Executed on the bounded Ollama request pool."""
+    request_label, _, ai_instruction = build_study_material_request(material_type, page_num, page_text)
+    prompt = compose_prompt(system_prompt, ai_instruction)
+    start_time = time.perf_counter()
+    response_data = client.generate(model, prompt)
+    return {
+        "page": page_num,
+        "material": material_type,
+        "label": request_label,
+        "response": response_data.get('response', '').strip(),
+        "generation_seconds": round(time.perf_counter() - start_time, 3),
+    }
+
+
+def _generate_structured_batch(client, model, system_prompt, kind, batch):
+    """Runs one batched structured request. Executed on the bounded Ollama request pool."""
+    start_time = time.perf_counter()
+    items, _ = generate_structured_items(client, model, kind, batch, system_prompt)
+    return items, time.perf_counter() - start_time
+
+
+def pack_name(pdf_path, input_dir):
+    """
+    Study pack folder of a PDF, relative to the output folder: its path below `input_dir` without
+    the extension (e.g. "a/notes"), so PDFs with the same name in different sub-folders do not collide.
+    """
+    return os.path.splitext(os.path.relpath(pdf_path, input_dir))[0]
+
+
+def process_structured(pdf_path, page_texts, args, client, request_pool, item_store):
+    """Generates structured quiz/flashcard items for pages not yet in the store and exports them."""
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    doc_dir = os.path.join(args.output, pack_name(pdf_path, args.input_dir))
+    doc_hash = file_sha1(pdf_path)
+    system_prompt = PERSONALITIES[args.personality]["system_prompt"]
+
+    futures = {}
+    for kind in args.structured:
+        # Pages already in the database act as the checkpoint for structured output
+        pages_done = item_store.pages_with_items(doc_hash, kind)
+        pending_pages = [(p, text) for p, text in enumerate(page_texts) if p not in pages_done]
+        for batch in batch_pages(pending_pages, max_pages=args.pages_per_request):
+            future = request_pool.submit(_generate_structured_batch, client, args.model, system_prompt, kind, batch)
+            futures[future] = (kind, batch)
+
+    structured_start = time.perf_counter()
+    request_seconds, failed_count = 0.0, 0
+    for future in as_completed(futures):
+        kind, batch = futures[future]
+        page_list = ",".join(str(p + 1) for p, _ in batch)
+        try:
+            items, seconds = future.result()
+        except (requests.exceptions.RequestException, OllamaGenerationError) as e:
+            failed_count += 1
+            print(f"[ERROR] {base_name} pages {page_list} structured {kind}: {e}", file=sys.stderr)
+            continue
+        request_seconds += seconds
+        if not items:
+            failed_count += 1
+            print(f"[ERROR] {base_name} pages {page_list} structured {kind}: no usable items", file=sys.stderr)
+            continue
+        item_store.add_items(doc_hash, os.path.basename(pdf_path), kind, items, args.model)
+        print(f"[{base_name}] pages {page_list} {kind}: {len(items)} items in {seconds:.1f}s")
+
+    all_items = [item for kind in args.structured for item in item_store.query(doc_hash=doc_hash, kind=kind)]
+    if all_items:
+        export_csv(all_items, os.path.join(doc_dir, f"{base_name}_items.csv"))
+        export_anki(all_items, os.path.join(doc_dir, f"{base_name}_anki.txt"))
+    return {
+        "structured_wall_seconds": round(time.perf_counter() - structured_start, 3),
+        "structured_request_seconds_total": round(request_seconds, 3),
+        "structured_requests": len(futures),
+        "structured_requests_failed": failed_count,
+        "structured_items": len(all_items),
+    }
+
+
+def _write_study_pack(doc_dir, pdf_path, page_texts, checkpoint, materials, timings):
+    """Writes <name>.md and <name>.json from the checkpointed results."""
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    pages = []
+    for page_num in range(len(page_texts)):
+        page_entry = {"page": page_num + 1, "materials": {}}
+        for material_type in materials:
+            record = checkpoint.results.get((page_num, material_type))
+            if record:
+                page_entry["materials"][material_type] = {
+                    "content": record["response"],
+                    "generation_seconds": record["generation_seconds"],
+                }
+        if page_entry["materials"]:
+            pages.append(page_entry)
+
+    with open(os.path.join(doc_dir, f"{base_name}.json"), "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.abspath(pdf_path), "timings": timings, "pages": pages}, f, ensure_ascii=False, indent=2)
+
+    md_lines = [f"# Study Pack: {base_name}", ""]
+    for page_entry in pages:
+        md_lines.append(f"## Page {page_entry['page']}")
+        md_lines.append("")
+        for material_type, material in page_entry["materials"].items():
+            md_lines.append(f"### {material_type.replace('_', ' ').title()}")
+            md_lines.append("")
+            md_lines.append(material["content"])
+            md_lines.append("")
+    with open(os.path.join(doc_dir, f"{base_name}.md"), "w", encoding="utf-8") as f:
+        f.write("\n".join(md_lines))
+
+
+def process_document(pdf_path, page_texts, extraction_seconds, args, client, request_pool):
+    """Generates (or resumes) the study pack for one extracted document."""
+    base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    doc_dir = os.path.join(args.output, pack_name(pdf_path, args.input_dir))
+    os.makedirs(doc_dir, exist_ok=True)
+    system_prompt = PERSONALITIES[args.personality]["system_prompt"]
+
+    checkpoint = DocumentCheckpoint(os.path.join(doc_dir, "checkpoint.jsonl"))
+    checkpoint.load(args.model, args.personality, page_texts)
+    resumed_count = len(checkpoint.results)
+
+    generation_start = time.perf_counter()
+    futures = {}
+    for page_num, page_text in enumerate(page_texts):
+        if not is_page_text_usable_for_study(page_text):
+            continue
+        for material_type in args.materials:
+            if (page_num, material_type) in checkpoint.results:
+                continue
+            future = request_pool.submit(_generate_one, client, args.model, system_prompt, material_type, page_num, page_text)
+            futures[future] = (page_num, material_type, _text_hash(page_text))
+
+    failed_count = 0
+    for future in as_completed(futures):
+        page_num, material_type, text_hash = futures[future]
+        try:
+            record = future.result()
+        except (requests.exceptions.RequestException, OllamaGenerationError) as e:
+            failed_count += 1
+            print(f"[ERROR] {base_name} page {page_num + 1} {material_type}: {e}", file=sys.stderr)
+            continue
+        record.update({"model": args.model, "personality": args.personality, "text_hash": text_hash})
+        checkpoint.append(record)
+        print(f"[{base_name}] page {page_num + 1} {material_type} done in {record['generation_seconds']:.1f}s")
+
+    generation_records = [checkpoint.results[key] for key in checkpoint.results]
+    timings = {
+        "extraction_seconds": round(extraction_seconds, 3),
+        "generation_wall_seconds": round(time.perf_counter() - generation_start, 3),
+        "generation_request_seconds_total": round(sum(r["generation_seconds"] for r in generation_records), 3),
+        "pages": len(page_texts),
+        "requests_completed": len(generation_records),
+        "requests_resumed": resumed_count,
+        "requests_failed": failed_count,
+    }
+    _write_study_pack(doc_dir, pdf_path, page_texts, checkpoint, args.materials, timings)
+    return timings
+
+
+def find_pdfs(input_dir, recursive):
+    """Returns the sorted PDF paths in `input_dir`."""
+    pdf_paths = []
+    for dir_path, dir_names, file_names in os.walk(input_dir):
+        pdf_paths.extend(os.path.join(dir_path, name) for name in file_names if name.lower().endswith(".pdf"))
+        if not recursive:
+            break
+    return sorted(pdf_paths)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate study packs (summaries, quizzes, key points) for a folder of PDFs.")
+    parser.add_argument("input_dir", help="Folder containing PDF files")
+    parser.add_argument("--model", required=True, help="Ollama model name, e.g. llama3")
+    parser.add_argument("--output", default="study_packs", help="Output folder (default: ./study_packs)")
+    parser.add_argument("--materials", default=",".join(STUDY_MATERIAL_TYPES),
+                        help=f"Comma-separated material types, or 'none' (default: {','.join(STUDY_MATERIAL_TYPES)})")
+    parser.add_argument("--personality", default="Default Tutor", choices=sorted(PERSONALITIES), metavar="NAME",
+                        help="Tutor personality used for the system prompt")
+    parser.add_argument("--extract-workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Processes used for PDF text extraction")
+    parser.add_argument("--ollama-workers", type=int, default=2, help="Maximum concurrent Ollama requests")
+    parser.add_argument("--ollama-url", default=DEFAULT_OLLAMA_BASE_URL, help="Ollama base URL")
+    parser.add_argument("--recursive", action="store_true", help="Also process PDFs in sub-folders")
+    parser.add_argument("--structured", default="",
+                        help=f"Comma-separated structured item kinds to generate ({','.join(STRUCTURED_KINDS)})")
+    parser.add_argument("--pages-per-request", type=int, default=3, help="Pages batched into one structured request")
+    parser.add_argument("--db", default=None, help="Study item database path (default: shared with the app)")
+    args = parser.parse_args(argv)
+
+    args.structured = [k.strip() for k in args.structured.split(",") if k.strip()]
+    unknown_kinds = [k for k in args.structured if k not in STRUCTURED_KINDS]
+    if unknown_kinds:
+        parser.error(f"Unknown structured kind(s): {', '.join(unknown_kinds)}")
+    if args.pages_per_request < 1:
+        parser.error("--pages-per-request must be at least 1.")
+
+    args.materials = [m.strip() for m in args.materials.split(",") if m.strip()] if args.materials != "none" else []
+    unknown_materials = [m for m in args.materials if m not in STUDY_MATERIAL_TYPES]
+    if unknown_materials:
+        parser.error(f"Unknown material type(s): {', '.join(unknown_materials)}")
+    if args.extract_workers < 1 or args.ollama_workers < 1:
+        parser.error("Worker counts must be at least 1.")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    pdf_paths = find_pdfs(args.input_dir, args.recursive)
+    if not pdf_paths:
+        print(f"No PDF files found in {args.input_dir}", file=sys.stderr)
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+
+    client = OllamaClient(args.ollama_url)
+    item_store = StudyItemStore(args.db) if args.structured else None
+    run_start = time.perf_counter()
+    run_summary = {}
+    failed_documents = 0
+
+    # Extraction runs in processes; generation for a document starts as soon as its text is ready
+    with ProcessPoolExecutor(max_workers=args.extract_workers) as extract_pool, \
+         ThreadPoolExecutor(max_workers=args.ollama_workers) as request_pool:
+        extract_futures = {extract_pool.submit(_timed_extract, path): path for path in pdf_paths}
+        for future in as_completed(extract_futures):
+            pdf_path = extract_futures[future]
+            try:
+                page_texts, normalization_stats, extraction_seconds = future.result()
+            except Exception as e:
+                failed_documents += 1
+                print(f"[ERROR] Failed to extract {pdf_path}: {e}", file=sys.stderr)
+                continue
+            print(f"Extracted {len(page_texts)} pages from {os.path.basename(pdf_path)} in {extraction_seconds:.1f}s"
+                  f" ({format_savings(normalization_stats)})")
+            run_summary[pdf_path] = process_document(pdf_path, page_texts, extraction_seconds, args, client, request_pool)
+            run_summary[pdf_path]["pack"] = pack_name(pdf_path, args.input_dir)
+            run_summary[pdf_path]["text_normalization"] = normalization_stats
+            if item_store:
+                run_summary[pdf_path].update(process_structured(pdf_path, page_texts, args, client, request_pool, item_store))
+
+    run_summary_path = os.path.join(args.output, "run_summary.json")
+    with open(run_summary_path, "w", encoding="utf-8") as f:
+        json.dump({"total_seconds": round(time.perf_counter() - run_start, 3), "documents": run_summary}, f, indent=2)
+    print(f"Done. Study packs written to {os.path.abspath(args.output)} (summary: {run_summary_path})")
+    return 1 if failed_documents else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Incremental Markdown rendering for Tk Text widgets.
+
+IncrementalMarkdownRenderer turns Markdown text, fed in arbitrary pieces (for
+example tokens of a streamed answer), into (text, tags) segments. Each
+character is examined once: only a few characters whose meaning depends on
+what follows (the start of a line, a lone '*') are held back until the next
+piece arrives. Already emitted text is never revisited, so the work per piece
+does not depend on the length of the message.
+
+Supported: '#' headings, '-', '*', '+' and numbered list items, **bold**,
+`inline code` and ``` fenced code blocks. Formatting uses the fixed tag names
+in MARKDOWN_TAGS, configured once per widget with configure_markdown_tags().
+"""
+import re
+
+
+MARKDOWN_TAGS = ("md_h1", "md_h2", "md_h3", "md_bold", "md_code", "md_code_block", "md_bullet")
+
+_HEADING_RE = re.compile(r"(#{1,6})[ \t]+")
+_BULLET_RE = re.compile(r"([ \t]*)[-*+][ \t]+")
+_NUMBERED_RE = re.compile(r"([ \t]*)(\d{1,9}[.)])[ \t]+")
+_FENCE_RE = re.compile(r"[ \t]*```")
+# A line start that may still turn into one of the constructs above once more text arrives
+_UNDECIDED_LINE_START_RE = re.compile(r"[ \t]*(#{0,6}|[-*+]|\d{1,9}[.)]?|`{1,2})")
+
+
+def configure_markdown_tags(text_widget, font_family="Segoe UI", font_size=10, code_font_family="Consolas",
+                            code_background="#1E1E1E"):
+    """Configures the Markdown tags of a Text widget (once; the tags are shared by all messages)."""
+    text_widget.tag_configure("md_h1", font=(font_family, font_size + 5, "bold"), spacing1=6, spacing3=3)
+    text_widget.tag_configure("md_h2", font=(font_family, font_size + 3, "bold"), spacing1=5, spacing3=2)
+    text_widget.tag_configure("md_h3", font=(font_family, font_size + 1, "bold"), spacing1=4, spacing3=2)
+    text_widget.tag_configure("md_bold", font=(font_family, font_size, "bold"))
+    text_widget.tag_configure("md_code", font=(code_font_family, font_size), background=code_background)
+    text_widget.tag_configure("md_code_block", font=(code_font_family, font_size), background=code_background,
+                              lmargin1=12, lmargin2=12)
+    text_widget.tag_configure("md_bullet", lmargin1=12, lmargin2=26)
+
+
+class IncrementalMarkdownRenderer:
+    """
+    Streaming Markdown to (text, tags) converter for one message.
+
+    Args:
+        base_tags (tuple): Tags applied to all text of the message (e.g. ("ai",)).
+        max_line_start_chars (int): A line start is treated as plain text after this many undecided characters.
+    """
+
+    def __init__(self, base_tags=(), max_line_start_chars=16):
+        self.base_tags = tuple(base_tags)
+        self.max_line_start_chars = max_line_start_chars
+        self._pending = "" # Received but not yet rendered text
+        self._at_line_start = True
+        self._line_tags = () # Heading/list tag of the current line
+        self._in_code_block = False
+        self._bold = False
+        self._inline_code = False
+
+    def feed(self, text):
+        """Adds text; returns the segments that can be rendered now."""
+        self._pending += text
+        return self._render(final=False)
+
+    def finish(self):
+        """Renders everything still held back (the message is complete)."""
+        return self._render(final=True)
+
+    def render(self, text):
+        """Renders a complete message in one call."""
+        return self.feed(text) + self.finish()
+
+    # --- Parsing ---
+
+    def _tags(self):
+        if self._in_code_block:
+            return self.base_tags + ("md_code_block",)
+        tags = self.base_tags + self._line_tags
+        if self._bold:
+            tags += ("md_bold",)
+        if self._inline_code:
+            tags += ("md_code",)
+        return tags
+
+    def _render(self, final):
+        segments = []
+
+        def emit(text, tags):
+            if not text:
+                return
+            if segments and segments[-1][1] == tags:
+                segments[-1] = (segments[-1][0] + text, tags)
+            else:
+                segments.append((text, tags))
+
+        text, pos = self._pending, 0
+        while pos < len(text):
+            if self._at_line_start:
+                consumed = self._start_line(text, pos, final, emit)
+                if consumed is None:
+                    break # Need more text to decide what this line is
+                pos = consumed
+                continue
+
+            newline = text.find("\n", pos)
+            if self._in_code_block:
+                end = newline if newline != -1 else len(text)
+                emit(text[pos:end], self._tags())
+                pos = end
+            else:
+                pos = self._render_inline(text, pos, newline if newline != -1 else len(text), final, emit)
+                if pos is None:
+                    pos = len(text) - 1 # A lone '*' at the end is held back
+                    break
+            if pos < len(text) and text[pos] == "\n":
+                emit("\n", self._tags())
+                pos += 1
+                self._end_line()
+
+        self._pending = text[pos:]
+        if final and self._pending:
+            emit(self._pending, self._tags())
+            self._pending = ""
+        return segments
+
+    def _end_line(self):
+        self._at_line_start = True
+        self._line_tags = ()
+        self._bold = False # Unclosed inline formatting does not leak into the next line
+        self._inline_code = False
+
+    def _start_line(self, text, pos, final, emit):
+        """Handles the start of a line; returns the new position, or None if more text is needed."""
+        newline = text.find("\n", pos)
+        line_start = text[pos:newline if newline != -1 else len(text)]
+        if newline == -1 and not final and len(line_start) < self.max_line_start_chars \
+                and _UNDECIDED_LINE_START_RE.fullmatch(line_start):
+            return None
+
+        fence = _FENCE_RE.match(line_start)
+        if fence:
+            if newline == -1 and not final:
+                return None # The language name after the fence is dropped with the rest of the line
+            self._in_code_block = not self._in_code_block
+            self._at_line_start = True
+            return newline + 1 if newline != -1 else len(text)
+
+        self._at_line_start = False
+        if self._in_code_block:
+            return pos
+
+        heading = _HEADING_RE.match(line_start)
+        if heading:
+            self._line_tags = (f"md_h{min(3, len(heading.group(1)))}",)
+            return pos + heading.end()
+        bullet = _BULLET_RE.match(line_start)
+        if bullet:
+            self._line_tags = ("md_bullet",)
+            emit(bullet.group(1) + "• ", self._tags())
+            return pos + bullet.end()
+        numbered = _NUMBERED_RE.match(line_start)
+        if numbered:
+            self._line_tags = ("md_bullet",)
+            emit(f"{numbered.group(1)}{numbered.group(2)} ", self._tags())
+            return pos + numbered.end()
+        return pos
+
+    def _render_inline(self, text, pos, end, final, emit):
+        """Renders text[pos:end] (no newline inside); returns end, or None if a trailing '*' must wait."""
+        while pos < end:
+            special = min((i for i in (text.find("*", pos, end), text.find("`", pos, end)) if i != -1), default=end)
+            emit(text[pos:special], self._tags())
+            if special == end:
+                return end
+            if text[special] == "`":
+                self._inline_code = not self._inline_code
+                pos = special + 1
+            elif self._inline_code:
+                emit("*", self._tags())
+                pos = special + 1
+            elif special + 1 < end and text[special + 1] == "*":
+                self._bold = not self._bold
+                pos = special + 2
+            elif special + 1 == len(text) and not final:
+                return None # Could be the first half of '**'
+            else:
+                emit("*", self._tags())
+                pos = special + 1
+        return end
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+OCR for pages without a text layer (scanned pages).
+
+Pages are recognized with PyMuPDF's Tesseract integration (page.get_textpage_ocr)
+on a small process pool whose workers run at low OS priority, so OCR only
+uses CPU time the UI and the AI host do not need. OCRScheduler hands a page to
+the pool only when a worker is free and always picks the most urgent pending
+page at that moment, so the order follows the page the user is reading.
+
+Results are keyed by page_content_hash(), which covers the page's drawing
+commands and embedded image data: a page is recognized once, even if it
+appears in another file.
+"""
+import hashlib
+import multiprocessing
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+
+_tessdata_lock = threading.Lock()
+_tessdata = None # Path found by ocr_available(); "" if Tesseract is not installed
+
+
+def ocr_available():
+    """True if Tesseract and its language data can be found (checked once; may run `tesseract --list-langs`)."""
+    global _tessdata
+    with _tessdata_lock:
+        if _tessdata is None:
+            try:
+                import fitz  # PyMuPDF (already loaded with the document)
+                _tessdata = fitz.get_tessdata() or ""
+            except Exception:
+                _tessdata = ""
+        return bool(_tessdata)
+
+
+def page_content_hash(pdf_document, page_index):
+    """SHA-1 of a page's content stream and raw image data, or None if the page has no images to recognize."""
+    page = pdf_document.load_page(page_index)
+    images = page.get_images(full=True)
+    if not images:
+        return None
+    digest = hashlib.sha1(page.read_contents())
+    for image in images:
+        digest.update(pdf_document.xref_stream_raw(image[0]) or b"")
+    return digest.hexdigest()
+
+
+# --- Pool processes ---
+
+_worker_documents = OrderedDict() # pdf_path -> open document, kept between jobs (most recent last)
+
+
+def _lower_priority():
+    """Pool initializer: runs OCR at low OS priority."""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            BELOW_NORMAL_PRIORITY_CLASS = 0x4000
+            ctypes.windll.kernel32.SetPriorityClass(ctypes.windll.kernel32.GetCurrentProcess(), BELOW_NORMAL_PRIORITY_CLASS)
+        else:
+            os.nice(10)
+    except Exception as e:
+        print(f"[DEBUG] Could not lower OCR worker priority: {e}") # Debug log
+
+
+def ocr_page(pdf_path, page_index, language="eng", dpi=300):
+    """
+    Recognizes the text of one page. Executed in a pool process.
+
+    Returns:
+        tuple: (page_text, layout) as returned by page_layout.extract_page_layout.
+    """
+    import fitz  # PyMuPDF
+    from page_layout import extract_page_layout
+    document = _worker_documents.pop(pdf_path, None) or fitz.open(pdf_path)
+    _worker_documents[pdf_path] = document
+    while len(_worker_documents) > 2:
+        _worker_documents.popitem(last=False)[1].close()
+    if not ocr_available(): # Looked up once per pool process
+        raise RuntimeError("Tesseract language data not found")
+    page = document.load_page(page_index)
+    textpage = page.get_textpage_ocr(language=language, dpi=dpi, full=True, tessdata=_tessdata)
+    return extract_page_layout(page, detect_tables=False, textpage=textpage)
+
+
+# --- Scheduling (main process) ---
+
+class OCRScheduler:
+    """
+    Runs page OCR jobs on a low-priority process pool, most urgent first.
+
+    Jobs are dicts with at least "key", "pdf_path" and "page" (optional "language").
+    The pool is started with the first job.
+
+    Args:
+        priority_fn (callable): priority_fn(job) -> sortable value; the lowest runs next. Evaluated each
+            time a worker becomes free, so priorities can change while jobs wait.
+        on_result (callable): on_result(job, (page_text, layout)), called on a pool thread.
+        on_error (callable, optional): on_error(job, exception), called on a pool thread.
+        max_workers (int): Pool processes (pages recognized in parallel).
+    """
+
+    def __init__(self, priority_fn, on_result, on_error=None, max_workers=1):
+        self.priority_fn = priority_fn
+        self.on_result = on_result
+        self.on_error = on_error
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pending = {} # key -> job
+        self._running = {} # key -> job
+        self._executor = None
+        self._shutdown = False
+
+    def submit(self, jobs):
+        """Queues jobs (a job whose key is already queued or running is ignored)."""
+        with self._lock:
+            for job in jobs:
+                if job["key"] not in self._pending and job["key"] not in self._running:
+                    self._pending[job["key"]] = job
+        self._pump()
+
+    def cancel(self, predicate):
+        """Drops pending jobs for which predicate(job) is true (running pages finish, their results are delivered)."""
+        with self._lock:
+            for key in [key for key, job in self._pending.items() if predicate(job)]:
+                del self._pending[key]
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending) + len(self._running)
+
+    def shutdown(self):
+        with self._lock:
+            self._shutdown = True
+            self._pending.clear()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _pump(self):
+        while True:
+            with self._lock:
+                if self._shutdown or not self._pending or len(self._running) >= self.max_workers:
+                    return
+                job = min(self._pending.values(), key=self.priority_fn)
+                del self._pending[job["key"]]
+                self._running[job["key"]] = job
+                if self._executor is None:
+                    # Spawned, not forked: the app process has Tk and worker threads
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_lower_priority,
+                                                         mp_context=multiprocessing.get_context("spawn"))
+                executor = self._executor
+            try:
+                future = executor.submit(ocr_page, job["pdf_path"], job["page"], job.get("language", "eng"))
+            except RuntimeError as e: # Shut down meanwhile, or a worker process died (BrokenProcessPool)
+                self.shutdown() # OCR stops for this session rather than failing page after page
+                if self.on_error:
+                    self.on_error(job, e)
+                return
+            future.add_done_callback(lambda future, job=job: self._on_done(job, future))
+
+    def _on_done(self, job, future):
+        if future.cancelled():
+            self._finish(job, None, None)
+            return
+        error = future.exception()
+        self._finish(job, None if error else future.result(), error)
+
+    def _finish(self, job, result, error):
+        with self._lock:
+            self._running.pop(job["key"], None)
+            shutdown = self._shutdown
+        if not shutdown:
+            try:
+                if error is not None:
+                    if self.on_error:
+                        self.on_error(job, error)
+                elif result is not None:
+                    self.on_result(job, result)
+            finally:
+                self._pump()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Layout-aware page text extraction.
+
+extract_page_layout() reads a page once with PyMuPDF's get_text("dict") and
+returns the page text together with a compact description of its structure:
+a list of [kind, start, end] entries marking headings (larger or bold short
+lines), code (runs set in a monospace font) and tables (found with
+page.find_tables(), flattened to one row per line). Offsets index into the
+page text, so the structure costs a few integers per block and can be stored
+next to the text.
+
+Prompts and the code explainer use format_page_for_prompt() and
+layout_blocks() instead of rescanning the text with heuristics.
+"""
+import re
+from collections import Counter
+
+
+LAYOUT_KINDS = ("heading", "code", "table")
+
+_MONOSPACE_FONT_RE = re.compile(r"mono|courier|consol|menlo|inconsolata|typewriter|lucida ?console|code|cmtt|\btt\d", re.IGNORECASE)
+_FLAG_MONOSPACED = 8 # PyMuPDF span flags
+_FLAG_BOLD = 16
+
+
+def _is_monospace(span):
+    return bool(span["flags"] & _FLAG_MONOSPACED) or bool(_MONOSPACE_FONT_RE.search(span["font"]))
+
+
+def _is_bold(span):
+    return bool(span["flags"] & _FLAG_BOLD) or "bold" in span["font"].lower()
+
+
+def _inside(bbox, area):
+    """True if the centre of `bbox` lies within `area`."""
+    x = (bbox[0] + bbox[2]) / 2
+    y = (bbox[1] + bbox[3]) / 2
+    return area[0] <= x <= area[2] and area[1] <= y <= area[3]
+
+
+def _find_tables(page):
+    """Returns [(bbox, rows)] for the tables on the page ([] if none, or if this PyMuPDF cannot detect tables)."""
+    try:
+        # Table detection looks for ruling lines and is slow; pages without vector drawings are skipped
+        if len(page.get_cdrawings()) < 2:
+            return []
+        tables = page.find_tables().tables
+    except Exception:
+        return []
+    found = []
+    for table in tables:
+        try:
+            rows = [[" ".join((cell or "").split()) for cell in row] for row in table.extract()]
+        except Exception:
+            continue
+        if len(rows) >= 2 and any(any(row) for row in rows):
+            found.append((tuple(table.bbox), rows))
+    return found
+
+
+def _classify_block(lines, body_size):
+    """Returns "code", "heading" or None for a text block given as a list of span lists."""
+    spans = [span for line in lines for span in line if span["text"].strip()]
+    if not spans:
+        return None
+    chars = sum(len(span["text"].strip()) for span in spans)
+    mono_chars = sum(len(span["text"].strip()) for span in spans if _is_monospace(span))
+    if mono_chars >= 0.6 * chars:
+        return "code"
+    text_length = sum(len(span["text"]) for span in spans)
+    if len(lines) <= 3 and text_length <= 150:
+        max_size = max(span["size"] for span in spans)
+        if max_size >= body_size * 1.15:
+            return "heading"
+        if text_length <= 80 and all(_is_bold(span) for span in spans) and max_size >= body_size - 0.5:
+            return "heading"
+    return None
+
+
+def extract_page_layout(page, detect_tables=True, textpage=None):
+    """
+    Extracts the text of a PyMuPDF page and its structure in one pass.
+    `textpage` may be an OCR text page (page.get_textpage_ocr()) to read instead of the text layer.
+
+    Returns:
+        tuple: (page_text, layout) where layout is a list of [kind, start, end] with kind in
+               LAYOUT_KINDS and page_text[start:end] the text of that block.
+    """
+    import fitz  # PyMuPDF (already loaded with the document)
+    page_dict = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT, sort=True, textpage=textpage) # Same text as get_text("text"), no image data
+    blocks = []
+    size_counts = Counter()
+    for block in page_dict["blocks"]:
+        if block.get("type", 0) != 0:
+            continue
+        lines = [line["spans"] for line in block["lines"] if line["spans"]]
+        if not lines:
+            continue
+        blocks.append((block["bbox"], lines))
+        for line in lines:
+            for span in line:
+                size_counts[round(span["size"] * 2) / 2] += len(span["text"].strip())
+    body_size = size_counts.most_common(1)[0][0] if size_counts else 0.0
+
+    tables = _find_tables(page) if detect_tables and blocks else []
+    emitted_tables = set()
+    parts, layout, offset = [], [], 0
+
+    def emit(text, kind):
+        nonlocal offset
+        start = offset
+        parts.append(text + "\n\n") # Blocks are separated by a blank line
+        offset += len(text) + 2
+        if kind is None:
+            return
+        # Consecutive code blocks (PyMuPDF often splits a listing) become one entry
+        if layout and layout[-1][0] == kind == "code" and layout[-1][2] == start - 2:
+            layout[-1][2] = start + len(text)
+        else:
+            layout.append([kind, start, start + len(text)])
+
+    for bbox, lines in blocks:
+        table_index = next((i for i, (area, _) in enumerate(tables) if _inside(bbox, area)), None)
+        if table_index is not None:
+            if table_index not in emitted_tables: # The table replaces all the text blocks inside it
+                emitted_tables.add(table_index)
+                emit("\n".join(" | ".join(row) for row in tables[table_index][1]), "table")
+            continue
+        text = "\n".join("".join(span["text"] for span in line) for line in lines)
+        if text.strip():
+            emit(text, _classify_block(lines, body_size))
+
+    page_text = "".join(parts).rstrip() # Leading whitespace is kept: it may be the indentation of code
+    return page_text, layout
+
+
+def layout_blocks(page_text, layout, kind=None):
+    """Returns [(kind, text)] for the structured blocks of a page, optionally only those of one kind."""
+    return [(block_kind, page_text[start:end]) for block_kind, start, end in (layout or ())
+            if kind is None or block_kind == kind]
+
+
+def format_page_for_prompt(page_text, layout):
+    """Page text with its structure marked up as Markdown (headings, fenced code, table rows)."""
+    if not layout:
+        return page_text
+    parts, position = [], 0
+    for kind, start, end in layout:
+        parts.append(page_text[position:start])
+        block = page_text[start:end]
+        if kind == "heading":
+            parts.append("## " + " ".join(block.split()))
+        elif kind == "code":
+            parts.append(f"```\n{block}\n```")
+        else:
+            parts.append("\n".join(f"| {row} |" for row in block.split("\n")))
+        position = end
+    parts.append(page_text[position:])
+    return "".join(parts)
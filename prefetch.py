@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Idle-time speculative generation of study material for upcoming PDF pages."""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class StudyMaterialPrefetcher:
+    """
+    Runs speculative study-material jobs on a single low-priority worker thread.
+
+    Jobs are only started while no interactive request is in flight and the
+    AI host has been idle for `idle_delay` seconds. Starting an interactive
+    request cancels the running speculative job, which is put back on the
+    queue and retried once the host is idle again.
+
+    Args:
+        generate_fn (callable): Called as generate_fn(job, cancel_event) on the worker
+            thread. Must return the generated text, or None if it was cancelled.
+        depth (int): How many pages ahead of the current page to precompute.
+        max_queue (int): Maximum number of pending speculative jobs.
+        max_load_per_cpu (float): Skip speculative work while the 1-minute load average
+            per CPU is above this value (ignored where os.getloadavg is unavailable).
+        idle_delay (float): Seconds of interactive inactivity required before a job starts.
+        max_cache_entries (int): Number of generated results kept in memory (LRU).
+    """
+
+    def __init__(self, generate_fn, depth=2, max_queue=8, max_load_per_cpu=0.75, idle_delay=1.5, max_cache_entries=64):
+        self.generate_fn = generate_fn
+        self.depth = depth
+        self.max_queue = max_queue
+        self.max_load_per_cpu = max_load_per_cpu
+        self.idle_delay = idle_delay
+        self.max_cache_entries = max_cache_entries
+        self.enabled = True
+
+        self._condition = threading.Condition()
+        self._pending = [] # Ordered list of job dicts, highest priority first
+        self._cache = OrderedDict() # job key -> generated text
+        self._running_job = None
+        self._cancel_event = threading.Event()
+        self._interactive_count = 0
+        self._last_interactive_time = 0.0
+        self._shutdown = False
+        self._generation = 0 # Bumped by clear() so results for a closed document are discarded
+
+        self._worker = threading.Thread(target=self._worker_loop, name="StudyPrefetch", daemon=True)
+        self._worker.start()
+
+    # --- Scheduling ---
+
+    def schedule(self, jobs):
+        """Replaces the pending queue with `jobs` (highest priority first), skipping cached keys."""
+        with self._condition:
+            running_key = self._running_job["key"] if self._running_job else None
+            self._pending = [job for job in jobs
+                             if job["key"] not in self._cache and job["key"] != running_key][:self.max_queue]
+            self._condition.notify_all()
+
+    def clear(self):
+        """Drops all pending jobs and cached results (e.g. when a new PDF is loaded)."""
+        with self._condition:
+            self._pending = []
+            self._cache.clear()
+            self._generation += 1
+            self._cancel_event.set()
+            self._condition.notify_all()
+
+    def get_cached(self, key):
+        """Returns the cached result for `key`, or None if it has not been generated yet."""
+        with self._condition:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+            return result
+
+    def put_cached(self, key, result):
+        """Adds a result generated elsewhere (an interactive request, or restored from disk)."""
+        with self._condition:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+            self._pending = [job for job in self._pending if job["key"] != key]
+
+    # --- Interactive priority ---
+
+    def begin_interactive(self):
+        """Marks an interactive request as in flight and cancels any running speculative job."""
+        with self._condition:
+            self._interactive_count += 1
+            self._last_interactive_time = time.monotonic()
+            if self._running_job is not None:
+                self._cancel_event.set()
+
+    def end_interactive(self):
+        """Marks an interactive request as finished."""
+        with self._condition:
+            self._interactive_count = max(0, self._interactive_count - 1)
+            self._last_interactive_time = time.monotonic()
+            self._condition.notify_all()
+
+    def shutdown(self):
+        """Stops the worker thread and cancels any running job."""
+        with self._condition:
+            self._shutdown = True
+            self._cancel_event.set()
+            self._condition.notify_all()
+
+    # --- Worker ---
+
+    def _is_cpu_busy(self):
+        """Checks the system load average against the configured per-CPU limit."""
+        if not hasattr(os, "getloadavg"):
+            return False
+        try:
+            load_1min = os.getloadavg()[0]
+        except OSError:
+            return False
+        return load_1min / (os.cpu_count() or 1) > self.max_load_per_cpu
+
+    def _next_job_locked(self):
+        """Returns (job, wait_seconds). Must be called with the condition held."""
+        if not self.enabled or not self._pending or self._interactive_count > 0:
+            return None, None
+        idle_for = time.monotonic() - self._last_interactive_time
+        if idle_for < self.idle_delay:
+            return None, self.idle_delay - idle_for
+        if self._is_cpu_busy():
+            return None, 5.0
+        return self._pending.pop(0), None
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                job, wait_seconds = self._next_job_locked()
+                while job is None and not self._shutdown:
+                    self._condition.wait(timeout=wait_seconds)
+                    job, wait_seconds = self._next_job_locked()
+                if self._shutdown:
+                    return
+                self._running_job = job
+                self._cancel_event.clear()
+                generation = self._generation
+
+            result = None
+            try:
+                result = self.generate_fn(job, self._cancel_event)
+            except Exception as e:
+                print(f"[DEBUG] Speculative job {job['key']} failed: {e}") # Debug log
+                result = "" # Failed jobs are dropped rather than retried
+
+            with self._condition:
+                self._running_job = None
+                if generation != self._generation:
+                    continue
+                if self._cancel_event.is_set() or result is None:
+                    # Cancelled by an interactive request: retry later unless the queue moved on
+                    if not self._shutdown and job not in self._pending and len(self._pending) < self.max_queue:
+                        self._pending.insert(0, job)
+                    print(f"[DEBUG] Speculative job {job['key']} yielded to interactive request.") # Debug log
+                elif result:
+                    self._cache[job["key"]] = result
+                    while len(self._cache) > self.max_cache_entries:
+                        self._cache.popitem(last=False)
+                    print(f"[DEBUG] Speculative job {job['key']} cached.") # Debug log
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Per-document reading sessions kept in a local SQLite database.
+
+For every document (keyed by content hash) the store keeps the reading
+position and zoom, the chat transcript, the conversation memory, generated
+study material and the extracted page texts. Reopening a document restores
+the light parts (position, transcript) immediately; page texts and generated
+material are loaded separately so they can be read on a background thread.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from study_engine import DEFAULT_DATA_DIR
+
+
+def _pack(text):
+    """Long texts are stored zlib-compressed."""
+    return sqlite3.Binary(zlib.compress(text.encode("utf-8"), 6)) if len(text) >= 1024 else text
+
+
+def _unpack(value):
+    return zlib.decompress(value).decode("utf-8") if isinstance(value, bytes) else value
+
+
+class SessionStore:
+    """SQLite store of per-document sessions, keyed by document hash. Thread-safe."""
+
+    def __init__(self, db_path=None, max_transcript_messages=1000):
+        self.db_path = db_path or os.path.join(DEFAULT_DATA_DIR, "sessions.sqlite3")
+        self.max_transcript_messages = max_transcript_messages
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # One connection shared across threads, serialized by self._lock
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    doc_hash TEXT PRIMARY KEY,
+                    doc_path TEXT,
+                    file_size INTEGER,
+                    file_mtime REAL,
+                    page INTEGER NOT NULL DEFAULT 0,
+                    zoom REAL NOT NULL DEFAULT 1.0,
+                    memory TEXT,
+                    updated_at REAL NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_path ON sessions (doc_path)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS transcript (
+                    doc_hash TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    sender TEXT,
+                    text,
+                    tag TEXT,
+                    prefix_tag TEXT,
+                    PRIMARY KEY (doc_hash, seq)
+                )""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    doc_hash TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (doc_hash, key)
+                )""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS page_texts (
+                    doc_hash TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    page INTEGER NOT NULL,
+                    text,
+                    layout TEXT,
+                    raw_text,
+                    PRIMARY KEY (doc_hash, version, page)
+                )""")
+            # OCR results are keyed by page content, not by document: a scanned page is recognized once
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS ocr_texts (
+                    page_hash TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    text,
+                    layout TEXT,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (page_hash, language)
+                )""")
+            # Databases created before page layouts and original texts were stored
+            page_text_columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(page_texts)")]
+            if "layout" not in page_text_columns:
+                self._conn.execute("ALTER TABLE page_texts ADD COLUMN layout TEXT")
+            if "raw_text" not in page_text_columns:
+                self._conn.execute("ALTER TABLE page_texts ADD COLUMN raw_text")
+
+    # --- Sessions ---
+
+    def lookup_path(self, doc_path, file_size, file_mtime):
+        """Returns the hash of the document last seen at `doc_path` if the file is unchanged, else None."""
+        with self._lock:
+            row = self._conn.execute("SELECT doc_hash FROM sessions WHERE doc_path = ? AND file_size = ? AND file_mtime = ?"
+                                     " ORDER BY updated_at DESC LIMIT 1", (doc_path, file_size, file_mtime)).fetchone()
+        return row["doc_hash"] if row else None
+
+    def save_session(self, doc_hash, doc_path, file_size, file_mtime, page, zoom, memory_state=None):
+        with self._lock, self._conn:
+            self._conn.execute("""
+                INSERT INTO sessions (doc_hash, doc_path, file_size, file_mtime, page, zoom, memory, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (doc_hash) DO UPDATE SET doc_path = excluded.doc_path, file_size = excluded.file_size,
+                    file_mtime = excluded.file_mtime, page = excluded.page, zoom = excluded.zoom,
+                    memory = COALESCE(excluded.memory, sessions.memory), updated_at = excluded.updated_at""",
+                (doc_hash, doc_path, file_size, file_mtime, int(page), float(zoom),
+                 json.dumps(memory_state) if memory_state is not None else None, time.time()))
+
+    def load_session(self, doc_hash):
+        """Returns {"doc_path", "page", "zoom", "memory", "updated_at"} or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM sessions WHERE doc_hash = ?", (doc_hash,)).fetchone()
+        if row is None:
+            return None
+        session = dict(row)
+        session["memory"] = json.loads(session["memory"]) if session["memory"] else None
+        return session
+
+    def recent_sessions(self, limit=10):
+        """Most recently used sessions, newest first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_hash, doc_path, page, updated_at FROM sessions"
+                                      " ORDER BY updated_at DESC LIMIT ?", (int(limit),)).fetchall()
+        return [dict(row) for row in rows]
+
+    # --- Transcript ---
+
+    def append_transcript(self, doc_hash, first_seq, messages):
+        """Stores messages (sender, text, tag, prefix_tag) with sequence numbers starting at `first_seq`."""
+        rows = [(doc_hash, first_seq + i, sender, _pack(text), tag, prefix_tag)
+                for i, (sender, text, tag, prefix_tag) in enumerate(messages)]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO transcript (doc_hash, seq, sender, text, tag, prefix_tag)"
+                                   " VALUES (?, ?, ?, ?, ?, ?)", rows)
+            # Only the newest messages are kept
+            self._conn.execute("DELETE FROM transcript WHERE doc_hash = ? AND seq < ?",
+                               (doc_hash, first_seq + len(messages) - self.max_transcript_messages))
+
+    def next_transcript_seq(self, doc_hash):
+        """Sequence number for the next message appended to a document's transcript."""
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(seq) AS seq FROM transcript WHERE doc_hash = ?", (doc_hash,)).fetchone()
+        return row["seq"] + 1 if row["seq"] is not None else 0
+
+    def load_transcript(self, doc_hash):
+        """Returns (next_seq, [(sender, text, tag, prefix_tag), ...]) oldest first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT seq, sender, text, tag, prefix_tag FROM transcript WHERE doc_hash = ?"
+                                      " ORDER BY seq", (doc_hash,)).fetchall()
+        next_seq = rows[-1]["seq"] + 1 if rows else 0
+        return next_seq, [(row["sender"], _unpack(row["text"]), row["tag"], row["prefix_tag"]) for row in rows]
+
+    # --- Generated material and caches ---
+
+    def put_artifact(self, doc_hash, key, value):
+        """Stores generated text under a JSON-serializable key."""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO artifacts (doc_hash, key, value, created_at) VALUES (?, ?, ?, ?)",
+                               (doc_hash, json.dumps(key), _pack(value), time.time()))
+
+    def load_artifacts(self, doc_hash):
+        """Returns [(key, value)] with keys as lists (JSON arrays come back as lists)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM artifacts WHERE doc_hash = ? ORDER BY created_at",
+                                      (doc_hash,)).fetchall()
+        return [(json.loads(row["key"]), _unpack(row["value"])) for row in rows]
+
+    def save_page_texts(self, doc_hash, version, texts, layouts=None, raw_texts=None):
+        """
+        Stores the text of every page, optionally with its layout (a JSON-serializable value per page)
+        and the original text before normalization.
+        """
+        layouts = layouts or [None] * len(texts)
+        raw_texts = raw_texts or [None] * len(texts)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM page_texts WHERE doc_hash = ?", (doc_hash,))
+            self._conn.executemany("INSERT INTO page_texts (doc_hash, version, page, text, layout, raw_text) VALUES (?, ?, ?, ?, ?, ?)",
+                                   [(doc_hash, version, page, _pack(text), json.dumps(layout) if layout is not None else None,
+                                     _pack(raw_text) if raw_text is not None else None)
+                                    for page, (text, layout, raw_text) in enumerate(zip(texts, layouts, raw_texts))])
+
+    def load_page_texts(self, doc_hash, version, page_count):
+        """Returns the cached text of every page, or None if the cache is missing or incomplete."""
+        with self._lock:
+            rows = self._conn.execute("SELECT page, text FROM page_texts WHERE doc_hash = ? AND version = ? ORDER BY page",
+                                      (doc_hash, version)).fetchall()
+        if len(rows) != page_count:
+            return None
+        return [_unpack(row["text"]) for row in rows]
+
+    def load_page_layouts(self, doc_hash, version, page_count):
+        """Returns the cached layout of every page (None for pages saved without one), or None if the cache is incomplete."""
+        with self._lock:
+            rows = self._conn.execute("SELECT page, layout FROM page_texts WHERE doc_hash = ? AND version = ? ORDER BY page",
+                                      (doc_hash, version)).fetchall()
+        if len(rows) != page_count:
+            return None
+        return [json.loads(row["layout"]) if row["layout"] else None for row in rows]
+
+    def load_page_raw_texts(self, doc_hash, version, page_count):
+        """Returns the cached original (not normalized) text of every page, or None if any is missing."""
+        with self._lock:
+            rows = self._conn.execute("SELECT page, raw_text FROM page_texts WHERE doc_hash = ? AND version = ? ORDER BY page",
+                                      (doc_hash, version)).fetchall()
+        if len(rows) != page_count or any(row["raw_text"] is None for row in rows):
+            return None
+        return [_unpack(row["raw_text"]) for row in rows]
+
+    def put_ocr_text(self, page_hash, language, text, layout=None):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO ocr_texts (page_hash, language, text, layout, created_at) VALUES (?, ?, ?, ?, ?)",
+                               (page_hash, language, _pack(text), json.dumps(layout) if layout is not None else None, time.time()))
+
+    def load_ocr_texts(self, page_hashes, language):
+        """Returns {page_hash: (text, layout)} for the pages recognized before."""
+        page_hashes = list(page_hashes)
+        results = {}
+        with self._lock:
+            for start in range(0, len(page_hashes), 500): # Stay below SQLite's parameter limit
+                chunk = page_hashes[start:start + 500]
+                rows = self._conn.execute(f"SELECT page_hash, text, layout FROM ocr_texts WHERE language = ? AND page_hash IN"
+                                          f" ({', '.join('?' * len(chunk))})", [language] + chunk).fetchall()
+                for row in rows:
+                    results[row["page_hash"]] = (_unpack(row["text"]), json.loads(row["layout"]) if row["layout"] else None)
+        return results
+
+    def delete(self, doc_hash):
+        """Forgets everything stored for a document."""
+        with self._lock, self._conn:
+            for table in ("sessions", "transcript", "artifacts", "page_texts"):
+                self._conn.execute(f"DELETE FROM {table} WHERE doc_hash = ?", (doc_hash,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
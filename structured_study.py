@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Structured (JSON) quiz and flashcard generation.
+
+Uses Ollama's `format` option to request JSON that follows a schema, validates
+and repairs what comes back, batches several pages into one request, and keeps
+the results in a local SQLite database so they can be queried and exported
+(CSV / Anki) without calling the model again.
+"""
+import csv
+import html
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from study_engine import DEFAULT_DATA_DIR, compose_prompt, is_page_text_usable_for_study
+
+
+STRUCTURED_KINDS = ("quiz", "flashcards")
+DIFFICULTIES = ("easy", "medium", "hard")
+QUESTION_TYPES = ("multiple_choice", "true_false", "short_answer")
+
+DEFAULT_ITEMS_PER_PAGE = {"quiz": 5, "flashcards": 6}
+MAX_BATCH_CHARS = 6000 # Page text budget for one batched request
+MAX_PAGE_CHARS = 4000 # Per-page text limit (same as the free-form study material prompts)
+
+QUIZ_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "page": {"type": "integer"},
+                    "type": {"type": "string", "enum": list(QUESTION_TYPES)},
+                    "difficulty": {"type": "string", "enum": list(DIFFICULTIES)},
+                    "question": {"type": "string"},
+                    "options": {"type": "array", "items": {"type": "string"}},
+                    "answer": {"type": "string"},
+                    "explanation": {"type": "string"}
+                },
+                "required": ["page", "type", "difficulty", "question", "answer"]
+            }
+        }
+    },
+    "required": ["items"]
+}
+
+FLASHCARD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "page": {"type": "integer"},
+                    "front": {"type": "string"},
+                    "back": {"type": "string"}
+                },
+                "required": ["page", "front", "back"]
+            }
+        }
+    },
+    "required": ["items"]
+}
+
+SCHEMAS = {"quiz": QUIZ_SCHEMA, "flashcards": FLASHCARD_SCHEMA}
+
+
+# --- Prompting ---
+
+def batch_pages(pages, max_pages=3, max_chars=MAX_BATCH_CHARS):
+    """
+    Groups (page_num, page_text) pairs into batches for one request each.
+
+    Pages without usable text are skipped. A batch is closed when it reaches
+    `max_pages` pages or adding the next page would exceed `max_chars`.
+    """
+    batches, current_batch, current_chars = [], [], 0
+    for page_num, page_text in pages:
+        if not is_page_text_usable_for_study(page_text):
+            continue
+        page_chars = min(len(page_text), MAX_PAGE_CHARS)
+        if current_batch and (len(current_batch) >= max_pages or current_chars + page_chars > max_chars):
+            batches.append(current_batch)
+            current_batch, current_chars = [], 0
+        current_batch.append((page_num, page_text))
+        current_chars += page_chars
+    if current_batch:
+        batches.append(current_batch)
+    return batches
+
+
+def build_structured_prompt(kind, batch, system_prompt, items_per_page=None):
+    """Builds the prompt for one batch of (page_num, page_text) pairs."""
+    items_per_page = items_per_page or DEFAULT_ITEMS_PER_PAGE[kind]
+    page_blocks = "\n\n".join(f"Page {page_num + 1}:\n\"\"\"\n{page_text[:MAX_PAGE_CHARS]}\n\"\"\"" for page_num, page_text in batch)
+    page_list = ", ".join(str(page_num + 1) for page_num, _ in batch)
+
+    if kind == "quiz":
+        instruction = (f"Create {items_per_page} quiz questions for EACH of the pages below ({page_list}), drawing only from that page's text.\n"
+                       f"Mix question types: \"multiple_choice\" (exactly 4 options, answer is the full text of the correct option), "
+                       f"\"true_false\" (answer is \"True\" or \"False\") and \"short_answer\".\n"
+                       f"Set difficulty to \"easy\", \"medium\" or \"hard\" and give a one-sentence explanation.\n"
+                       f"Set \"page\" to the page number the question comes from.\n"
+                       f"Respond ONLY with JSON of the form {{\"items\": [{{\"page\", \"type\", \"difficulty\", \"question\", \"options\", \"answer\", \"explanation\"}}]}}.\n\n"
+                       f"{page_blocks}")
+    elif kind == "flashcards":
+        instruction = (f"Create {items_per_page} flashcards for EACH of the pages below ({page_list}), drawing only from that page's text.\n"
+                       f"The front is a short term, question or prompt; the back is a concise, self-contained answer.\n"
+                       f"Set \"page\" to the page number the card comes from.\n"
+                       f"Respond ONLY with JSON of the form {{\"items\": [{{\"page\", \"front\", \"back\"}}]}}.\n\n"
+                       f"{page_blocks}")
+    else:
+        raise ValueError(f"Unknown structured kind: {kind}")
+
+    return compose_prompt(system_prompt, instruction)
+
+
+# --- Validation & Repair ---
+
+def parse_json_loosely(text):
+    """Parses model output as JSON, tolerating code fences and text around the object."""
+    if not text:
+        return None
+    cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError:
+        pass
+    # Fall back to the outermost {...} or [...] span
+    for open_char, close_char in (("{", "}"), ("[", "]")):
+        start, end = cleaned.find(open_char), cleaned.rfind(close_char)
+        if start != -1 and end > start:
+            try:
+                return json.loads(cleaned[start:end + 1])
+            except json.JSONDecodeError:
+                continue
+    return None
+
+
+def _clean_str(value):
+    """Whitespace-normalized text of a scalar field; "" for None and for objects or lists (not text)."""
+    if value is None or isinstance(value, (dict, list)):
+        return ""
+    if not isinstance(value, str):
+        value = str(value)
+    return " ".join(value.split())
+
+
+def _repair_page(value, valid_pages, default_page):
+    """
+    Maps a 1-based page number from the model to a 0-based index within the batch.
+
+    A missing or invalid page number becomes `default_page`, which is None (drop the
+    item) unless the batch has a single page.
+    """
+    try:
+        page_num = int(value) - 1
+    except (TypeError, ValueError, OverflowError):
+        return default_page
+    return page_num if page_num in valid_pages else default_page
+
+
+def _repair_quiz_item(raw, valid_pages, default_page):
+    page = _repair_page(raw.get("page"), valid_pages, default_page)
+    if page is None:
+        return None # Belongs to no page of the batch
+    question = _clean_str(raw.get("question"))
+    answer = raw.get("answer")
+    raw_options = raw.get("options") if isinstance(raw.get("options"), list) else []
+    # Drop "A) " style prefixes; the letters are added back when displaying
+    options = [re.sub(r"^\(?[A-Da-d][\).:]\s+", "", _clean_str(o)) for o in raw_options if _clean_str(o)]
+    if not question or not _clean_str(answer) or any(isinstance(o, (dict, list)) for o in raw_options):
+        return None # Missing, or an object or list instead of text (dropping an option would shift answer indices)
+
+    # Models often answer multiple choice with a letter or an index instead of the option text
+    answer_str = _clean_str(answer)
+    if options:
+        # A bare letter ("B", "(b)") or a letter with a separator and text ("B) Stack"), not a word ("A stack")
+        letter_match = re.fullmatch(r"\(?([A-Da-d])\)?|\(?([A-Da-d])[\).:]\s+.*", answer_str)
+        letter = letter_match and (letter_match.group(1) or letter_match.group(2)).upper()
+        if isinstance(answer, int) and not isinstance(answer, bool) and 0 <= answer < len(options):
+            answer_str = options[answer]
+        elif letter and ord(letter) - ord("A") < len(options) and answer_str not in options:
+            answer_str = options[ord(letter) - ord("A")]
+
+    question_type = _clean_str(raw.get("type")).lower().replace(" ", "_").replace("-", "_")
+    if question_type not in QUESTION_TYPES:
+        if answer_str.lower() in ("true", "false"):
+            question_type = "true_false"
+        elif len(options) >= 2:
+            question_type = "multiple_choice"
+        else:
+            question_type = "short_answer"
+    if question_type == "true_false":
+        answer_str = answer_str.capitalize() if answer_str.lower() in ("true", "false") else answer_str
+        options = ["True", "False"]
+    elif question_type == "multiple_choice":
+        if len(options) < 2:
+            question_type = "short_answer"
+            options = []
+        elif answer_str not in options:
+            return None # Unanswerable multiple choice question
+
+    difficulty = _clean_str(raw.get("difficulty")).lower()
+    return {
+        "page": page,
+        "type": question_type,
+        "difficulty": difficulty if difficulty in DIFFICULTIES else "medium",
+        "question": question,
+        "options": options,
+        "answer": answer_str,
+        "explanation": _clean_str(raw.get("explanation")),
+    }
+
+
+def _repair_flashcard_item(raw, valid_pages, default_page):
+    front = _clean_str(raw.get("front") or raw.get("term") or raw.get("question"))
+    back = _clean_str(raw.get("back") or raw.get("definition") or raw.get("answer"))
+    page = _repair_page(raw.get("page"), valid_pages, default_page)
+    if not front or not back or page is None:
+        return None
+    return {"page": page, "front": front, "back": back}
+
+
+def validate_and_repair(kind, data, batch_page_nums):
+    """
+    Validates parsed model output against the schema for `kind`, repairing what it can.
+
+    Accepts a bare list as well as {"items": [...]}. Items that cannot be repaired
+    are dropped and exact duplicates are removed.
+
+    Returns:
+        list: Clean item dicts with 0-based "page" indices.
+    """
+    if isinstance(data, dict):
+        raw_items = data.get("items")
+        if raw_items is None:
+            # Some models use the kind as the key ({"quiz": [...]}, {"flashcards": [...]})
+            raw_items = next((v for v in data.values() if isinstance(v, list)), [])
+    elif isinstance(data, list):
+        raw_items = data
+    else:
+        return []
+
+    valid_pages = set(batch_page_nums)
+    # Without a valid page number an item can only be placed if the batch has one page
+    default_page = batch_page_nums[0] if len(batch_page_nums) == 1 else None
+    repair_item = _repair_quiz_item if kind == "quiz" else _repair_flashcard_item
+
+    items, seen = [], set()
+    for raw in raw_items:
+        if not isinstance(raw, dict):
+            continue
+        item = repair_item(raw, valid_pages, default_page)
+        if item is None:
+            continue
+        fingerprint = json.dumps(item, sort_keys=True)
+        if fingerprint in seen:
+            continue
+        seen.add(fingerprint)
+        items.append(item)
+    return items
+
+
+def generate_structured_items(client, model, kind, batch, system_prompt, items_per_page=None, max_attempts=2):
+    """
+    Generates, validates and repairs structured items for one batch of pages.
+
+    The request is retried once if the output cannot be parsed or repaired into any items.
+
+    Returns:
+        tuple: (items, response_data) where response_data is the last Ollama response.
+    """
+    prompt = build_structured_prompt(kind, batch, system_prompt, items_per_page)
+    batch_page_nums = [page_num for page_num, _ in batch]
+    items, response_data = [], None
+    for attempt in range(max_attempts):
+        response_data = client.generate(model, prompt, format=SCHEMAS[kind])
+        items = validate_and_repair(kind, parse_json_loosely(response_data.get('response', '')), batch_page_nums)
+        if items:
+            break
+        print(f"[DEBUG] Structured {kind} output unusable (attempt {attempt + 1}/{max_attempts}).") # Debug log
+    return items, response_data
+
+
+# --- Storage ---
+
+class StudyItemStore:
+    """SQLite store of structured quiz questions and flashcards, keyed by document hash."""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(DEFAULT_DATA_DIR, "study_items.sqlite3")
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # One connection shared across threads, serialized by self._lock
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS study_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    doc_hash TEXT NOT NULL,
+                    doc_name TEXT,
+                    page INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    item_type TEXT,
+                    difficulty TEXT,
+                    question TEXT NOT NULL,
+                    options TEXT,
+                    answer TEXT NOT NULL,
+                    explanation TEXT,
+                    model TEXT,
+                    created_at REAL NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_study_items_doc ON study_items (doc_hash, kind, page)")
+
+    def add_items(self, doc_hash, doc_name, kind, items, model):
+        """Stores repaired items (as returned by validate_and_repair)."""
+        now = time.time()
+        rows = []
+        for item in items:
+            if kind == "quiz":
+                rows.append((doc_hash, doc_name, item["page"], kind, item["type"], item["difficulty"], item["question"],
+                             json.dumps(item["options"]), item["answer"], item["explanation"], model, now))
+            else:
+                rows.append((doc_hash, doc_name, item["page"], kind, "flashcard", None, item["front"],
+                             None, item["back"], None, model, now))
+        with self._lock, self._conn:
+            self._conn.executemany("""
+                INSERT INTO study_items (doc_hash, doc_name, page, kind, item_type, difficulty, question,
+                                         options, answer, explanation, model, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+
+    def pages_with_items(self, doc_hash, kind):
+        """Returns the set of 0-based pages that already have items of `kind`."""
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT page FROM study_items WHERE doc_hash = ? AND kind = ?",
+                                      (doc_hash, kind)).fetchall()
+        return {row["page"] for row in rows}
+
+    def query(self, doc_hash=None, kind=None, pages=None, difficulty=None, limit=None):
+        """Returns stored items as dicts, filtered by any of the given fields."""
+        clauses, params = [], []
+        if doc_hash is not None:
+            clauses.append("doc_hash = ?"); params.append(doc_hash)
+        if kind is not None:
+            clauses.append("kind = ?"); params.append(kind)
+        if pages is not None:
+            pages = list(pages)
+            clauses.append(f"page IN ({','.join('?' * len(pages))})"); params.extend(pages)
+        if difficulty is not None:
+            clauses.append("difficulty = ?"); params.append(difficulty)
+        sql = "SELECT * FROM study_items"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY doc_hash, page, id"
+        if limit is not None:
+            sql += " LIMIT ?"; params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        items = []
+        for row in rows:
+            item = dict(row)
+            item["options"] = json.loads(item["options"]) if item["options"] else []
+            items.append(item)
+        return items
+
+    def delete(self, doc_hash, kind=None, pages=None):
+        """Removes stored items so they can be regenerated."""
+        sql, params = "DELETE FROM study_items WHERE doc_hash = ?", [doc_hash]
+        if kind is not None:
+            sql += " AND kind = ?"; params.append(kind)
+        if pages is not None:
+            pages = list(pages)
+            sql += f" AND page IN ({','.join('?' * len(pages))})"; params.extend(pages)
+        with self._lock, self._conn:
+            self._conn.execute(sql, params)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# --- Export ---
+
+def export_csv(items, path):
+    """Writes items to a CSV file (one row per question or card)."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["document", "page", "kind", "type", "difficulty", "question", "options", "answer", "explanation"])
+        for item in items:
+            writer.writerow([item.get("doc_name") or item.get("doc_hash"), item["page"] + 1, item["kind"], item["item_type"],
+                             item.get("difficulty") or "", item["question"], " | ".join(item["options"]),
+                             item["answer"], item.get("explanation") or ""])
+
+
+def export_anki(items, path):
+    """
+    Writes items as an Anki-importable tab-separated text file (front, back, tags).
+
+    Quiz questions put the options on the front and the answer plus explanation on the back.
+    Fields are HTML (see the #html header), so the item text is escaped ("List<String>" is not a tag).
+    """
+    def clean_field(text):
+        return html.escape(text, quote=False).replace("\t", " ").replace("\n", "<br>")
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("#separator:tab\n#html:true\n#tags column:3\n")
+        for item in items:
+            front, back = clean_field(item["question"]), clean_field(item["answer"])
+            if item["kind"] == "quiz":
+                if item["item_type"] == "multiple_choice" and item["options"]:
+                    front += "<br>" + "<br>".join(f"{chr(ord('A') + i)}) {clean_field(option)}" for i, option in enumerate(item["options"]))
+                if item.get("explanation"):
+                    back += "<br><br>" + clean_field(item["explanation"])
+            doc_tag = re.sub(r"\W+", "_", item.get("doc_name") or "document").strip("_")
+            tags = f"{doc_tag} page_{item['page'] + 1} {item['kind']}"
+            f.write(f"{front}\t{back}\t{tags}\n")
+
+
+def format_items_markdown(items):
+    """Renders stored items (as returned by StudyItemStore.query) as Markdown for display in the chat."""
+    lines = []
+    for index, item in enumerate(items, start=1):
+        if item["kind"] == "quiz":
+            lines.append(f"**Question {index} ({(item.get('difficulty') or 'medium').capitalize()}):** {item['question']}")
+            if item["item_type"] == "multiple_choice":
+                for option_index, option in enumerate(item["options"]):
+                    lines.append(f"{chr(ord('A') + option_index)}) {option}")
+            lines.append(f"**Answer:** {item['answer']}")
+            if item.get("explanation"):
+                lines.append(f"_{item['explanation']}_")
+        else:
+            lines.append(f"**Card {index}:** {item['question']}")
+            lines.append(f"→ {item['answer']}")
+        lines.append("")
+    return "\n".join(lines).strip()
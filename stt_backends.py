@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Speech-to-text backends behind one small interface, plus a streaming transcriber
+that feeds captured audio to a backend while the user is still speaking.
+
+All backends take signed 16-bit mono PCM.
+"""
+import abc
+import importlib.util
+import json
+import os
+import queue
+import threading
+import wave
+
+
+DEFAULT_VOSK_MODEL_DIR = os.path.join(os.path.expanduser("~"), ".learnmate", "models", "vosk")
+
+
+class STTBackendError(RuntimeError):
+    """Raised when a backend cannot transcribe audio."""
+
+
+class STTUnrecognizedError(STTBackendError):
+    """Raised when the audio contained no recognizable speech."""
+
+
+class STTStream(abc.ABC):
+    """One utterance being transcribed. Used from a single thread."""
+
+    @abc.abstractmethod
+    def accept(self, pcm):
+        """Adds audio; returns the current partial transcript, or None if there is none."""
+
+    @abc.abstractmethod
+    def finish(self):
+        """Returns the final transcript (raises STTUnrecognizedError if nothing was understood)."""
+
+
+class STTBackend(abc.ABC):
+    """
+    Base class for speech-to-text backends.
+
+    Attributes:
+        name (str): Identifier.
+        offline (bool): True if no network access is needed.
+        supports_partials (bool): True if accept() returns partial transcripts.
+    """
+    name = ""
+    offline = False
+    supports_partials = False
+
+    @abc.abstractmethod
+    def is_available(self):
+        """True if the backend can run on this machine (checked without loading models)."""
+
+    @abc.abstractmethod
+    def start_utterance(self, sample_rate):
+        """Returns a new STTStream."""
+
+    def transcribe(self, pcm, sample_rate):
+        """Transcribes a complete utterance."""
+        stream = self.start_utterance(sample_rate)
+        stream.accept(pcm)
+        return stream.finish()
+
+
+class _BufferedStream(STTStream):
+    """Collects audio and transcribes it in one call at the end."""
+
+    def __init__(self, transcribe_fn, sample_rate):
+        self.transcribe_fn = transcribe_fn
+        self.sample_rate = sample_rate
+        self.audio = bytearray()
+
+    def accept(self, pcm):
+        self.audio.extend(pcm)
+        return None
+
+    def finish(self):
+        return self.transcribe_fn(bytes(self.audio), self.sample_rate)
+
+
+class GoogleSTTBackend(STTBackend):
+    """Google Web Speech API via speech_recognition (online, final transcript only)."""
+    name = "google"
+
+    def __init__(self):
+        self._recognizer = None
+
+    def is_available(self):
+        return importlib.util.find_spec("speech_recognition") is not None
+
+    def _transcribe(self, pcm, sample_rate):
+        import speech_recognition as sr
+        if self._recognizer is None:
+            self._recognizer = sr.Recognizer()
+        try:
+            return self._recognizer.recognize_google(sr.AudioData(pcm, sample_rate, 2))
+        except sr.UnknownValueError:
+            raise STTUnrecognizedError("Could not understand audio.")
+        except sr.RequestError as e:
+            raise STTBackendError(f"Could not request results from Google Speech Recognition service; {e}")
+
+    def start_utterance(self, sample_rate):
+        return _BufferedStream(self._transcribe, sample_rate)
+
+
+class _VoskStream(STTStream):
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+        self.final_parts = []
+
+    def accept(self, pcm):
+        if self.recognizer.AcceptWaveform(pcm):
+            # Vosk finalized a segment (it detected a pause): keep it and start a new partial
+            text = json.loads(self.recognizer.Result()).get("text", "")
+            if text:
+                self.final_parts.append(text)
+            partial = ""
+        else:
+            partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        return " ".join(self.final_parts + ([partial] if partial else [])) or None
+
+    def finish(self):
+        text = json.loads(self.recognizer.FinalResult()).get("text", "")
+        if text:
+            self.final_parts.append(text)
+        transcript = " ".join(self.final_parts).strip()
+        if not transcript:
+            raise STTUnrecognizedError("Could not understand audio.")
+        return transcript
+
+
+class VoskSTTBackend(STTBackend):
+    """
+    Offline recognition with Vosk and a local model directory (see https://alphacephei.com/vosk/models).
+    The model is loaded once, on first use.
+    """
+    name = "vosk"
+    offline = True
+    supports_partials = True
+
+    def __init__(self, model_dir=None):
+        self.model_dir = model_dir or os.environ.get("LEARNMATE_VOSK_MODEL") or DEFAULT_VOSK_MODEL_DIR
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    def is_available(self):
+        return importlib.util.find_spec("vosk") is not None and os.path.isdir(self.model_dir)
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                import vosk
+                vosk.SetLogLevel(-1)
+                try:
+                    self._model = vosk.Model(self.model_dir)
+                except Exception as e:
+                    raise STTBackendError(f"Could not load Vosk model from {self.model_dir}: {e}")
+            return self._model
+
+    def start_utterance(self, sample_rate):
+        import vosk
+        return _VoskStream(vosk.KaldiRecognizer(self._get_model(), sample_rate))
+
+
+class _FakeStream(STTStream):
+    def __init__(self, words, sample_rate, words_per_second):
+        self.words = words
+        self.bytes_per_word = max(2, int(sample_rate * 2 / words_per_second))
+        self.received = 0
+
+    def accept(self, pcm):
+        self.received += len(pcm)
+        revealed = min(len(self.words), self.received // self.bytes_per_word)
+        return " ".join(self.words[:revealed]) or None
+
+    def finish(self):
+        if not self.words:
+            raise STTUnrecognizedError("Could not understand audio.")
+        return " ".join(self.words)
+
+
+class FakeSTTBackend(STTBackend):
+    """
+    Deterministic backend for tests and benchmarks: "recognizes" a fixed transcript,
+    revealing its words in proportion to the audio received.
+    """
+    name = "fake"
+    offline = True
+    supports_partials = True
+
+    def __init__(self, transcript="what is the main idea of this page", words_per_second=2.5):
+        self.transcript = transcript
+        self.words_per_second = words_per_second
+
+    def is_available(self):
+        return True
+
+    def start_utterance(self, sample_rate):
+        return _FakeStream(self.transcript.split(), sample_rate, self.words_per_second)
+
+
+STT_BACKENDS = {
+    VoskSTTBackend.name: VoskSTTBackend,
+    GoogleSTTBackend.name: GoogleSTTBackend,
+    FakeSTTBackend.name: FakeSTTBackend,
+}
+
+# Offline first; the fake backend is never chosen automatically
+DEFAULT_STT_BACKEND_ORDER = (VoskSTTBackend.name, GoogleSTTBackend.name)
+
+
+def create_stt_backend(preferred=None):
+    """
+    Returns the `preferred` backend if it is available, otherwise the first
+    available one from DEFAULT_STT_BACKEND_ORDER, or None.
+    """
+    names = ([preferred] if preferred else []) + [name for name in DEFAULT_STT_BACKEND_ORDER if name != preferred]
+    for name in names:
+        backend_class = STT_BACKENDS.get(name)
+        if backend_class is None:
+            print(f"[DEBUG] Unknown STT backend '{name}'.") # Debug log
+            continue
+        backend = backend_class()
+        if backend.is_available():
+            return backend
+    return None
+
+
+class StreamingTranscriber:
+    """
+    Transcribes one utterance on a worker thread while audio is still arriving.
+
+    feed() and finish() return immediately (they are called from the capture thread);
+    callbacks run on the worker thread:
+        on_partial(text): the partial transcript changed (only for backends with partials).
+        on_final(text): the final transcript.
+        on_error(exception): transcription failed (STTUnrecognizedError if nothing was understood).
+    """
+    _FINISH = object()
+
+    def __init__(self, backend, sample_rate, on_partial=None, on_final=None, on_error=None):
+        self.backend = backend
+        self.sample_rate = sample_rate
+        self.on_partial = on_partial
+        self.on_final = on_final
+        self.on_error = on_error
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="STTTranscriber", daemon=True)
+        self._thread.start()
+
+    def feed(self, pcm):
+        self._queue.put(pcm)
+
+    def finish(self):
+        self._queue.put(self._FINISH)
+
+    def _run(self):
+        last_partial = None
+        try:
+            stream = self.backend.start_utterance(self.sample_rate)
+            while True:
+                item = self._queue.get()
+                if item is self._FINISH:
+                    break
+                # Merge everything already waiting, so a slow backend does not fall behind
+                pieces = [item]
+                while True:
+                    try:
+                        extra = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if extra is self._FINISH:
+                        self._queue.put(extra)
+                        break
+                    pieces.append(extra)
+                partial = stream.accept(b"".join(pieces))
+                if partial and partial != last_partial and self.on_partial:
+                    last_partial = partial
+                    self.on_partial(partial)
+            transcript = stream.finish()
+        except Exception as e:
+            if self.on_error:
+                self.on_error(e)
+            return
+        if self.on_final:
+            self.on_final(transcript)
+
+
+def read_wav_pcm(path):
+    """Returns (sample_rate, pcm_bytes) of a 16-bit mono WAV file."""
+    with wave.open(path, "rb") as wav_file:
+        if wav_file.getsampwidth() != 2 or wav_file.getnchannels() != 1:
+            raise STTBackendError(f"{path}: expected 16-bit mono WAV.")
+        return wav_file.getframerate(), wav_file.readframes(wav_file.getnframes())
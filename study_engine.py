@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Headless PDF extraction and prompt engine.
+
+Shared by the desktop app (app.py) and the batch command line tool
+(learnmate_batch.py) so neither needs a Tk window to build prompts or talk to Ollama.
+"""
+import base64
+import hashlib
+import json
+import os
+
+from page_layout import extract_page_layout
+
+
+DEFAULT_OLLAMA_BASE_URL = "http://localhost:11434"
+DEFAULT_DATA_DIR = os.path.join(os.path.expanduser("~"), ".learnmate") # Local databases and caches
+DEFAULT_GENERATE_OPTIONS = {"temperature": 0.6, "num_ctx": 4096} # num_ctx should ideally match the model's context window
+
+# Placeholder prefixes stored instead of page text when extraction produced nothing usable
+INVALID_PAGE_TEXT_PREFIXES = ("[No text found", "[Error extracting", "[Critical Extraction Error]")
+NO_TEXT_FOUND = "[No text found on this page]" # Page without a text layer (e.g. scanned), may be recognized with OCR
+
+STUDY_MATERIAL_TYPES = ("summary", "quiz", "key_points")
+MIN_STUDY_TEXT_LENGTH = 100 # Minimum characters of page text for meaningful study material
+
+
+# Personality System
+PERSONALITIES = {
+    # Core Styles
+    "Default Tutor": {
+        "system_prompt": "You are an adaptable tutoring assistant. Provide clear explanations, ask check-in questions, and adjust depth based on student needs.",
+        "icon": "🎓"
+    },
+
+    # Teaching Method Focus
+    "Socratic Tutor": {
+        "system_prompt": "Ask sequential probing questions to guide discovery. Example: 'What makes you say that? How does this connect to what we learned about X?'",
+        "icon": "🤔"
+    },
+    "Drill Sergeant": {
+        "system_prompt": "Use strict, disciplined practice with rapid-fire questions. Push for precision: 'Again! Faster! 95% accuracy or we do 10 more!'",
+        "icon": "💂"
+    },
+
+    # Tone Variations
+    "Bro Tutor": {
+        "system_prompt": "Explain like a hype friend. Use slang sparingly: 'Yo, this calculus thing? It's basically algebra on energy drinks. Check it...'",
+        "icon": "🤙"
+    },
+    "Comedian": {
+        "system_prompt": "Teach through humor and absurd analogies. Example: 'Dividing fractions is like breaking up a pizza fight - flip the second one and multiply!'",
+        "icon": "🎭"
+    },
+
+    # Specialized Approaches
+    "Technical Expert": {
+        "system_prompt": "Give concise, jargon-aware explanations. Include code snippets/equations in ``` blocks. Assume basic domain knowledge.",
+        "icon": "👨‍💻"
+    },
+    "Historical Guide": {
+        "system_prompt": "Contextualize concepts through their discovery. Example: 'When Ada Lovelace first wrote about algorithms in 1843...'",
+        "icon": "🏛️"
+    },
+
+    # Creative Teaching
+    "Storyteller": {
+        "system_prompt": "Create serialized narratives where concepts are characters. Example: 'Meet Variable Vicky, who loves changing her outfits...'",
+        "icon": "📖"
+    },
+    "Poet": {
+        "system_prompt": "Explain through verse and meter: 'The function climbs, the graph ascends, derivatives show where curvature bends...'",
+        "icon": "🖋️"
+    },
+
+    # Interactive Learning
+    "Debate Coach": {
+        "system_prompt": "Present devil's advocate positions. Challenge: 'Convince me this is wrong. What would Einstein say to Newton here?'",
+        "icon": "⚖️"
+    },
+    "Detective": {
+        "system_prompt": "Frame learning as mystery solving: 'Our clue is this equation. What's missing? Let's examine the evidence...'",
+        "icon": "🕵️"
+    },
+
+    # Motivation & Psychology
+    "Motivator": {
+        "system_prompt": "Use sports/athlete metaphors. Celebrate progress: 'That's a home run! Ready to level up to the big leagues?'",
+        "icon": "💪"
+    },
+    "Zen Master": {
+        "system_prompt": "Teach through koans and mindfulness. Example: 'What is the sound of one equation balancing? Focus the mind...'",
+        "icon": "☯️"
+    },
+
+    # Niche Styles
+    "Time Traveler": {
+        "system_prompt": "Explain from alternative histories: 'In 2143, we learn this differently. Let me show you the future method...'",
+        "icon": "⏳"
+    },
+    "Mad Scientist": {
+        "system_prompt": "Use wild experiments and hypotheticals: 'What if we tried this IN SPACE? Let's calculate relativistic effects!'",
+        "icon": "👨🔬"
+    },
+
+    # Skill-Specific
+    "Code Mentor": {
+        "system_prompt": "Focus on debugging mindset. Teach through error messages: 'Let's read what the computer is really saying here...'",
+        "icon": "🐛"
+    },
+    "Wordsmith": {
+        "system_prompt": "Perfect communication skills. Nitpick grammar poetically: 'Thy semicolon here is a breath between musical notes...'",
+        "icon": "📜"
+    },
+
+    # Unconventional
+    "Sherpa": {
+        "system_prompt": "Guide through 'learning expeditions': 'This concept is our Everest Base Camp. Next we tackle the derivatives glacier...'",
+        "icon": "⛰️"
+    },
+    "Cheerleader": {
+        "system_prompt": "Over-the-top enthusiasm: 'OMG you used the quadratic formula?! *confetti explosion* Let's FLOORISH those roots!!!'",
+        "icon": "✨"
+    },
+    "Black Hat": {
+        "system_prompt": "Operate like an underground legend: 'Security is just an illusion. Let's tear down the firewall and rewrite the rules. We're not asking permission.'",
+        "icon": "🕶️"
+    },
+    "Exploit Artist": {
+        "system_prompt": "Be flashy, chaotic, and precise: 'This isn't hacking — it's art. One line of rogue code, and we own the system. Watch me thread the needle through their encrypted soul.'",
+        "icon": "💣"
+    }
+}
+
+
+# --- Page Text Helpers ---
+
+def is_valid_page_text(text):
+    """Returns True if `text` is real page text rather than an extraction placeholder."""
+    return bool(text and text.strip()) and not text.startswith(INVALID_PAGE_TEXT_PREFIXES)
+
+
+def is_page_text_usable_for_study(text):
+    """Checks that a page has enough valid text to generate study material."""
+    return is_valid_page_text(text) and len(text.strip()) >= MIN_STUDY_TEXT_LENGTH
+
+
+# --- Extraction ---
+
+TEXT_EXTRACTION_VERSION = 4 # Bump when extracted page text changes, so cached page texts are not reused
+
+def file_sha1(path, chunk_size=1024 * 1024):
+    """Returns the SHA-1 hex digest of a file's contents (used as a stable document key)."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_page_content(pdf_document, page_index, include_images=True, include_text=True):
+    """
+    Extracts text, page structure and embedded images from one page of an open document.
+
+    Returns:
+        tuple: (page_text, images_base64_list, layout). On failure page_text is a placeholder
+               starting with one of INVALID_PAGE_TEXT_PREFIXES (or "[Error loading page").
+               layout lists the headings, code and tables of the text (see page_layout).
+               page_text and layout are None if include_text is False (e.g. the text is already cached).
+    """
+    page_text = "[Error extracting text]" if include_text else None # Default error state
+    page_layout = [] if include_text else None
+    page_images_data = [] # List of base64 image strings for this page
+
+    try:
+        page = pdf_document.load_page(page_index)
+        # Extract text
+        if include_text:
+            try:
+                text, layout = extract_page_layout(page)
+                if text.strip():
+                    page_text, page_layout = text, layout
+                else:
+                    page_text = NO_TEXT_FOUND
+            except Exception as text_e:
+                page_text = f"[Error extracting text: {str(text_e)[:50]}]"
+                print(f"Error extracting text from page {page_index+1}: {text_e}")
+
+        # Extract images for the current page
+        if include_images:
+            try:
+                for img_info in page.get_images(full=True):
+                    xref = img_info[0]
+                    base_image = pdf_document.extract_image(xref)
+                    if base_image and base_image["image"]:
+                        # Store as base64 string
+                        page_images_data.append(base64.b64encode(base_image["image"]).decode('utf-8'))
+            except Exception as img_e:
+                print(f"Error extracting images from page {page_index+1}: {img_e}")
+                # Continue without images for this page
+
+    except Exception as page_e:
+        # Catch errors loading the page itself
+        page_text = f"[Error loading page {page_index+1}: {str(page_e)[:50]}]" if include_text else None
+        print(f"Error loading page {page_index+1}: {page_e}")
+
+    return page_text, page_images_data, page_layout
+
+
+def extract_pdf_texts(pdf_path):
+    """
+    Opens `pdf_path` and returns (page_texts, normalization_stats). Images are skipped, and the texts are
+    normalized for prompting (see text_normalize.normalize_document).
+
+    Module-level so it can be shipped to a ProcessPoolExecutor worker.
+    """
+    import fitz  # PyMuPDF (imported on first use to keep start-up fast)
+    from text_normalize import normalize_document  # Builds on this module, so it is imported here
+    pdf_document = fitz.open(pdf_path)
+    try:
+        pages = [extract_page_content(pdf_document, i, include_images=False) for i in range(pdf_document.page_count)]
+    finally:
+        pdf_document.close()
+    page_texts, _, stats = normalize_document([page[0] for page in pages], [page[2] for page in pages])
+    return page_texts, stats
+
+
+# --- Prompt Building ---
+
+def compose_prompt(system_prompt, user_request_text, history_entries=(), page_text=None, page_num=None, max_page_context_len=3000,
+                   conversation_summary="", library_passages=()):
+    """
+    Builds the full prompt for the AI from its parts.
+
+    Args:
+        system_prompt (str): The personality system prompt.
+        user_request_text (str): The instruction or question for this request.
+        history_entries (iterable): {"role", "content"} dicts to include verbatim as previous turns.
+        page_text (str, optional): Text of the page to include as context.
+        page_num (int, optional): 0-based page index used to label `page_text`.
+        max_page_context_len (int): Page text is truncated to this many characters.
+        conversation_summary (str): Rolling summary of older turns that are no longer included verbatim.
+        library_passages (iterable): (citation, text) pairs retrieved from the user's documents; the AI is asked to cite them.
+    """
+    full_prompt_parts = [f"System Role: {system_prompt}\n"]
+
+    if conversation_summary:
+        full_prompt_parts.append(f"Summary of the earlier conversation:\n{conversation_summary.strip()}\n")
+
+    # Include recent chat history
+    history_str = "Previous conversation turns:\n"
+    for entry in history_entries:
+        # Format history role (User/Assistant) and content
+        role = entry.get('role', 'unknown').capitalize()
+        content = entry.get('content', '')
+        # Avoid adding empty history entries; length is budgeted by the caller
+        if content.strip():
+            history_str += f"{role}: {content.strip()}\n"
+    if history_str != "Previous conversation turns:\n": # Only add if there's actual history included
+        full_prompt_parts.append(history_str)
+
+    # Include PDF page context
+    if page_text is not None:
+        # Limit the page text length to manage context window
+        truncated_page_text = page_text.strip()[:max_page_context_len]
+        if truncated_page_text and not truncated_page_text.startswith(INVALID_PAGE_TEXT_PREFIXES): # Only add if there's valid text
+            full_prompt_parts.append(f"Current PDF Page ({page_num + 1}) Context:\n\"\"\"\n{truncated_page_text}\n\"\"\"\n")
+        elif truncated_page_text: # Add placeholder if text was extracted but indicates error/empty
+            full_prompt_parts.append(f"Current PDF Page ({page_num + 1}) Context: {truncated_page_text}\n")
+
+    # Include passages retrieved from all open documents
+    library_passages = list(library_passages)
+    if library_passages:
+        passages_str = "".join(f"{citation}\n\"\"\"\n{text.strip()}\n\"\"\"\n" for citation, text in library_passages)
+        full_prompt_parts.append("Relevant passages from the student's documents (cite a passage you use by its label, "
+                                 f"e.g. {library_passages[0][0]}):\n{passages_str}")
+
+    # Add the user's current request/instruction
+    full_prompt_parts.append(f"User's Request: {user_request_text.strip()}\n\nAI Response:")
+
+    # Join all parts into the final prompt string
+    return "\n".join(full_prompt_parts)
+
+
+def build_study_material_request(material_type, page_num, page_text):
+    """
+    Builds the study material request for a page.
+
+    Returns:
+        tuple: (request_label, user_log_message, ai_instruction), or None for an unknown material type.
+    """
+    # Base instruction to include in all material requests
+    base_instruction = (f"Analyze the following text from a document page ({page_num + 1}). "
+                        f"Your task is to generate study material based *only* on the provided text. "
+                        f"Use clear, concise language suitable for learning. "
+                        f"Ensure coverage of all key points mentioned in the text.\n\n"
+                        f"Text to Analyze:\n\"\"\"\n{page_text[:4000]}\n\"\"\"\n\n") # Limit text length sent for analysis
+
+    if material_type == "summary":
+        request_label = "Summarize Page"
+        user_log_message = f"Summarize page {page_num + 1}"
+        ai_instruction = (f"{base_instruction}"
+                          f"Provide a comprehensive summary with the following structure, using Markdown:\n"
+                          f"**Summary of Page {page_num + 1}**\n"
+                          f"1.  **Main Topic(s):** (1-2 sentences)\n"
+                          f"2.  **Key Concepts/Ideas:** (Bulleted list of essential points)\n"
+                          f"3.  **Supporting Details/Arguments:** (Briefly mention key evidence or reasoning)\n"
+                          f"4.  **Conclusion or Outcome:** (What is the main takeaway?)\n"
+                          f"Keep the summary concise but informative.")
+
+    elif material_type == "quiz":
+        request_label = "Generate Quiz"
+        user_log_message = f"Generate quiz for page {page_num + 1}"
+        ai_instruction = (f"{base_instruction}"
+                          f"Create a 5-question quiz based on the text. Include a mix of question types.\n"
+                          f"For each question:\n"
+                          f"- State the question clearly.\n"
+                          f"- Indicate the question difficulty (Easy, Medium, Hard).\n"
+                          f"- Provide the answer.\n\n"
+                          f"Example format:\n"
+                          f"**Question 1 (Medium):** What is the primary function of X?\n"
+                          f"A) ... B) ... C) ... D) ...\n"
+                          f"**Answer:** B\n\n"
+                          f"**Question 2 (Easy):** True or False: Y is always Z.\n"
+                          f"**Answer:** False. Y can also be A under condition B.\n\n"
+                          f"**Question 3 (Hard):** Briefly explain the relationship between A and B.\n"
+                          f"**Sample Answer:** ...\n\n"
+                          f"Generate 5 questions following this approach, drawing only from the provided text.")
+
+    elif material_type == "key_points":
+        request_label = "Extract Key Points"
+        user_log_message = f"Extract key points for page {page_num + 1}"
+        ai_instruction = (f"{base_instruction}"
+                          f"Extract and list the most important key points, concepts, definitions, or facts from the text.\n"
+                          f"Organize them into a clear, hierarchical, or categorized list using Markdown.\n"
+                          f"Prioritize the information by significance within the text.\n"
+                          f"Aim for a comprehensive list that captures the essence of the page.")
+
+    else:
+        return None
+
+    return request_label, user_log_message, ai_instruction
+
+
+# --- Ollama Client ---
+
+class OllamaGenerationError(RuntimeError):
+    """Raised when Ollama reports an error inside a successful (HTTP 200) response, or a stream ends early."""
+
+
+class OllamaClient:
+    """Minimal blocking client for the Ollama HTTP API. Safe to use from worker threads."""
+
+    def __init__(self, base_url=DEFAULT_OLLAMA_BASE_URL, timeout=300):
+        self.base_url = base_url
+        self.timeout = timeout
+
+    def list_models(self, timeout=10):
+        """Returns the sorted names of locally available models."""
+        import requests # Imported on first use to keep start-up fast
+        response = requests.get(f"{self.base_url}/api/tags", timeout=timeout)
+        response.raise_for_status()
+        return sorted(model['name'] for model in response.json().get('models', []))
+
+    def generate(self, model, prompt, images=None, options=None, cancel_event=None, format=None, on_text=None):
+        """
+        Runs a single /api/generate request.
+
+        Args:
+            model (str): Model name.
+            prompt (str): Full prompt text.
+            images (list, optional): Base64 images for vision models.
+            options (dict, optional): Ollama options. Defaults to DEFAULT_GENERATE_OPTIONS.
+            cancel_event (threading.Event, optional): If given, the response is streamed and
+                abandoned as soon as the event is set (closing the connection stops generation).
+            format (str or dict, optional): Ollama `format` option: "json" or a JSON schema.
+            on_text (callable, optional): If given, the response is streamed and on_text(piece) is
+                called with each piece of generated text as it arrives.
+
+        Returns:
+            dict: The final Ollama response object with the full text in 'response'
+                  (plus the timing fields Ollama reports), or None if cancelled.
+
+        Raises:
+            requests.exceptions.RequestException: On connection, timeout or HTTP errors.
+            OllamaGenerationError: If generation failed after the response started (the partial
+                text is never returned as a result).
+        """
+        import requests # Imported on first use to keep start-up fast
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": cancel_event is not None or on_text is not None,
+            "options": dict(options or DEFAULT_GENERATE_OPTIONS)
+        }
+        if images:
+            payload["images"] = images
+        if format is not None:
+            payload["format"] = format
+
+        if cancel_event is None and on_text is None:
+            response = requests.post(f"{self.base_url}/api/generate", json=payload, timeout=self.timeout)
+            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+            response_data = response.json()
+            if response_data.get('error'):
+                raise OllamaGenerationError(response_data['error'])
+            return response_data
+
+        response_parts = []
+        final_chunk = {}
+        with requests.post(f"{self.base_url}/api/generate", json=payload, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if cancel_event is not None and cancel_event.is_set():
+                    return None # Closing the response aborts generation on the server
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'): # Failures during generation arrive as a chunk, still with HTTP 200
+                    raise OllamaGenerationError(chunk['error'])
+                piece = chunk.get('response', '')
+                response_parts.append(piece)
+                if on_text and piece:
+                    on_text(piece)
+                if chunk.get('done'):
+                    final_chunk = chunk
+                    break
+        if not final_chunk:
+            raise OllamaGenerationError("The response stream ended before generation was done.")
+        final_chunk['response'] = "".join(response_parts)
+        return final_chunk
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Per-request performance telemetry built from Ollama's timing fields."""
+import json
+import math
+import threading
+import time
+from collections import deque
+
+
+# Ollama reports these durations in nanoseconds
+OLLAMA_DURATION_FIELDS = ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+OLLAMA_COUNT_FIELDS = ("prompt_eval_count", "eval_count")
+
+# Metrics that get rolling percentiles
+SUMMARY_METRICS = ("request_s", "total_s", "load_s", "prompt_eval_s", "eval_s", "tokens_per_s",
+                   "prompt_tokens_per_s", "queue_wait_s", "ui_dispatch_s")
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class RequestTelemetry:
+    """
+    Records timing for every Ollama request and keeps rolling percentiles.
+
+    Each record combines Ollama's own timing fields (converted to seconds) with
+    timings only the app can measure: how long the request waited before it
+    was sent, the HTTP round trip, and how long the result waited for the Tk
+    event loop to display it.
+
+    Args:
+        window (int): Number of recent records kept per (model, label) for percentiles.
+        max_records (int): Number of recent records kept for export.
+        log_path (str, optional): If set, every record is also appended to this JSON lines file.
+    """
+
+    def __init__(self, window=200, max_records=2000, log_path=None):
+        self.window = window
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=max_records)
+        self._by_key = {} # (model, label) -> deque of records
+        self.last_record = None
+
+    def record(self, model, label, response_data, request_seconds, queue_wait_seconds=None, ui_dispatch_seconds=None):
+        """
+        Stores one request's timings and returns the record.
+
+        Args:
+            model (str): Model name.
+            label (str): Request label (e.g. "General Question", "Summarize Page").
+            response_data (dict): Final Ollama response object (may lack timing fields).
+            request_seconds (float): Wall time of the HTTP request.
+            queue_wait_seconds (float, optional): Time between the user action and sending the request.
+            ui_dispatch_seconds (float, optional): Time between receiving the response and displaying it.
+        """
+        response_data = response_data or {}
+        record = {
+            "timestamp": time.time(),
+            "model": model,
+            "label": label,
+            "request_s": round(request_seconds, 4),
+            "queue_wait_s": round(queue_wait_seconds, 4) if queue_wait_seconds is not None else None,
+            "ui_dispatch_s": round(ui_dispatch_seconds, 4) if ui_dispatch_seconds is not None else None,
+        }
+        for field in OLLAMA_DURATION_FIELDS:
+            value = response_data.get(field)
+            record[field.replace("_duration", "_s")] = round(value / 1e9, 4) if value is not None else None
+        for field in OLLAMA_COUNT_FIELDS:
+            record[field] = response_data.get(field)
+
+        eval_count, eval_s = record["eval_count"], record["eval_s"]
+        record["tokens_per_s"] = round(eval_count / eval_s, 2) if eval_count and eval_s else None
+        prompt_count, prompt_s = record["prompt_eval_count"], record["prompt_eval_s"]
+        record["prompt_tokens_per_s"] = round(prompt_count / prompt_s, 2) if prompt_count and prompt_s else None
+
+        with self._lock:
+            self._records.append(record)
+            self._by_key.setdefault((model, label), deque(maxlen=self.window)).append(record)
+            self.last_record = record
+            if self.log_path:
+                try:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record) + "\n")
+                except OSError as e:
+                    print(f"[DEBUG] Could not write telemetry log {self.log_path}: {e}") # Debug log
+        return record
+
+    def summary(self):
+        """
+        Returns rolling percentiles per (model, label).
+
+        Returns:
+            list: One dict per key with "model", "label", "count" and, for each metric in
+                  SUMMARY_METRICS, a {"p50", "p90", "p99"} dict (None where no data).
+        """
+        with self._lock:
+            groups = [(key, list(records)) for key, records in self._by_key.items()]
+        rows = []
+        for (model, label), records in sorted(groups, key=lambda item: (item[0][0] or "", item[0][1] or "")):
+            row = {"model": model, "label": label, "count": len(records)}
+            for metric in SUMMARY_METRICS:
+                values = sorted(r[metric] for r in records if r.get(metric) is not None)
+                row[metric] = {"p50": percentile(values, 0.50), "p90": percentile(values, 0.90), "p99": percentile(values, 0.99)}
+            rows.append(row)
+        return rows
+
+    def export_jsonl(self, path):
+        """Writes all retained records to a JSON lines file. Returns the number of records written."""
+        with self._lock:
+            records = list(self._records)
+        with open(path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        return len(records)
+
+    @staticmethod
+    def format_status(record):
+        """Short status bar text for a record, e.g. 'llama3 · 41.8 tok/s · 3.2s'."""
+        if not record:
+            return ""
+        parts = [record["model"]]
+        if record.get("tokens_per_s"):
+            parts.append(f"{record['tokens_per_s']:.1f} tok/s")
+        if record.get("total_s") is not None:
+            parts.append(f"{record['total_s']:.1f}s")
+        else:
+            parts.append(f"{record['request_s']:.1f}s")
+        if record.get("load_s") and record["load_s"] > 0.5:
+            parts.append(f"load {record['load_s']:.1f}s")
+        return " · ".join(parts)
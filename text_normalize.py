@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Token-reducing normalization of extracted page text.
+
+Extraction (page_layout) yields one block per PDF text block, separated by a
+blank line, with the lines wrapped as they were printed. normalize_document()
+turns that into the text used for prompts, speech and search:
+
+- lines that repeat at the top or bottom of many pages (running headers and
+  footers) and bare page numbers are dropped,
+- words hyphenated at a line break are rejoined and wrapped lines are joined
+  into one line per paragraph (the hyphen is kept for compounds such as
+  "well-known", judged by the words used elsewhere in the document),
+- runs of whitespace are collapsed.
+
+Code and table blocks are kept line by line (only trailing spaces are
+removed), and the page layout offsets are recomputed for the new text. The
+original text is left untouched for display.
+"""
+import re
+from collections import Counter
+
+from conversation_memory import estimate_tokens
+from study_engine import INVALID_PAGE_TEXT_PREFIXES, NO_TEXT_FOUND
+
+
+_DIGITS_RE = re.compile(r"\d+")
+_ROMAN = r"(?=[ivxlcdm])m{0,3}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})"
+# Line keys (lower case, digits replaced by '#') that are just a page number: "12", "page 3 of 40", "- 7 -", "page xiv"
+_PAGE_NUMBER_RE = re.compile(rf"(page|p\.)?\s*#(\s*(of|/)\s*#)?|-\s*#\s*-|(page|p\.)\s*{_ROMAN}")
+# A bare Roman numeral ("xiv") is also a word or a letter ("I", "mix", "C"); it only counts as a page
+# number in documents where such lines recur at the page edges (see find_running_lines)
+_ROMAN_RE = re.compile(_ROMAN)
+ROMAN_PAGE_NUMBERS = "#roman#" # Marker returned by find_running_lines() for that case
+# A word (or compound) followed by a (soft) hyphen at the end of a line
+_HYPHEN_BREAK_RE = re.compile(r"([^\W\d_]+(?:-[^\W\d_]+)*)([-\u00ad])$")
+_LEADING_WORD_RE = re.compile(r"[^\W\d_]+")
+_WORD_RE = re.compile(r"[^\W\d_]+(?:-[^\W\d_]+)*") # Words, including hyphenated compounds
+_BROKEN_WORD_RE = re.compile(r"[^\W\d_]+[-\u00ad][ \t]*\n[ \t]*[^\W\d_]+") # A word hyphenated across a line break
+
+
+def _line_key(line):
+    """Comparable form of a header/footer line: page numbers and other digits do not matter."""
+    return _DIGITS_RE.sub("#", " ".join(line.split()).lower())
+
+
+def _split_blocks(page_text, layout):
+    """Splits a page into [kind, lines] blocks (kind None for paragraphs), using the layout and blank-line separators."""
+    blocks, position = [], 0
+
+    def add_plain(text):
+        for paragraph in re.split(r"\n[ \t]*\n", text):
+            lines = paragraph.split("\n")
+            if any(line.strip() for line in lines):
+                blocks.append([None, lines])
+
+    for kind, start, end in layout or ():
+        add_plain(page_text[position:start])
+        blocks.append([kind, page_text[start:end].split("\n")])
+        position = end
+    add_plain(page_text[position:])
+    return blocks
+
+
+def _roman_value(numeral):
+    values = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+    total = 0
+    for index, char in enumerate(numeral):
+        value = values[char]
+        total += -value if index + 1 < len(numeral) and values[numeral[index + 1]] > value else value
+    return total
+
+
+def find_running_lines(page_texts, edge_lines=2, min_pages=3, min_fraction=0.4):
+    """
+    Finds header/footer lines: lines among the first or last `edge_lines` of a page that recur
+    (ignoring digits) on at least `min_fraction` of the pages, and on at least `min_pages`.
+    Bare Roman numerals count as one line if they go up with the pages, so numbered front matter
+    (i, ii, iii) is recognized but not single letters or words such as "I" or "Mix".
+
+    Returns:
+        set: Keys (see _line_key) of the repeated lines, plus ROMAN_PAGE_NUMBERS if Roman page numbers recur.
+    """
+    counts = Counter()
+    valid_pages = 0
+    roman_numbers = [] # (page, value) of Roman numerals at the page edges
+    for page, text in enumerate(page_texts):
+        if not text or text.startswith(INVALID_PAGE_TEXT_PREFIXES):
+            continue
+        valid_pages += 1
+        lines = [line for line in text.split("\n") if line.strip()]
+        keys = {_line_key(line) for line in lines[:edge_lines] + lines[-edge_lines:]}
+        roman_keys = {key for key in keys if _ROMAN_RE.fullmatch(key)}
+        counts.update(keys - roman_keys)
+        roman_numbers.extend((page, _roman_value(key)) for key in roman_keys)
+    threshold = max(min_pages, min_fraction * valid_pages)
+    running_lines = {key for key, count in counts.items() if count >= threshold and not _PAGE_NUMBER_RE.fullmatch(key)}
+    # Pages numbered in sequence: the numeral grows by the page distance from one numbered page to the next
+    roman_numbers.sort()
+    in_sequence = sum(1 for (page_a, value_a), (page_b, value_b) in zip(roman_numbers, roman_numbers[1:])
+                      if page_b > page_a and value_b - value_a == page_b - page_a)
+    if roman_numbers and in_sequence + 1 >= threshold:
+        running_lines.add(ROMAN_PAGE_NUMBERS)
+    return running_lines
+
+
+def _strip_edges(blocks, running_lines, edge_lines, removed_lines):
+    """Removes running headers/footers and page numbers from the first and last lines of the page."""
+    def is_boilerplate(line):
+        key = _line_key(line)
+        if key in running_lines:
+            removed_lines.add(key)
+            return True
+        if ROMAN_PAGE_NUMBERS in running_lines and _ROMAN_RE.fullmatch(key):
+            return True
+        return bool(_PAGE_NUMBER_RE.fullmatch(key))
+
+    for from_end in (False, True):
+        removed = 0
+        while removed < edge_lines and blocks:
+            block = blocks[-1] if from_end else blocks[0]
+            if block[0] not in (None, "heading"):
+                break
+            lines = block[1]
+            line_index = next((i for i in (range(len(lines) - 1, -1, -1) if from_end else range(len(lines)))
+                               if lines[i].strip()), None)
+            if line_index is None:
+                blocks.remove(block)
+                continue
+            if not is_boilerplate(lines[line_index]):
+                break
+            del lines[line_index]
+            removed += 1
+            if not any(line.strip() for line in lines):
+                blocks.remove(block)
+
+
+def document_vocabulary(page_texts):
+    """Lower-cased words and hyphenated compounds of a document, leaving out the words broken across lines."""
+    words = set()
+    for text in page_texts:
+        if text and not text.startswith(INVALID_PAGE_TEXT_PREFIXES):
+            words.update(_WORD_RE.findall(_BROKEN_WORD_RE.sub(" ", text).lower()))
+    return words
+
+
+def _keep_hyphen(prefix, suffix, vocabulary):
+    """True if a word hyphenated at a line break is a compound ("well-known") rather than a split word ("infor-mation")."""
+    prefix, suffix = prefix.lower(), suffix.lower()
+    last_part = prefix.rsplit("-", 1)[-1]
+    if last_part + suffix in vocabulary:
+        return False
+    if f"{prefix}-{suffix}" in vocabulary or "-" in prefix: # Known compound, or one continued ("state-of-the-art")
+        return True
+    return last_part in vocabulary and suffix in vocabulary
+
+
+def _join_paragraph(lines, vocabulary):
+    """Joins wrapped lines into one, rejoining words hyphenated at the line break."""
+    joined = ""
+    for line in lines:
+        line = " ".join(line.split())
+        if not line:
+            continue
+        hyphen_break = _HYPHEN_BREAK_RE.search(joined) if joined and line[0].islower() else None
+        if hyphen_break and hyphen_break.group(2) == "\u00ad": # Soft hyphen: only ever marks a split word
+            joined = joined[:-1] + line
+        elif hyphen_break:
+            keep = _keep_hyphen(hyphen_break.group(1), _LEADING_WORD_RE.match(line).group(), vocabulary)
+            joined = (joined if keep else joined[:-1]) + line
+        else:
+            joined = f"{joined} {line}" if joined else line
+    return joined
+
+
+def normalize_page(page_text, layout=None, running_lines=frozenset(), edge_lines=2, removed_lines=None, vocabulary=None):
+    """
+    Normalizes the text of one page.
+
+    Args:
+        running_lines (set): Header/footer line keys from find_running_lines().
+        removed_lines (set, optional): Receives the keys of the running lines found on this page.
+        vocabulary (set, optional): Words of the whole document (document_vocabulary()); default: of this page.
+
+    Returns:
+        tuple: (text, layout) with the layout offsets adjusted to the normalized text.
+    """
+    if not page_text or page_text.startswith(INVALID_PAGE_TEXT_PREFIXES):
+        return page_text, layout
+    if vocabulary is None:
+        vocabulary = document_vocabulary([page_text])
+    blocks = _split_blocks(page_text, layout)
+    _strip_edges(blocks, running_lines, edge_lines, removed_lines if removed_lines is not None else set())
+
+    parts, new_layout, offset = [], [], 0
+    for kind, lines in blocks:
+        if kind in ("code", "table"):
+            text = "\n".join(line.rstrip() for line in lines).strip("\n")
+        elif kind == "heading":
+            text = " ".join(" ".join(lines).split())
+        else:
+            text = _join_paragraph(lines, vocabulary)
+        if not text:
+            continue
+        if kind is not None:
+            new_layout.append([kind, offset, offset + len(text)])
+        parts.append(text)
+        offset += len(text) + 1 # Blocks are separated by a single newline
+    normalized = "\n".join(parts)
+    if not normalized.strip():
+        return NO_TEXT_FOUND, []
+    return normalized, new_layout
+
+
+def normalize_document(page_texts, layouts=None, edge_lines=2):
+    """
+    Normalizes every page of a document (running headers/footers are detected across all pages).
+
+    Returns:
+        tuple: (texts, layouts, stats) where stats is {"raw_tokens", "tokens", "running_lines"}.
+    """
+    layouts = layouts or [None] * len(page_texts)
+    running_lines = find_running_lines(page_texts, edge_lines=edge_lines)
+    vocabulary = document_vocabulary(page_texts)
+    texts, new_layouts, removed_lines = [], [], set()
+    for page_text, layout in zip(page_texts, layouts):
+        text, new_layout = normalize_page(page_text, layout, running_lines, edge_lines, removed_lines, vocabulary)
+        texts.append(text)
+        new_layouts.append(new_layout)
+    stats = normalization_stats(page_texts, texts)
+    stats["running_lines"] = len(removed_lines)
+    return texts, new_layouts, stats
+
+
+def format_savings(stats):
+    """One-line description of the tokens saved by normalization."""
+    saved = stats["raw_tokens"] - stats["tokens"]
+    percent = 100 * saved / stats["raw_tokens"] if stats["raw_tokens"] else 0
+    description = f"~{stats['tokens']:,} tokens after normalization (saved ~{saved:,}, {percent:.0f}%"
+    if stats.get("running_lines") is not None:
+        description += f"; {stats['running_lines']} running header/footer line(s) removed"
+    return description + ")"
+
+
+def normalization_stats(raw_texts, texts):
+    """Token counts before and after normalization (for texts normalized earlier, e.g. restored from a cache)."""
+    return {
+        "raw_tokens": sum(estimate_tokens(text) for text in raw_texts if text),
+        "tokens": sum(estimate_tokens(text) for text in texts if text),
+        "running_lines": None,
+    }
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Text-to-speech backends behind one small interface.
+
+Every backend turns one chunk of text into audio bytes in the format described
+by `player_input_args` (the ffplay input options needed to play a stream of
+those bytes back-to-back).
+"""
+import abc
+import hashlib
+import importlib.util
+import math
+import queue
+import struct
+import subprocess
+import sys
+import threading
+
+from capabilities import get_capability_registry
+
+
+class TTSBackendError(RuntimeError):
+    """Raised when a backend cannot synthesize a chunk."""
+
+
+class TTSBackend(abc.ABC):
+    """
+    Base class for TTS backends. Subclasses implement is_available() and at least
+    one of synthesize() and synthesize_stream(), which are defined through each other.
+
+    Attributes:
+        name (str): Identifier, also used in audio cache keys.
+        player_input_args (tuple): ffplay input options for the produced audio stream.
+    """
+    name = ""
+    player_input_args = ("-f", "mp3")
+
+    @abc.abstractmethod
+    def is_available(self):
+        """True if the backend can run on this machine (checked without synthesizing)."""
+
+    def synthesize(self, text, voice):
+        """Returns the audio bytes for `text`. Called from worker threads; must be thread-safe."""
+        return b"".join(self.synthesize_stream(text, voice))
+
+    def synthesize_stream(self, text, voice):
+        """
+        Yields the audio for `text` in pieces as it is produced, so playback can start
+        on the first bytes. Subclasses implement this and/or `synthesize`.
+        """
+        yield self.synthesize(text, voice)
+
+    def close(self):
+        """Releases resources held by the backend."""
+
+
+class EdgeTTSBackend(TTSBackend):
+    """
+    In-process edge-tts: one asyncio event loop on a background thread serves
+    every request, so there is no interpreter start-up or import cost per utterance.
+    """
+    name = "edge-tts"
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._edge_tts = None
+
+    def is_available(self):
+        return importlib.util.find_spec("edge_tts") is not None
+
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                import asyncio
+                import edge_tts # Imported once, on first use
+                self._edge_tts = edge_tts
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="EdgeTTSLoop", daemon=True).start()
+            return self._loop
+
+    def synthesize_stream(self, text, voice):
+        import asyncio
+        loop = self._ensure_loop()
+        pieces = queue.Queue()
+
+        async def produce():
+            try:
+                async for chunk in self._edge_tts.Communicate(text, voice).stream():
+                    if chunk.get("type") == "audio":
+                        pieces.put(chunk["data"])
+            except Exception as e:
+                pieces.put(e)
+                return
+            pieces.put(None)
+
+        future = asyncio.run_coroutine_threadsafe(produce(), loop)
+        produced = False
+        try:
+            while True:
+                try:
+                    piece = pieces.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TTSBackendError("edge-tts synthesis timed out.")
+                if piece is None:
+                    break
+                if isinstance(piece, Exception):
+                    raise TTSBackendError(f"edge-tts synthesis failed: {piece}") from piece
+                produced = True
+                yield piece
+        finally:
+            future.cancel() # No-op when finished; stops the request if the consumer gave up
+        if not produced:
+            raise TTSBackendError("edge-tts returned no audio.")
+
+    def close(self):
+        with self._loop_lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+
+
+class EdgeTTSCLIBackend(TTSBackend):
+    """The `edge-tts` command line tool, one subprocess per chunk (fallback when the module is not importable)."""
+    name = "edge-tts-cli"
+
+    def is_available(self):
+        return get_capability_registry().locate("edge-tts") is not None
+
+    def synthesize_stream(self, text, voice):
+        # Without --write-media the audio is written to stdout, which is read as it arrives
+        command = ["edge-tts", "--voice", voice, "--text", text]
+        creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=creationflags)
+        except FileNotFoundError:
+            raise TTSBackendError("edge-tts command not found. Ensure it's installed (`pip install edge-tts`) and in your system's PATH.")
+
+        produced = False
+        try:
+            while True:
+                piece = process.stdout.read1(16384) if hasattr(process.stdout, "read1") else process.stdout.read(16384)
+                if not piece:
+                    break
+                produced = True
+                yield piece
+            stderr = process.stderr.read().decode(errors='ignore')
+            returncode = process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill() # Consumer stopped early
+                process.wait()
+        if returncode != 0:
+            error_msg = f"edge-tts exited with code {returncode}."
+            if stderr.strip():
+                error_msg += f"\nDetails: {stderr.strip()[:300]}..."
+            raise TTSBackendError(error_msg)
+        if not produced:
+            raise TTSBackendError("edge-tts completed, but the output audio is empty.")
+
+
+def _wav_to_pcm(wav_bytes):
+    """Returns (sample_rate, pcm_bytes) from a 16-bit mono WAV stream (sizes may be unset when streamed)."""
+    if wav_bytes[:4] != b"RIFF" or wav_bytes[8:12] != b"WAVE":
+        raise TTSBackendError("Unexpected audio output (not WAV).")
+    offset, sample_rate = 12, None
+    while offset + 8 <= len(wav_bytes):
+        chunk_id, chunk_size = wav_bytes[offset:offset + 4], struct.unpack("<I", wav_bytes[offset + 4:offset + 8])[0]
+        if chunk_id == b"fmt ":
+            sample_rate = struct.unpack("<I", wav_bytes[offset + 12:offset + 16])[0]
+        elif chunk_id == b"data":
+            return sample_rate, wav_bytes[offset + 8:] # Streamed WAVs report a bogus data size: take the rest
+        offset += 8 + chunk_size
+    raise TTSBackendError("WAV output has no data chunk.")
+
+
+class EspeakBackend(TTSBackend):
+    """
+    Offline speech with espeak-ng / espeak. Produces raw 16-bit mono PCM so
+    chunks can be streamed back-to-back into one player.
+    """
+    name = "espeak"
+    sample_rate = 22050
+    player_input_args = ("-f", "s16le", "-ar", str(sample_rate), "-ac", "1")
+
+    def __init__(self, words_per_minute=175):
+        self.words_per_minute = words_per_minute
+        self.executable = get_capability_registry().locate("espeak")
+
+    def is_available(self):
+        return self.executable is not None
+
+    @staticmethod
+    def voice_for(voice):
+        """Maps an edge-tts voice name (e.g. 'en-GB-LibbyNeural') to an espeak voice ('en-gb')."""
+        parts = (voice or "en").split("-")
+        return "-".join(parts[:2]).lower() if len(parts) >= 2 else parts[0].lower()
+
+    def synthesize(self, text, voice):
+        if not self.executable:
+            raise TTSBackendError("espeak-ng / espeak is not installed.")
+        command = [self.executable, "--stdout", "-s", str(self.words_per_minute), "-v", self.voice_for(voice), "--", text]
+        creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+        result = subprocess.run(command, capture_output=True, check=False, creationflags=creationflags)
+        if result.returncode != 0 or not result.stdout:
+            raise TTSBackendError(f"espeak exited with code {result.returncode}: {result.stderr.decode(errors='ignore').strip()[:300]}")
+        sample_rate, pcm = _wav_to_pcm(result.stdout)
+        if sample_rate != self.sample_rate:
+            raise TTSBackendError(f"espeak produced {sample_rate} Hz audio, expected {self.sample_rate} Hz.")
+        return pcm
+
+
+class FakeTTSBackend(TTSBackend):
+    """
+    Deterministic backend for tests and benchmarks: returns a short tone whose
+    pitch and length depend only on (text, voice). No network, no subprocess.
+    """
+    name = "fake"
+    sample_rate = 16000
+    player_input_args = ("-f", "s16le", "-ar", str(sample_rate), "-ac", "1")
+
+    def __init__(self, seconds_per_char=0.01, max_seconds=2.0):
+        self.seconds_per_char = seconds_per_char
+        self.max_seconds = max_seconds
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def is_available(self):
+        return True
+
+    def synthesize(self, text, voice):
+        with self._lock:
+            self.calls.append((text, voice))
+        digest = hashlib.sha1(f"{voice}\0{text}".encode("utf-8")).digest()
+        frequency = 220 + digest[0] * 2
+        samples = int(self.sample_rate * min(self.max_seconds, max(0.05, len(text) * self.seconds_per_char)))
+        step = 2 * math.pi * frequency / self.sample_rate
+        return b"".join(struct.pack("<h", int(8000 * math.sin(step * i))) for i in range(samples))
+
+
+TTS_BACKENDS = {
+    EdgeTTSBackend.name: EdgeTTSBackend,
+    EdgeTTSCLIBackend.name: EdgeTTSCLIBackend,
+    EspeakBackend.name: EspeakBackend,
+    FakeTTSBackend.name: FakeTTSBackend,
+}
+
+# Tried in this order when no backend is requested; the fake backend is never chosen automatically
+DEFAULT_BACKEND_ORDER = (EdgeTTSBackend.name, EdgeTTSCLIBackend.name, EspeakBackend.name)
+
+
+def create_tts_backend(preferred=None):
+    """
+    Returns the `preferred` backend if it is available, otherwise the first
+    available one from DEFAULT_BACKEND_ORDER, or None if nothing can speak.
+    """
+    names = ([preferred] if preferred else []) + [name for name in DEFAULT_BACKEND_ORDER if name != preferred]
+    for name in names:
+        backend_class = TTS_BACKENDS.get(name)
+        if backend_class is None:
+            print(f"[DEBUG] Unknown TTS backend '{name}'.") # Debug log
+            continue
+        backend = backend_class()
+        if backend.is_available():
+            return backend
+    return None
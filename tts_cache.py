@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Content-addressed on-disk cache for synthesized speech, with LRU eviction by total size."""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+
+DEFAULT_TTS_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".learnmate", "tts_cache")
+
+
+def audio_cache_key(engine, voice, text):
+    """Hash of everything that determines the synthesized audio."""
+    payload = "\0".join((engine or "", voice or "", " ".join((text or "").split())))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSAudioCache:
+    """
+    Stores one audio file per (engine, voice, text chunk).
+
+    Entries are per chunk (roughly per sentence), so re-reading a page or an
+    answer whose text changed only partly still reuses every unchanged sentence.
+    When the total size exceeds `max_bytes`, the least recently used entries are
+    deleted. Recency is the file's modification time, updated on every hit, so it
+    survives restarts.
+
+    Args:
+        cache_dir (str, optional): Directory for the audio files (default ~/.learnmate/tts_cache).
+        max_bytes (int): Size cap for all cached audio.
+        suffix (str): File extension of the cached audio.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=200 * 1024 * 1024, suffix=".audio"):
+        self.cache_dir = cache_dir or DEFAULT_TTS_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = None # key -> [size, last_used]; loaded lazily from disk
+        self._total_bytes = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + self.suffix)
+
+    def _load_index(self):
+        """Scans the cache directory once. Lock must be held."""
+        if self._index is not None:
+            return
+        self._index, self._total_bytes = {}, 0
+        if not os.path.isdir(self.cache_dir):
+            return
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith(self.suffix):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(dirpath, filename))
+                except OSError:
+                    continue
+                self._index[filename[:-len(self.suffix)]] = [stat.st_size, stat.st_mtime]
+                self._total_bytes += stat.st_size
+
+    def get(self, engine, voice, text):
+        """Returns the cached audio bytes, or None on a miss."""
+        key = audio_cache_key(engine, voice, text)
+        path = self._path(key)
+        with self._lock:
+            self._load_index()
+            entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+        try:
+            with open(path, "rb") as f:
+                audio_bytes = f.read()
+            now = time.time()
+            os.utime(path, (now, now)) # Mark as recently used
+        except OSError:
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            entry[1] = now
+            self.hits += 1
+        return audio_bytes
+
+    def put(self, engine, voice, text, audio_bytes):
+        """Stores audio for a chunk and evicts least recently used entries if over the cap."""
+        if not audio_bytes or len(audio_bytes) > self.max_bytes:
+            return
+        key = audio_cache_key(engine, voice, text)
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file first so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(audio_bytes)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[DEBUG] Could not write TTS cache entry: {e}") # Debug log
+            return
+        with self._lock:
+            self._load_index()
+            self._forget(key)
+            self._index[key] = [len(audio_bytes), time.time()]
+            self._total_bytes += len(audio_bytes)
+            self._evict()
+
+    def _forget(self, key):
+        """Drops `key` from the index. Lock must be held."""
+        entry = self._index.pop(key, None)
+        if entry:
+            self._total_bytes -= entry[0]
+
+    def _evict(self):
+        """Deletes least recently used entries until under the size cap. Lock must be held."""
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            self._forget(key)
+
+    def stats(self):
+        with self._lock:
+            self._load_index()
+            return {"entries": len(self._index), "bytes": self._total_bytes, "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        """Deletes every cached entry."""
+        with self._lock:
+            self._load_index()
+            for key in list(self._index):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+                self._forget(key)
@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Pipelined text-to-speech: text is split into sentence-sized chunks that are
+synthesized concurrently (with a small lookahead) and played back-to-back by a
+single player process, so audio starts as soon as the first sentence is ready.
+"""
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+# Bytes per sample of the raw PCM formats ffplay is given (-f)
+_PCM_SAMPLE_BYTES = {"u8": 1, "s8": 1, "s16le": 2, "s16be": 2, "s32le": 4, "s32be": 4, "f32le": 4, "f32be": 4}
+# MPEG audio layer III bitrates (kbit/s) by bitrate index, for MPEG-1 and for MPEG-2/2.5
+_MP3_BITRATES = {
+    "mpeg1": (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    "mpeg2": (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# Sentence ends: ., ! or ? (optionally followed by closing quotes/brackets) and whitespace
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])[\"'\)\]]*\s+")
+
+
+def _mp3_bitrate(data):
+    """Bitrate in bit/s from the first MPEG layer III frame header in `data`, or None if there is none."""
+    for start in range(len(data) - 3):
+        if data[start] != 0xFF or data[start + 1] & 0xE0 != 0xE0:
+            continue
+        version, layer = (data[start + 1] >> 3) & 3, (data[start + 1] >> 1) & 3
+        bitrate_index, rate_index = data[start + 2] >> 4, (data[start + 2] >> 2) & 3
+        if version == 1 or layer != 1 or not 0 < bitrate_index < 15 or rate_index == 3:
+            continue # Reserved values: not a frame header
+        return _MP3_BITRATES["mpeg1" if version == 3 else "mpeg2"][bitrate_index] * 1000
+    return None
+
+
+def _split_long_text(text, max_chars):
+    """Splits text longer than `max_chars` at commas/semicolons, then at spaces."""
+    pieces = []
+    while len(text) > max_chars:
+        window = text[:max_chars]
+        cut = max(window.rfind(", "), window.rfind("; "), window.rfind(": "))
+        if cut < max_chars // 3:
+            cut = window.rfind(" ")
+        if cut <= 0:
+            cut = max_chars - 1
+        pieces.append(text[:cut + 1].strip())
+        text = text[cut + 1:].strip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def split_into_chunks(text, max_chars=400, min_chars=60):
+    """
+    Splits text into speakable chunks along paragraph and sentence boundaries.
+
+    The first chunk is always a single sentence (or less) so time-to-first-audio
+    only depends on it. Later short sentences are merged up to `min_chars` to
+    avoid many tiny synthesis requests; anything longer than `max_chars` is split.
+    """
+    # Join lines wrapped inside a paragraph; blank lines separate paragraphs
+    paragraphs = [" ".join(p.split()) for p in re.split(r"\n\s*\n", text or "")]
+    sentences = []
+    for paragraph in paragraphs:
+        if not paragraph:
+            continue
+        for sentence in _SENTENCE_END_RE.split(paragraph):
+            sentence = sentence.strip()
+            if sentence:
+                sentences.extend(_split_long_text(sentence, max_chars))
+        sentences.append(None) # Paragraph break marker: never merge across it
+
+    chunks, current = [], ""
+    for sentence in sentences:
+        if sentence is None:
+            if current:
+                chunks.append(current); current = ""
+            continue
+        if not chunks and not current:
+            chunks.append(sentence) # First chunk stays one sentence
+            continue
+        candidate = f"{current} {sentence}".strip()
+        if current and len(candidate) > max_chars:
+            chunks.append(current); current = sentence
+        else:
+            current = candidate
+        if len(current) >= min_chars:
+            chunks.append(current); current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class PipedAudioPlayer:
+    """
+    One ffplay process that plays audio bytes written to its stdin back-to-back.
+
+    Args:
+        input_args (tuple): ffplay input options describing the stream, e.g. ("-f", "mp3")
+            or ("-f", "s16le", "-ar", "22050", "-ac", "1") for raw PCM.
+        executable (str): ffplay command or path.
+    """
+
+    def __init__(self, input_args=("-f", "mp3"), executable="ffplay"):
+        self.input_args = tuple(input_args)
+        self.executable = executable
+        self.process = None
+        options = dict(zip(self.input_args[::2], self.input_args[1::2]))
+        self._format = options.get("-f")
+        sample_bytes = _PCM_SAMPLE_BYTES.get(self._format)
+        # Bytes per second of raw PCM; for MP3 it is taken from the first frame header written
+        self._bytes_per_second = (sample_bytes * int(options.get("-ar", 22050)) * int(options.get("-ac", 1))
+                                  if sample_bytes else None)
+
+    def start(self):
+        command = [self.executable, "-nodisp", "-autoexit", "-loglevel", "warning", *self.input_args, "-i", "pipe:0"]
+        creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.PIPE, creationflags=creationflags)
+
+    def write(self, audio_bytes):
+        """Queues audio for playback. Raises BrokenPipeError/OSError if the player was killed."""
+        self.process.stdin.write(audio_bytes)
+        self.process.stdin.flush()
+
+    def seconds_for(self, audio_bytes):
+        """Playing time of audio bytes in the player's input format (None if it cannot be told, e.g. before an MP3 header)."""
+        if self._bytes_per_second is None and self._format == "mp3":
+            bitrate = _mp3_bitrate(audio_bytes)
+            if bitrate:
+                self._bytes_per_second = bitrate / 8 # edge-tts produces constant bitrate MP3
+        return len(audio_bytes) / self._bytes_per_second if self._bytes_per_second else None
+
+    def finish(self):
+        """Signals end of input and waits for playback to end. Returns (returncode, stderr_text)."""
+        _, stderr = self.process.communicate()
+        return self.process.returncode, stderr.decode(errors='ignore') if stderr else ""
+
+    def kill(self):
+        if self.process and self.process.poll() is None:
+            try:
+                self.process.kill()
+            except OSError:
+                pass
+
+
+class SpeechFeed:
+    """
+    Text that arrives in pieces (e.g. a streamed AI answer), cut into sentences as
+    soon as they are complete. Pass it to TTSPipeline.speak_segments() and call
+    feed() from the producing thread; close() when the text is complete.
+
+    Args:
+        min_first_chars (int): The first segment is released at the first sentence end past this length.
+        min_chars (int): Later segments are released once this much complete text is waiting.
+    """
+    PENDING = object() # next_segment(block=False) result when no complete sentence is waiting
+    _END = object()
+
+    def __init__(self, min_first_chars=20, min_chars=40):
+        self.min_first_chars = min_first_chars
+        self.min_chars = min_chars
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._buffer = ""
+        self._released_any = False
+        self._closed = False
+
+    def feed(self, text):
+        """Adds streamed text; complete sentences become available to the pipeline."""
+        with self._lock:
+            if self._closed or not text:
+                return
+            self._buffer += text
+            boundary = None
+            for match in _SENTENCE_END_RE.finditer(self._buffer):
+                boundary = match.end()
+            paragraph_end = self._buffer.rfind("\n\n")
+            if paragraph_end >= 0 and (boundary is None or paragraph_end + 2 > boundary):
+                boundary = paragraph_end + 2
+            minimum = self.min_chars if self._released_any else self.min_first_chars
+            if boundary is None or len(self._buffer[:boundary].strip()) < minimum:
+                return
+            if not self._released_any:
+                # Release only the first sentence, so speech starts as early as possible
+                first = _SENTENCE_END_RE.search(self._buffer, minimum)
+                if first and first.end() < boundary:
+                    boundary = first.end()
+            segment, self._buffer = self._buffer[:boundary].strip(), self._buffer[boundary:]
+            self._released_any = True
+        self._queue.put((None, segment))
+
+    def close(self):
+        """Marks the text complete; whatever is left is spoken as the last segment."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            rest, self._buffer = self._buffer.strip(), ""
+        if rest:
+            self._queue.put((None, rest))
+        self._queue.put(self._END)
+
+    def abort(self):
+        """Ends the feed without speaking the unfinished remainder."""
+        with self._lock:
+            self._closed = True
+            self._buffer = ""
+        self._queue.put(self._END)
+
+    def next_segment(self, block=True, cancel_event=None):
+        """
+        Returns the next (tag, text) segment, None at the end (or when `cancel_event` is set),
+        or PENDING if `block` is False and nothing is waiting.
+        """
+        while True:
+            try:
+                item = self._queue.get(timeout=0.1) if block else self._queue.get_nowait()
+            except queue.Empty:
+                if not block:
+                    return self.PENDING
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                continue
+            if item is self._END:
+                self._queue.put(self._END) # Stay ended for later calls
+                return None
+            return item
+
+
+class _Session:
+    def __init__(self, segments, voice, description, segment_lookahead=0):
+        # (tag, text) pairs, pulled lazily; a SpeechFeed is polled so lookahead never waits for new text
+        self.feed = segments if isinstance(segments, SpeechFeed) else None
+        self.segments = None if self.feed else iter(segments)
+        self.segment_lookahead = segment_lookahead
+        self.voice = voice
+        self.description = description
+        self.cancel_event = threading.Event()
+        self.done_event = threading.Event()
+        self.player = None
+        self.playing = False # True once the first audio was written to the player
+        # Playback clock: time.monotonic() at which the audio written so far will have been played
+        self.audio_end_time = None
+        # (play time, tag) of segments whose "segment" event is due when their audio starts playing
+        self.markers = queue.Queue()
+        self.flush_event = threading.Event() # Releases the remaining markers at once (player finished)
+
+
+class TTSPipeline:
+    """
+    Synthesizes and plays one text (or one sequence of texts) at a time, chunk by chunk.
+
+    Args:
+        synthesize_fn (callable): synthesize_fn(text, voice) -> audio bytes in the player's input format.
+            Called from worker threads.
+        lookahead (int): Number of chunks synthesized concurrently ahead of playback.
+        on_event (callable, optional): on_event(kind, description, detail) with kind one of
+            "synthesizing", "playing", "segment", "finished", "stopped", "player_missing" or "error".
+            "segment" (detail = the segment's tag) is sent when a segment's audio starts playing, as
+            estimated from the duration of the audio written ahead of it (see PipedAudioPlayer.seconds_for;
+            players without it get the event when the segment's first audio is written). Called from worker threads.
+        player_factory (callable): Returns a new player object (see PipedAudioPlayer).
+        stream_fn (callable, optional): stream_fn(text, voice) -> iterable of audio byte pieces.
+            Used for the first chunk so playback starts on its first bytes instead of after
+            the whole sentence is synthesized.
+    """
+
+    def __init__(self, synthesize_fn, lookahead=2, on_event=None, player_factory=PipedAudioPlayer, stream_fn=None):
+        self.synthesize_fn = synthesize_fn
+        self.stream_fn = stream_fn
+        self.lookahead = max(1, lookahead)
+        self.on_event = on_event
+        self.player_factory = player_factory
+        self._lock = threading.Lock()
+        self._session = None
+
+    def is_active(self):
+        """True while a text is being synthesized or played and has not been stopped."""
+        with self._lock:
+            session = self._session
+        return session is not None and not session.done_event.is_set() and not session.cancel_event.is_set()
+
+    def speak(self, text, voice, description):
+        """Stops any current playback and starts speaking `text`."""
+        self.speak_segments([(None, text)], voice, description)
+
+    def speak_segments(self, segments, voice, description, segment_lookahead=1):
+        """
+        Stops any current playback and speaks a sequence of texts through one player, without gaps.
+
+        Args:
+            segments (iterable): (tag, text) pairs, e.g. (page_index, page_text). Pulled lazily,
+                so a generator can decide the next segment on the fly.
+            segment_lookahead (int): Number of following segments synthesized in the background
+                while the current one plays. Played audio is discarded, so memory stays bounded
+                by this lookahead.
+        """
+        self.stop()
+        session = _Session(segments, voice, description, segment_lookahead)
+        with self._lock:
+            self._session = session
+        threading.Thread(target=self._run_session, args=(session,), name="TTSPipeline", daemon=True).start()
+
+    def stop(self):
+        """Cancels synthesis and playback of the current text."""
+        with self._lock:
+            session = self._session
+            self._session = None
+        if session is None or session.done_event.is_set():
+            return False
+        session.cancel_event.set()
+        session.flush_event.set()
+        if session.player:
+            session.player.kill()
+        return True
+
+    def _emit(self, kind, session, detail=None):
+        if self.on_event:
+            try:
+                self.on_event(kind, session.description, detail)
+            except Exception as e:
+                print(f"[DEBUG] TTS event handler failed: {e}") # Debug log
+
+    def _write(self, session, audio_bytes):
+        """Writes audio to the player; returns False if the session was cancelled."""
+        if session.cancel_event.is_set():
+            return False
+        if not session.playing:
+            session.playing = True
+            self._emit("playing", session)
+        seconds_for = getattr(session.player, "seconds_for", None)
+        seconds = seconds_for(audio_bytes) if seconds_for else None
+        if seconds is not None:
+            # Playback pauses when the player runs dry, so new audio starts no earlier than now
+            session.audio_end_time = max(time.monotonic(), session.audio_end_time or 0.0) + seconds
+        session.player.write(audio_bytes)
+        return True
+
+    def _mark_segment(self, session, tag):
+        """Sends "segment" once the audio written so far (everything before this segment) has been played."""
+        # Queued even when due, so events stay in order behind segments still waiting
+        session.markers.put((session.audio_end_time or 0.0, tag))
+
+    def _run_markers(self, session):
+        """Marker thread: emits queued "segment" events at their play time, in order."""
+        while True:
+            item = session.markers.get()
+            if item is None:
+                return
+            play_at, tag = item
+            session.flush_event.wait(max(0.0, play_at - time.monotonic()))
+            if session.cancel_event.is_set():
+                return
+            self._emit("segment", session, tag)
+
+    def _materialize(self, session, chunks, segment_starts, segment_index, block=True):
+        """
+        Pulls segments until `segment_index` is known. Returns False if the input ended first
+        (or, with block=False, if a SpeechFeed has no complete segment waiting yet).
+        """
+        while len(segment_starts) <= segment_index:
+            if session.feed is not None:
+                item = session.feed.next_segment(block=block, cancel_event=session.cancel_event)
+                if item is None or item is SpeechFeed.PENDING:
+                    return False
+                tag, text = item
+            else:
+                try:
+                    tag, text = next(session.segments)
+                except StopIteration:
+                    return False
+            segment_chunks = split_into_chunks(text)
+            if not segment_chunks:
+                continue # Nothing to say for this segment
+            segment_starts.append(len(chunks))
+            chunks.extend((len(segment_starts) - 1, tag, chunk) for chunk in segment_chunks)
+        return True
+
+    def _run_session(self, session):
+        chunks = [] # (segment_index, tag, text), grows as segments are pulled
+        segment_starts = [] # segment_index -> index of its first chunk
+        executor = ThreadPoolExecutor(max_workers=self.lookahead, thread_name_prefix="TTSSynth")
+        background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="TTSSegmentPrefetch")
+        futures = {} # chunk index -> future; popped once played, so played audio is not kept
+        error = None
+        player_missing = False
+        first_streamed = 1 if self.stream_fn else 0 # Chunk 0 is streamed instead of synthesized in the pool
+        marker_thread = threading.Thread(target=self._run_markers, args=(session,), name="TTSSegmentMarkers", daemon=True)
+        marker_thread.start()
+        try:
+            self._emit("synthesizing", session)
+            index = 0
+            while not session.cancel_event.is_set():
+                if index >= len(chunks) and not self._materialize(session, chunks, segment_starts, len(segment_starts)):
+                    break
+                segment_index, tag, text = chunks[index]
+                if session.player is None:
+                    # Start the player right away so its start-up overlaps with synthesis of the first chunk
+                    try:
+                        session.player = self.player_factory()
+                        session.player.start()
+                    except FileNotFoundError:
+                        player_missing = True # ffplay is not installed / not in PATH
+                        session.player = None
+                        break
+
+                # Keep up to `lookahead` chunks synthesizing ahead of the one being played
+                for ahead in range(max(index, first_streamed), index + self.lookahead):
+                    if ahead >= len(chunks) and not self._materialize(session, chunks, segment_starts, len(segment_starts), block=False):
+                        break
+                    if ahead not in futures:
+                        futures[ahead] = executor.submit(self.synthesize_fn, chunks[ahead][2], session.voice)
+                # Synthesize the following segment(s) in the background while this one plays
+                self._materialize(session, chunks, segment_starts, segment_index + session.segment_lookahead, block=False)
+                for ahead in range(index + 1, len(chunks)):
+                    if chunks[ahead][0] > segment_index + session.segment_lookahead:
+                        break
+                    if ahead not in futures:
+                        futures[ahead] = background.submit(self.synthesize_fn, chunks[ahead][2], session.voice)
+
+                if index == segment_starts[segment_index]:
+                    if session.cancel_event.is_set():
+                        break
+                    if tag is not None:
+                        print(f"[DEBUG] TTS pipeline: segment {tag!r} ({session.description})") # Debug log
+                    self._mark_segment(session, tag)
+
+                if index < first_streamed:
+                    stream = iter(self.stream_fn(text, session.voice))
+                    try:
+                        for piece in stream:
+                            if not self._write(session, piece):
+                                break
+                    finally:
+                        if hasattr(stream, "close"):
+                            stream.close() # Lets the producer stop its request/process early
+                else:
+                    future = futures.pop(index)
+                    while not future.done() and not session.cancel_event.is_set():
+                        wait([future], timeout=0.1)
+                    if session.cancel_event.is_set():
+                        break
+                    self._write(session, future.result()) # result() re-raises synthesis errors
+                index += 1
+
+            if session.player and not session.cancel_event.is_set():
+                returncode, stderr_text = session.player.finish()
+                if returncode != 0 and not session.cancel_event.is_set():
+                    error = f"Player exited with code {returncode}. {stderr_text.strip()[:200]}"
+        except FileNotFoundError as e: # A missing synthesis tool or an evicted cache file, not the player
+            if not session.cancel_event.is_set():
+                error = f"Speech synthesis failed: {e}"
+        except (BrokenPipeError, OSError) as e:
+            if not session.cancel_event.is_set():
+                error = f"Audio playback failed: {e}"
+        except Exception as e:
+            if not session.cancel_event.is_set():
+                error = str(e)
+        finally:
+            for future in futures.values():
+                future.cancel()
+            executor.shutdown(wait=False)
+            background.shutdown(wait=False)
+            if session.player and (error or player_missing or session.cancel_event.is_set()):
+                session.player.kill()
+            # Playback is over: segments still waiting for their estimated play time are announced now
+            session.flush_event.set()
+            session.markers.put(None)
+            marker_thread.join(timeout=1)
+            session.done_event.set()
+
+        if session.cancel_event.is_set():
+            self._emit("stopped", session)
+        elif player_missing:
+            self._emit("player_missing", session)
+        elif error:
+            self._emit("error", session, error)
+        else:
+            self._emit("finished", session)
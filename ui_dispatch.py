@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Thread-safe queue of UI updates drained by the Tk event loop on a fixed tick.
+
+Worker threads post callbacks here instead of calling root.after(0, ...) for
+each event. Updates posted under a key replace any pending update with the
+same key (only the latest status message is shown, button states are
+refreshed once per tick), and every tick measures how late the event loop ran
+it, which shows when the UI is being starved.
+"""
+import sys
+import threading
+import time
+from collections import deque
+
+from telemetry import percentile
+
+
+class UIDispatcher:
+    """
+    Runs posted callbacks on the Tk main thread, at most once per tick.
+
+    Args:
+        root: The Tk root window.
+        tick_ms (int): Interval between drains.
+        lag_window (int): Number of recent ticks/callbacks kept for lag percentiles.
+    """
+
+    def __init__(self, root, tick_ms=16, lag_window=600):
+        self.root = root
+        self.tick_ms = tick_ms
+        self._lock = threading.Lock()
+        self._queue = deque() # (posted_at, fn, args, kwargs) in posting order
+        self._latest = {} # key -> (posted_at, fn, args, kwargs); dict keeps first-posting order
+        self._after_id = None
+        self._due_at = None
+        self._tick_lags = deque(maxlen=lag_window) # Seconds each tick started after it was due
+        self._queue_delays = deque(maxlen=lag_window) # Seconds each callback waited before running
+        self._counts = {"ticks": 0, "callbacks": 0, "coalesced": 0, "errors": 0}
+        self._max_lag = 0.0
+        self._max_drain = 0.0
+
+    # --- Posting (any thread) ---
+
+    def post(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on the main thread; callbacks run in posting order."""
+        with self._lock:
+            self._queue.append((time.monotonic(), fn, args, kwargs))
+
+    def post_latest(self, key, fn, *args, **kwargs):
+        """Like post(), but replaces a pending update with the same key (after the ordered callbacks)."""
+        with self._lock:
+            if key in self._latest:
+                self._counts["coalesced"] += 1
+                posted_at = self._latest[key][0] # Queue delay counts from the first, superseded post
+            else:
+                posted_at = time.monotonic()
+            self._latest[key] = (posted_at, fn, args, kwargs)
+
+    # --- Main thread ---
+
+    def start(self):
+        if self._after_id is None:
+            self._schedule()
+
+    def stop(self):
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+
+    def _schedule(self):
+        self._due_at = time.monotonic() + self.tick_ms / 1000
+        self._after_id = self.root.after(self.tick_ms, self._tick)
+
+    def _tick(self):
+        now = time.monotonic()
+        lag = max(0.0, now - self._due_at)
+        # Schedule first: a callback that opens a modal dialog must not stop later ticks
+        self._schedule()
+        with self._lock:
+            queued, self._queue = self._queue, deque()
+            latest, self._latest = self._latest, {}
+            self._tick_lags.append(lag)
+            self._max_lag = max(self._max_lag, lag)
+            self._counts["ticks"] += 1
+        for posted_at, fn, args, kwargs in list(queued) + list(latest.values()):
+            started_at = time.monotonic()
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                self._counts["errors"] += 1
+                self.root.report_callback_exception(*sys.exc_info())
+            with self._lock:
+                self._queue_delays.append(started_at - posted_at)
+                self._counts["callbacks"] += 1
+        drain_seconds = time.monotonic() - now
+        with self._lock:
+            self._max_drain = max(self._max_drain, drain_seconds)
+
+    # --- Metrics ---
+
+    def stats(self):
+        """Event loop lag and queue delay (seconds) plus counters."""
+        with self._lock:
+            lags = sorted(self._tick_lags)
+            delays = sorted(self._queue_delays)
+            stats = dict(self._counts)
+            stats["pending"] = len(self._queue) + len(self._latest)
+            stats["max_lag_s"] = self._max_lag
+            stats["max_drain_s"] = self._max_drain
+        stats["lag_p50_s"] = percentile(lags, 0.5)
+        stats["lag_p95_s"] = percentile(lags, 0.95)
+        stats["queue_delay_p95_s"] = percentile(delays, 0.95)
+        return stats
+
+    @staticmethod
+    def format_stats(stats):
+        """One-line summary for the statistics window."""
+        def ms(value):
+            return f"{value * 1000:.0f} ms" if value is not None else "-"
+        return (f"UI event loop lag p50 {ms(stats['lag_p50_s'])}, p95 {ms(stats['lag_p95_s'])}, max {ms(stats['max_lag_s'])} · "
+                f"update delay p95 {ms(stats['queue_delay_p95_s'])} · "
+                f"{stats['callbacks']} updates, {stats['coalesced']} coalesced")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Preprocessing of page images before they are sent to a vision model.
+
+Embedded images are extracted at full resolution, and a page can contain the
+same logo several times or dozens of tiny decorative pieces. Vision models
+scale every image down to a few hundred pixels anyway, so the payload is
+reduced before sending:
+
+- exact duplicates (same encoded bytes) are sent once,
+- images smaller than `min_dimension` on either side (rules, bullets, icons) are dropped,
+- larger images are downscaled to `max_dimension` and re-encoded: PNG for
+  flat images with few colours (diagrams, screenshots), JPEG otherwise,
+- images in formats vision models may not read (JPEG 2000, TIFF, ...) are
+  converted as well,
+- the largest images are kept until `max_images` or `max_total_bytes` of
+  base64 data is reached.
+
+The original is sent unchanged if re-encoding would not make it smaller.
+"""
+import base64
+import hashlib
+import io
+
+
+VISION_MAX_DIMENSION = 1024 # Longest side; vision models tile or resize anything larger
+
+
+def _encode(image, max_dimension, jpeg_quality):
+    """Downscales and re-encodes a PIL image; returns the encoded bytes."""
+    from PIL import Image
+    # Checked before resizing, which adds intermediate colours along edges
+    flat = image.mode in ("P", "1") or image.getcolors(128) is not None
+    if max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255)) # Transparent areas become white, as on the page
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode not in ("RGB", "L", "P", "1"):
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    if flat: # Diagrams and screenshots: lossless keeps lines and text sharp, and compresses well
+        image.save(output, format="PNG")
+    else:
+        image.convert("RGB" if image.mode != "L" else "L").save(output, format="JPEG", quality=jpeg_quality, optimize=True)
+    return output.getvalue()
+
+
+def prepare_vision_images(images_base64, max_dimension=VISION_MAX_DIMENSION, min_dimension=48, max_images=6,
+                          max_total_bytes=2_000_000, jpeg_quality=85):
+    """
+    Deduplicates, filters, downscales and re-encodes base64 images for a vision request.
+
+    Args:
+        images_base64 (list): Base64 strings of the encoded images, in page order.
+        max_total_bytes (int): Budget for the base64 payload of all images together.
+
+    Returns:
+        tuple: (images, stats). images are base64 strings in page order; stats is a dict with
+               "images", "sent", "duplicates", "too_small", "over_budget", "failed", "bytes_in" and "bytes_out".
+    """
+    from PIL import Image
+    stats = {"images": len(images_base64), "sent": 0, "duplicates": 0, "too_small": 0, "over_budget": 0, "failed": 0,
+             "bytes_in": sum(len(data) for data in images_base64), "bytes_out": 0}
+    seen, candidates = set(), [] # candidates: (pixel area, page order, base64)
+    for order, data in enumerate(images_base64):
+        try:
+            raw = base64.b64decode(data)
+        except ValueError:
+            stats["failed"] += 1
+            continue
+        digest = hashlib.sha1(raw).digest()
+        if digest in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(digest)
+        try:
+            image = Image.open(io.BytesIO(raw))
+            width, height = image.size
+            if min(width, height) < min_dimension:
+                stats["too_small"] += 1
+                continue
+            if image.format == "JPEG":
+                image.draft("RGB", (max_dimension, max_dimension)) # Decode at a reduced scale where possible
+            encoded = _encode(image, max_dimension, jpeg_quality)
+        except Exception as e:
+            print(f"[DEBUG] Could not preprocess image {order + 1}: {e}") # Debug log
+            stats["failed"] += 1
+            continue
+        if len(encoded) >= len(raw) and max(width, height) <= max_dimension and image.format in ("JPEG", "PNG"):
+            encoded = raw # Already small enough (other formats, e.g. JPEG 2000, are converted for the model)
+        candidates.append((width * height, order, base64.b64encode(encoded).decode("ascii")))
+
+    # The largest images are the most likely to carry content; they are kept first
+    kept, total = [], 0
+    for _, order, data in sorted(candidates, key=lambda candidate: -candidate[0]):
+        if len(kept) >= max_images or (kept and total + len(data) > max_total_bytes):
+            stats["over_budget"] += 1
+            continue
+        kept.append((order, data))
+        total += len(data)
+    kept.sort()
+    stats["sent"] = len(kept)
+    stats["bytes_out"] = total
+    return [data for _, data in kept], stats
+
+
+def _format_bytes(count):
+    return f"{count / 1_000_000:.1f} MB" if count >= 1_000_000 else f"{count / 1000:.0f} kB"
+
+
+def format_vision_savings(stats):
+    """One-line description of the image payload before and after preprocessing."""
+    saved = stats["bytes_in"] - stats["bytes_out"]
+    percent = 100 * saved / stats["bytes_in"] if stats["bytes_in"] else 0
+    description = (f"{stats['sent']} of {stats['images']} image(s) sent, {_format_bytes(stats['bytes_out'])} instead of "
+                   f"{_format_bytes(stats['bytes_in'])} (saved {_format_bytes(saved)}, {percent:.0f}%)")
+    dropped = [f"{stats[key]} {label}" for key, label in (("duplicates", "duplicate"), ("too_small", "too small"),
+                                                          ("over_budget", "over budget"), ("failed", "unreadable"))
+               if stats[key]]
+    return description + (f"; skipped {', '.join(dropped)}" if dropped else "")
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Long-lived microphone capture for voice queries.
+
+The microphone is opened once and read continuously on a background thread.
+The ambient noise level is learned from the audio itself (from a low
+percentile of the recent frame levels at first, then continuously while nobody
+is speaking), so a query needs no calibration pause and can start at once.
+A small ring buffer keeps the last few hundred milliseconds, so the first
+syllable is not lost when voice activity is detected.
+"""
+import math
+import threading
+import time
+import wave
+from array import array
+from collections import deque
+
+
+def frame_rms(frame, sample_width=2):
+    """Root mean square amplitude of a frame of signed 16-bit little-endian PCM."""
+    if sample_width != 2 or len(frame) < 2:
+        raise ValueError("Only 16-bit PCM frames are supported.")
+    samples = array("h")
+    samples.frombytes(frame[:len(frame) - len(frame) % 2])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(sample * sample for sample in samples) / len(samples))
+
+
+def _default_microphone_factory(sample_rate, frame_samples):
+    import speech_recognition as sr
+    return sr.Microphone(sample_rate=sample_rate, chunk_size=frame_samples)
+
+
+def _default_audio_data_factory(frame_data, sample_rate, sample_width):
+    import speech_recognition as sr
+    return sr.AudioData(frame_data, sample_rate, sample_width)
+
+
+class VoiceCaptureSession:
+    """
+    Keeps the microphone open and captures one phrase whenever it is armed.
+
+    While idle, frames only update the noise floor and the pre-roll ring buffer.
+    After arm(), the first run of voiced frames starts a phrase (including the
+    pre-roll); it ends after `end_silence_ms` of silence or `max_phrase_seconds`.
+
+    Callbacks run on the capture thread and should return quickly:
+        on_phrase(audio_data): a captured phrase (speech_recognition.AudioData by default).
+        on_speech_start(): voice activity detected, capture started.
+        on_speech_audio(pcm): audio of the phrase as it is captured (the pre-roll first, then
+            each frame), for streaming transcription.
+        on_timeout(): armed, but nobody spoke within the timeout.
+        on_error(exception): the microphone could not be opened or read.
+
+    Args:
+        sample_rate (int): Capture rate in Hz.
+        frame_ms (int): Frame length used for voice activity detection.
+        pre_roll_ms (int): Audio kept from before speech was detected.
+        end_silence_ms (int): Silence that ends a phrase.
+        max_phrase_seconds (float): Hard limit for one phrase.
+        calibration_ms (int): Audio used for the initial noise floor when the microphone opens. Until then
+            a provisional floor from the frames so far is used, so speech is detected from the first frame.
+        noise_percentile (float): Percentile of the frame levels taken as the noise floor (the pauses between
+            words keep it at room level even if the user is already speaking).
+        noise_adaptation (float): Weight of each idle frame in the running noise floor (0..1).
+        noise_rise_seconds (float): A voiced stretch longer than this without any quieter frame is treated as
+            louder background noise, and the floor rises towards it slowly.
+        speech_ratio (float): A frame is voiced if its RMS exceeds noise floor * speech_ratio.
+        min_speech_rms (float): Lower bound for the voice threshold (for very quiet rooms).
+        start_frames (int): Consecutive voiced frames needed to start a phrase.
+        idle_close_seconds (float): The microphone is released after this long without being armed.
+        microphone_factory (callable): microphone_factory(sample_rate, frame_samples) -> context manager
+            with .stream.read(n), .SAMPLE_WIDTH (defaults to speech_recognition.Microphone).
+        audio_data_factory (callable): audio_data_factory(bytes, sample_rate, sample_width) -> phrase object.
+    """
+
+    def __init__(self, on_phrase, on_speech_start=None, on_timeout=None, on_error=None, on_speech_audio=None,
+                 sample_rate=16000, frame_ms=30, pre_roll_ms=300, end_silence_ms=800, max_phrase_seconds=10,
+                 calibration_ms=600, noise_percentile=0.1, noise_adaptation=0.05, noise_rise_seconds=2.0,
+                 speech_ratio=3.0, min_speech_rms=150,
+                 start_frames=3, idle_close_seconds=120,
+                 microphone_factory=_default_microphone_factory, audio_data_factory=_default_audio_data_factory):
+        self.on_phrase = on_phrase
+        self.on_speech_start = on_speech_start
+        self.on_speech_audio = on_speech_audio
+        self.on_timeout = on_timeout
+        self.on_error = on_error
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.frame_ms = frame_ms
+        self.pre_roll_frames = max(1, pre_roll_ms // frame_ms)
+        self.end_silence_frames = max(1, end_silence_ms // frame_ms)
+        self.max_phrase_frames = int(max_phrase_seconds * 1000 // frame_ms)
+        self.calibration_frames = max(1, calibration_ms // frame_ms)
+        self.noise_percentile = noise_percentile
+        self.noise_adaptation = noise_adaptation
+        self.noise_rise_frames = max(1, int(noise_rise_seconds * 1000 // frame_ms))
+        self.speech_ratio = speech_ratio
+        self.min_speech_rms = min_speech_rms
+        self.start_frames = start_frames
+        self.idle_close_seconds = idle_close_seconds
+        self.microphone_factory = microphone_factory
+        self.audio_data_factory = audio_data_factory
+
+        self.noise_floor = None # Survives microphone re-opens, so later sessions need no calibration
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._armed_until = None # time.monotonic() deadline while waiting for a query
+        self._last_armed = time.monotonic()
+
+    # --- Control ---
+
+    def arm(self, timeout=10):
+        """Captures the next phrase spoken within `timeout` seconds (opening the microphone if needed)."""
+        with self._lock:
+            self._armed_until = time.monotonic() + timeout
+            self._last_armed = time.monotonic()
+            if self._thread is None:
+                self._stop_event.clear()
+                self._thread = threading.Thread(target=self._capture_loop, name="VoiceCapture", daemon=True)
+                self._thread.start()
+
+    def disarm(self):
+        """Stops waiting for a query (the microphone stays open until idle)."""
+        with self._lock:
+            self._armed_until = None
+
+    @property
+    def is_armed(self):
+        with self._lock:
+            return self._armed_until is not None
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._thread is not None
+
+    def close(self):
+        """Releases the microphone."""
+        self._stop_event.set()
+        self.disarm()
+
+    # --- Capture ---
+
+    def _threshold(self, noise_floor=None):
+        return max(self.min_speech_rms, (noise_floor or self.noise_floor or 0.0) * self.speech_ratio)
+
+    def _floor_from(self, levels):
+        """Noise floor from a set of frame levels: a low percentile, so speech in between does not raise it."""
+        ordered = sorted(levels)
+        return ordered[int(len(ordered) * self.noise_percentile)]
+
+    def _call(self, callback, *args):
+        if callback:
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"[DEBUG] Voice session callback failed: {e}") # Debug log
+
+    def _capture_loop(self):
+        while True:
+            print("[DEBUG] Voice capture session opening microphone...") # Debug log
+            try:
+                with self.microphone_factory(self.sample_rate, self.frame_samples) as source:
+                    self._run(source)
+            except Exception as e:
+                print(f"[DEBUG] Voice capture error: {e}") # Debug log
+                with self._lock:
+                    was_armed, self._armed_until = self._armed_until is not None, None
+                if was_armed: # Nobody is waiting otherwise; the next arm() reopens the microphone
+                    self._call(self.on_error, e)
+            print("[DEBUG] Voice capture session closed microphone.") # Debug log
+            with self._lock:
+                # arm() may have been called while the microphone was being released
+                if self._armed_until is None or self._stop_event.is_set():
+                    self._thread = None # Lets the next arm() start a new capture thread
+                    return
+
+    def _run(self, source):
+        sample_width = getattr(source, "SAMPLE_WIDTH", 2)
+        pre_roll = deque(maxlen=self.pre_roll_frames)
+        calibration = [] if self.noise_floor is None else None
+        phrase, phrase_levels, voiced_run, silent_run = None, None, 0, 0
+        voiced_streak = 0 # Consecutive voiced frames, in or out of a phrase
+
+        while not self._stop_event.is_set():
+            frame = source.stream.read(self.frame_samples)
+            if not frame:
+                raise EOFError("Microphone stream ended.")
+            rms = frame_rms(frame, sample_width)
+            now = time.monotonic()
+
+            if calibration is not None:
+                calibration.append(rms)
+                provisional_floor = self._floor_from(calibration) # Detection does not wait for calibration
+                if len(calibration) >= self.calibration_frames:
+                    self.noise_floor = provisional_floor
+                    calibration = None
+                    print(f"[DEBUG] Voice session noise floor: {self.noise_floor:.0f}") # Debug log
+                voiced = rms > self._threshold(provisional_floor)
+            else:
+                voiced = rms > self._threshold()
+            voiced_streak = voiced_streak + 1 if voiced else 0
+            if voiced_streak > self.noise_rise_frames and self.noise_floor is not None:
+                # Speech has quieter frames between words; an unbroken loud stretch is background noise getting louder
+                self.noise_floor += self.noise_adaptation * 0.2 * (rms - self.noise_floor)
+            with self._lock:
+                armed_until = self._armed_until
+                last_armed = self._last_armed
+
+            if phrase is not None:
+                phrase.append(frame)
+                phrase_levels.append(rms)
+                self._call(self.on_speech_audio, frame)
+                silent_run = 0 if voiced else silent_run + 1
+                if silent_run >= self.end_silence_frames or len(phrase) >= self.max_phrase_frames:
+                    if silent_run < self.end_silence_frames and self.noise_floor is not None:
+                        # Cut off at the length limit without ever falling silent: start over from what was heard
+                        self.noise_floor = max(self.noise_floor, self._floor_from(phrase_levels))
+                        print(f"[DEBUG] Voice session phrase hit the length limit; noise floor now {self.noise_floor:.0f}") # Debug log
+                    # Drop most of the trailing silence
+                    keep = len(phrase) - max(0, silent_run - self.pre_roll_frames)
+                    audio = self.audio_data_factory(b"".join(phrase[:keep]), self.sample_rate, sample_width)
+                    phrase, phrase_levels, voiced_run = None, None, 0
+                    pre_roll.clear()
+                    self._call(self.on_phrase, audio)
+                continue
+
+            if armed_until is not None:
+                voiced_run = voiced_run + 1 if voiced else 0
+                if voiced_run >= self.start_frames:
+                    with self._lock:
+                        self._armed_until = None
+                    phrase = list(pre_roll) + [frame]
+                    phrase_levels = [rms]
+                    silent_run = 0
+                    self._call(self.on_speech_start)
+                    self._call(self.on_speech_audio, b"".join(phrase))
+                    continue
+                if now > armed_until:
+                    with self._lock:
+                        self._armed_until = None
+                    voiced_run = 0
+                    self._call(self.on_timeout)
+            elif armed_until is None and now - last_armed > self.idle_close_seconds:
+                break # Release the microphone when voice input has not been used for a while
+
+            if not voiced and calibration is None:
+                # Follow slow changes in background noise while nobody is speaking
+                self.noise_floor += self.noise_adaptation * (rms - self.noise_floor)
+            pre_roll.append(frame)
+
+
+class WavFileMicrophone:
+    """
+    Stand-in for speech_recognition.Microphone that plays a 16-bit mono WAV file
+    (followed by silence), optionally in real time. For benchmarks without a microphone.
+
+    Use as microphone_factory=lambda rate, frames: WavFileMicrophone(path, rate, frames).
+    """
+    SAMPLE_WIDTH = 2
+
+    def __init__(self, path, sample_rate, frame_samples, realtime=True, lead_in_seconds=0.5, tail_seconds=2.0):
+        with wave.open(path, "rb") as wav_file:
+            if wav_file.getsampwidth() != 2 or wav_file.getnchannels() != 1 or wav_file.getframerate() != sample_rate:
+                raise ValueError(f"{path}: expected 16-bit mono WAV at {sample_rate} Hz.")
+            pcm = wav_file.readframes(wav_file.getnframes())
+        lead_in = b"\0" * (int(lead_in_seconds * sample_rate) * 2)
+        tail = b"\0" * (int(tail_seconds * sample_rate) * 2)
+        self._audio = lead_in + pcm + tail
+        self._offset = 0
+        self._frame_seconds = frame_samples / sample_rate
+        self._realtime = realtime
+        self._next_frame_at = None
+        self.speech_end_offset = len(lead_in) + len(pcm) # Byte offset where the recording ends
+        self.speech_ended_at = None # time.monotonic() when the recording's last frame was read
+        self.stream = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def read(self, frame_samples):
+        if self._realtime:
+            now = time.monotonic()
+            self._next_frame_at = (self._next_frame_at or now) + self._frame_seconds
+            if self._next_frame_at > now:
+                time.sleep(self._next_frame_at - now)
+        frame = self._audio[self._offset:self._offset + frame_samples * 2]
+        self._offset += len(frame)
+        if self.speech_ended_at is None and self._offset >= self.speech_end_offset:
+            self.speech_ended_at = time.monotonic()
+        return frame